@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+稠密的行情数据仓：symbol × trading-day × field 三维 NumPy 数组，
+配合整数化的代码、日期索引，替代 (s_info_windcode, trade_dt) 多层索引 DataFrame 的逐个 .loc 查询
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .utility import date_str_to_int
+
+
+class BarStore(object):
+    """行情数据仓，values[代码序号, 日期序号, 字段序号]，valid[代码序号, 日期序号] 标记当日是否有有效 bar"""
+
+    def __init__(self,
+                 symbols: Sequence[str] = (),
+                 dates: Sequence[int] = (),
+                 fields: Sequence[str] = (),
+                 values: np.ndarray = None,
+                 valid: np.ndarray = None):
+        self.symbols: List[str] = list(symbols)
+        self.dates: np.ndarray = np.asarray(dates, dtype=np.int64)     # 升序排列的交易日
+        self.fields: List[str] = list(fields)
+
+        if values is None:
+            values = np.full((len(self.symbols), len(self.dates), len(self.fields)), np.nan)
+        self.values: np.ndarray = values
+        if valid is None:
+            valid = ~np.isnan(values).all(axis=2)
+        self.valid: np.ndarray = valid
+
+        self.symbol_index: Dict[str, int] = {s: i for i, s in enumerate(self.symbols)}
+        self.date_index: Dict[int, int] = {d: i for i, d in enumerate(self.dates.tolist())}
+        self.field_index: Dict[str, int] = {f: i for i, f in enumerate(self.fields)}
+
+    @classmethod
+    def from_columns(cls, symbol_col, date_col, field_cols: Dict[str, np.ndarray]):
+        """由逐行排列的代码列、日期列和各字段列构建数据仓"""
+        symbols, symbol_pos = np.unique(np.asarray(symbol_col, dtype=object).astype(str), return_inverse=True)
+        dates, date_pos = np.unique(np.asarray(pd.to_numeric(date_col), dtype=np.int64), return_inverse=True)
+        fields = list(field_cols.keys())
+
+        values = np.full((len(symbols), len(dates), len(fields)), np.nan)
+        for fi, fd in enumerate(fields):
+            values[symbol_pos, date_pos, fi] = np.asarray(field_cols[fd], dtype=np.float64)
+        valid = np.zeros((len(symbols), len(dates)), dtype=bool)
+        valid[symbol_pos, date_pos] = True
+
+        return cls(symbols.tolist(), dates, fields, values, valid)
+
+    @classmethod
+    def from_frame(cls, market_data: pd.DataFrame):
+        """由 (代码, 日期) 两层索引、列为字段的 DataFrame 构建数据仓"""
+        symbol_col = market_data.index.get_level_values(0).values
+        date_col = market_data.index.get_level_values(1).values
+        field_cols = {fd: market_data[fd].values for fd in market_data.columns}
+        return cls.from_columns(symbol_col, date_col, field_cols)
+
+    def mask_invalid(self, field: str = 'volume'):
+        """
+        指定字段不大于 0 的 bar（如成交量为 0 即停牌）视为无效，对应位置的数据置为 NaN
+        values 为只读的内存映射数组（来自缓存）时只更新 valid，取数时都会先判断 valid
+        """
+        fi = self.field_index[field]
+        with np.errstate(invalid='ignore'):
+            self.valid = self.valid & (self.values[:, :, fi] > 0)
+        if self.values.flags.writeable:
+            self.values[~self.valid] = np.nan
+        return self
+
+    def date_range(self, start: int, end: int):
+        """返回 [start, end] 对应的日期序号切片的起止位置"""
+        i0 = int(np.searchsorted(self.dates, start, side='left'))
+        i1 = int(np.searchsorted(self.dates, end, side='right'))
+        return i0, i1
+
+    def value(self, field: str, symbol: str, date: int) -> float:
+        """取单个代码单个字段在某日的值，取不到时返回 NaN"""
+        si = self.symbol_index.get(symbol)
+        di = self.date_index.get(date)
+        if si is None or di is None or not self.valid[si, di]:
+            return np.nan
+        return self.values[si, di, self.field_index[field]]
+
+    def dates_of(self, symbol: str) -> np.ndarray:
+        """某个代码所有有效 bar 的日期"""
+        si = self.symbol_index.get(symbol)
+        if si is None:
+            return self.dates[:0]
+        return self.dates[self.valid[si]]
+
+    def cross_section(self, fields: Sequence[str], symbols: Sequence[str], date: int):
+        """
+        一组代码（可重复）在某日的多个字段，返回 (有效标记 [n], 字段值 [n, len(fields)])
+        代码或日期不存在、当日无有效 bar 的行标记为无效，值为 NaN
+        """
+        si = np.array([self.symbol_index.get(s, -1) for s in symbols], dtype=np.int64)
+        di = self.date_index.get(date, -1)
+        result = np.full((len(si), len(fields)), np.nan)
+        if di < 0 or len(si) == 0:
+            return np.zeros(len(si), dtype=bool), result
+        valid = si >= 0
+        valid[valid] = self.valid[si[valid], di]
+        for ci, fd in enumerate(fields):
+            result[valid, ci] = self._column(self.field_index[fd], si[valid], di)
+        return valid, result
+
+    def panel(self, field: str, symbols: Sequence[str] = None, start: int = 0, end: int = 0):
+        """
+        一个字段的 日期 × 代码 面板，返回 (日期 [m], 字段值 [m, n], 有效标记 [m, n])，供 core.indicator 中的 panel_xxx 函数使用
+        symbols 为 None 时取全部代码，start、end 为 0 时取全部日期；不存在的代码整列无效
+        """
+        if symbols is None:
+            symbols = self.symbols
+        i0, i1 = self.date_range(start, end)
+        if not start:
+            i0 = 0
+        if not end:
+            i1 = len(self.dates)
+        fi = self.field_index[field]
+        values = np.full((i1 - i0, len(symbols)), np.nan)
+        valid = np.zeros((i1 - i0, len(symbols)), dtype=bool)
+        for ci, symbol in enumerate(symbols):
+            si = self.symbol_index.get(symbol)
+            if si is None:
+                continue
+            valid[:, ci] = self.valid[si, i0:i1]
+            values[:, ci] = self._row(fi, si, i0, i1)
+        values[~valid] = np.nan
+        return self.dates[i0:i1], values, valid
+
+    def _column(self, fi: int, si: np.ndarray, di: int) -> np.ndarray:
+        return self.values[si, di, fi]
+
+    def _cell(self, fi: int, si: int, di: int) -> float:
+        return self.values[si, di, fi]
+
+    def _row(self, fi: int, si: int, i0: int, i1: int) -> np.ndarray:
+        return self.values[si, i0:i1, fi]
+
+    def _lookup(self, fi: int, symbol: str, date: int):
+        si = self.symbol_index.get(symbol)
+        di = self.date_index.get(date)
+        if si is None or di is None or not self.valid[si, di]:
+            return -1
+        return self._cell(fi, si, di)
+
+    def _series(self, fi: int, symbol: str, i0: int, i1: int) -> pd.Series:
+        si = self.symbol_index.get(symbol)
+        if si is None:
+            return pd.Series(name=self.fields[fi])
+        mask = self.valid[si, i0:i1]
+        return pd.Series(self._row(fi, si, i0, i1)[mask],
+                         index=pd.Index(self.dates[i0:i1][mask], name='trade_dt'),
+                         name=self.fields[fi])
+
+    def get_market_data(self, all_symbol_code=None, field=None, start="", end="", count=-1):
+        """
+        与 GetDBData.get_market_data 相同的八种取数形式
+        因为停牌或者其他原因取不到数据的，１　２　３　返回的是－１，其他返回的是 pandas 的空或者 NaN，所以可以使用　＞０判断是否取到值
+        """
+        if start != "":
+            if isinstance(start, str):
+                start = date_str_to_int(start)
+        else:
+            start = 0
+        if end != "":
+            if isinstance(end, str):
+                end = date_str_to_int(end)
+        else:
+            end = 0
+        # （１）代码-1，字段-1，时间-1,  return float
+        if len(all_symbol_code) == 1 and len(field) == 1 and (start == end) and count == -1:
+            return self._lookup(self.field_index[field[0]], all_symbol_code[0], end)
+        # （２）代码-n，字段-1，时间-1,  return Series
+        elif len(all_symbol_code) > 1 and len(field) == 1 and (start == end) and count == -1:
+            fi = self.field_index[field[0]]
+            return pd.Series({stock: self._lookup(fi, stock, end) for stock in all_symbol_code})
+        # （３）代码-1，字段-n，时间-1,  return Series
+        elif len(all_symbol_code) == 1 and len(field) > 1 and (start == end) and count == -1:
+            return pd.Series({field_one: self._lookup(self.field_index[field_one], all_symbol_code[0], end)
+                              for field_one in field})
+        # （４）代码-1，字段-1，时间-n,  return Series
+        elif len(all_symbol_code) == 1 and len(field) == 1 and (start != end) and count == -1:
+            if all_symbol_code[0] not in self.symbol_index:
+                return pd.Series()
+            i0, i1 = self.date_range(start, end)
+            return self._series(self.field_index[field[0]], all_symbol_code[0], i0, i1)
+        # （５）代码-n，字段-1，时间-n,  return dataframe 行-timestamp，列-代码
+        elif len(all_symbol_code) > 1 and len(field) == 1 and (start != end) and count == -1:
+            fi = self.field_index[field[0]]
+            i0, i1 = self.date_range(start, end)
+            panel = np.full((i1 - i0, len(all_symbol_code)), np.nan)
+            has_bar = np.zeros(i1 - i0, dtype=bool)
+            for ci, stock in enumerate(all_symbol_code):
+                si = self.symbol_index.get(stock)
+                if si is None:
+                    continue
+                mask = self.valid[si, i0:i1]
+                panel[mask, ci] = self._row(fi, si, i0, i1)[mask]
+                has_bar |= mask
+            return pd.DataFrame(panel[has_bar],
+                                index=pd.Index(self.dates[i0:i1][has_bar], name='trade_dt'),
+                                columns=all_symbol_code)
+        # （６）代码-n，字段-n，时间-1,  return dataframe 行-字段，列-代码
+        elif len(all_symbol_code) > 1 and len(field) > 1 and (start == end) and count == -1:
+            field_pos = [self.field_index[fd] for fd in field]
+            di = self.date_index.get(end)
+            table = np.full((len(field), len(all_symbol_code)), np.nan)
+            for ci, stock in enumerate(all_symbol_code):
+                si = self.symbol_index.get(stock)
+                if si is None or di is None or not self.valid[si, di]:
+                    continue
+                table[:, ci] = [self._cell(fi, si, di) for fi in field_pos]
+            return pd.DataFrame(table, index=field, columns=all_symbol_code)
+        # （７）代码-1，字段-n，时间-n,  return dataframe 行-timestamp，列-字段
+        elif len(all_symbol_code) == 1 and len(field) > 1 and (start != end) and count == -1:
+            i0, i1 = self.date_range(start, end)
+            return pd.DataFrame({fd: self._series(self.field_index[fd], all_symbol_code[0], i0, i1)
+                                 for fd in field}, columns=field)
+        # 代码-n，字段-n，时间-n,  return dataframe 行-代码-timestamp(多层索引)，列-字段
+        else:
+            i0, i1 = self.date_range(start, end)
+            result_dict = {}
+            for stock in all_symbol_code:
+                result_dict[stock] = pd.DataFrame({fd: self._series(self.field_index[fd], stock, i0, i1)
+                                                   for fd in field}, columns=field)
+            return pd.concat(result_dict, keys=all_symbol_code)
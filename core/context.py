@@ -6,18 +6,20 @@
 import pandas as pd
 
 from .object import OrderData, TradeData, PositionData, AccountData
+from .bar_store import BarStore
+from .journal import RecordJournal
 
 
 class Context(object):
     def __init__(self, gateway):
         self.gateway = gateway
 
-        # 三层嵌套dict变量，每一根 bar 的时间戳是 dict 的 key
-        self.account_data_dict = {}    # {timestamp : [account_data]}, 基于close，update_bar_info 后append
-        self.order_data_dict = {}      # {timestamp : [order_data,order_data]}, handle_order 后append, handle_risk后update
-        self.trade_data_dict = {}         # {timestamp : [deal_data,deal_data]}, handle_trade_ 后append
-        self.position_data_dict = {}     # timestamp : [position_data,position_data]  handle_trade_ 后append
-        self.commission_data_dict = {}
+        # 追加式列存日志，每根 bar 结束时（update_bar_info）把当前 bar 的资金、委托、成交、持仓逐条追加
+        self.account_journal = RecordJournal.from_prototype(AccountData())
+        self.order_journal = RecordJournal.from_prototype(OrderData())
+        self.trade_journal = RecordJournal.from_prototype(TradeData())
+        self.position_journal = RecordJournal.from_prototype(PositionData())
+        self.commission_data_dict = {}  # {timestamp : {symbol: commission}}
 
         self.bar_order_data_dict = {}   # 每个bar上有可能不止一个order
         self.bar_trade_data_dict = {}
@@ -42,9 +44,10 @@ class Context(object):
         self.trade_count = 0
 
         # 市场数据
-        self.daily_data = pd.DataFrame()
+        self.daily_data = BarStore()
         self.index_daily_data = pd.DataFrame()
         self.benchmark_index = []
+        self.calendar = None        # 交易日历 TradingCalendar，任一代码有 bar 的日期
         self.ex_rights_dict = None
 
         # 风控
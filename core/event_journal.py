@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+回测事件的二进制日志：BAR、委托、成交、持仓、资金变动按类型逐行记录，写入只追加的二进制文件，
+回测结束后由 EventJournalReader 直接读成 DataFrame，不必再从文本日志中用正则解析
+
+文件由若干帧组成，每帧为 4 字节长度（小端）+ pickle 数据：
+('schema', 类型, 列名) 在某类记录第一次出现时写入一次；('rows', 类型, [行元组, ...]) 每 batch_size 行写入一次
+枚举值存为其 value，其余属性值都是字符串、数值或 None
+"""
+import pickle
+from enum import Enum
+from struct import Struct
+from typing import Dict, List
+
+import pandas as pd
+
+frame_header = Struct('<I')
+
+
+class EventJournalWriter(object):
+    """事件日志写入，各类记录分别缓冲，攒够 batch_size 行写一帧"""
+
+    def __init__(self, file_path: str, batch_size: int = 1024):
+        self.file_path = file_path
+        self.batch_size = batch_size
+        self.file = open(file_path, 'wb')
+        self.columns: Dict[str, tuple] = {}
+        self.rows: Dict[str, list] = {}
+        self.count = 0
+
+    def _write_frame(self, frame):
+        payload = pickle.dumps(frame, protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.write(frame_header.pack(len(payload)))
+        self.file.write(payload)
+
+    def _append(self, kind: str, columns: tuple, row: tuple):
+        if kind not in self.columns:
+            self.columns[kind] = columns
+            self.rows[kind] = []
+            self._write_frame(('schema', kind, columns))
+        rows = self.rows[kind]
+        rows.append(row)
+        self.count += 1
+        if len(rows) >= self.batch_size:
+            self._write_frame(('rows', kind, rows))
+            self.rows[kind] = []
+
+    def record(self, kind: str, dt, data):
+        """记录一个委托、成交、持仓或资金对象（带 _fields 的 SlotsData），在写入时取值，之后对象再变动不影响记录"""
+        values = [dt]
+        for name in data._fields:
+            value = getattr(data, name)
+            values.append(value.value if isinstance(value, Enum) else value)
+        self._append(kind, ('dt',) + data._fields, tuple(values))
+
+    def record_values(self, kind: str, dt, **values):
+        """记录一行任意字段，如每根 bar 的汇总信息"""
+        self._append(kind, ('dt',) + tuple(values.keys()), (dt,) + tuple(values.values()))
+
+    def flush(self):
+        for kind, rows in self.rows.items():
+            if rows:
+                self._write_frame(('rows', kind, rows))
+                self.rows[kind] = []
+        self.file.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class EventJournalReader(object):
+    """事件日志读取"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def frames(self):
+        """依次返回文件中的每一帧，文件末尾不完整的帧（如写入中途中断）忽略"""
+        with open(self.file_path, 'rb') as f:
+            while True:
+                header = f.read(frame_header.size)
+                if len(header) < frame_header.size:
+                    return
+                size = frame_header.unpack(header)[0]
+                payload = f.read(size)
+                if len(payload) < size:
+                    return
+                yield pickle.loads(payload)
+
+    def iter_frames(self, kind: str = None):
+        """逐帧返回 (类型, DataFrame)，kind 不为 None 时只返回该类记录"""
+        columns = {}
+        for tag, frame_kind, data in self.frames():
+            if tag == 'schema':
+                columns[frame_kind] = list(data)
+            elif kind is None or frame_kind == kind:
+                yield frame_kind, pd.DataFrame.from_records(data, columns=columns[frame_kind])
+
+    def kinds(self) -> List[str]:
+        return [frame_kind for tag, frame_kind, _ in self.frames() if tag == 'schema']
+
+    def read(self, kind: str) -> pd.DataFrame:
+        """读取某一类记录的全部行"""
+        columns = None
+        rows = []
+        for tag, frame_kind, data in self.frames():
+            if frame_kind != kind:
+                continue
+            if tag == 'schema':
+                columns = list(data)
+            else:
+                rows.extend(data)
+        return pd.DataFrame.from_records(rows, columns=columns)
+
+    def read_all(self) -> Dict[str, pd.DataFrame]:
+        """读取全部记录，返回 {类型: DataFrame}"""
+        columns = {}
+        rows = {}
+        for tag, frame_kind, data in self.frames():
+            if tag == 'schema':
+                columns[frame_kind] = list(data)
+                rows[frame_kind] = []
+            else:
+                rows[frame_kind].extend(data)
+        return {k: pd.DataFrame.from_records(rows[k], columns=columns[k]) for k in columns}
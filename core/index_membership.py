@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+指数成分股的区间索引：成分变动日升序排列，每个区间对应一个成分股集合，
+按日期二分查找当日成分股，O(log n)；相邻两日成分相同时返回的是同一个集合对象
+可用于沪深300、中证500 等指数（AINDEXMEMBERS）以及申万行业指数（SWINDEXMEMBERS）
+"""
+from bisect import bisect_right
+from typing import FrozenSet, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+def _to_date_int(value) -> int:
+    """纳入、剔除日期转为整数，空值（None、NaN、''）和 0 都视为 0，即尚未剔除"""
+    if value is None or value == '' or (isinstance(value, float) and np.isnan(value)):
+        return 0
+    return int(value)
+
+
+class IndexMembership(object):
+    """成分股 symbol 在 in_date <= d 且（out_date > d 或 out_date 为 0）时属于指数"""
+
+    def __init__(self, records):
+        """records 为 (成分股代码, 纳入日期, 剔除日期) 的序列"""
+        changes = {}
+        for symbol, in_date, out_date in records:
+            in_date = _to_date_int(in_date)
+            out_date = _to_date_int(out_date)
+            changes.setdefault(in_date, []).append((symbol, 1))
+            if out_date != 0:
+                changes.setdefault(out_date, []).append((symbol, -1))
+
+        self.change_dates: List[int] = sorted(changes)
+        self.member_sets: List[FrozenSet[str]] = []
+        count = {}
+        members = frozenset()
+        for dt in self.change_dates:
+            for symbol, delta in changes[dt]:
+                count[symbol] = count.get(symbol, 0) + delta
+            cur_members = frozenset(s for s, c in count.items() if c > 0)
+            members = members if cur_members == members else cur_members
+            self.member_sets.append(members)
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame, symbol_col: str = 'stock_code', in_col: str = 'in_date',
+                   out_col: str = 'out_date'):
+        """由成分股 DataFrame 构建，默认列名与 hs300_members.pkl 相同"""
+        return cls(zip(data[symbol_col].values, data[in_col].values, data[out_col].values))
+
+    @classmethod
+    def from_sqlite(cls, conn, index_code: str, table: str = 'AINDEXMEMBERS'):
+        """由 sqlite 数据库中的 AINDEXMEMBERS 或 SWINDEXMEMBERS 表构建"""
+        cur = conn.execute('select S_CON_WINDCODE, S_CON_INDATE, S_CON_OUTDATE from {0} '
+                           'where S_INFO_WINDCODE = ?'.format(table), (index_code,))
+        return cls(cur.fetchall())
+
+    def members(self, date: int) -> FrozenSet[str]:
+        """某日的成分股集合"""
+        k = bisect_right(self.change_dates, int(date)) - 1
+        if k < 0:
+            return frozenset()
+        return self.member_sets[k]
+
+    def changes(self, prev_date: int, date: int) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+        """从 prev_date 到 date 纳入、剔除的成分股"""
+        prev_members = self.members(prev_date)
+        cur_members = self.members(date)
+        if prev_members is cur_members:
+            return frozenset(), frozenset()
+        return cur_members - prev_members, prev_members - cur_members
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+逐 bar 增量更新的技术指标，每根 bar 的计算量与周期长度无关
+算法与 TA-Lib 相同：EMA 以前 n 个值的简单平均作初值，ATR、RSI 用 Wilder 平滑，标准差为总体标准差，
+初值期内的值为 NaN。EMA、ATR、RSI、MACD 由全部历史递推，对同一段序列与 TA-Lib 的结果相同；
+TA-Lib 对每个窗口重新初始化，窗口只比周期长一点时两者的差异可达价格波动的量级，窗口远长于周期时差异才可忽略
+panel_xxx 函数对 日期 × 代码 面板一次算出全部代码的指标
+"""
+from math import nan, sqrt
+
+import numpy as np
+
+
+class StreamingSMA(object):
+    """简单移动平均，n 个值的环形缓冲区 + 滚动求和，缓冲区每转一圈重新求和一次，避免浮点误差累积"""
+
+    def __init__(self, n: int):
+        self.n = n
+        self.buffer = [0.0] * n
+        self.pos = 0
+        self.count = 0
+        self.total = 0.0
+        self.value = nan
+
+    def update(self, x: float) -> float:
+        old = self.buffer[self.pos]
+        self.buffer[self.pos] = x
+        self.pos += 1
+        if self.pos == self.n:
+            self.pos = 0
+            self.total = sum(self.buffer)
+        else:
+            self.total += x - old
+        self.count += 1
+        if self.count >= self.n:
+            self.value = self.total / self.n
+        return self.value
+
+
+class StreamingSTD(object):
+    """总体标准差，滚动求和与平方和；所有值先减去第一个值再累加，减小大数相减的误差"""
+
+    def __init__(self, n: int):
+        self.n = n
+        self.buffer = [0.0] * n
+        self.pos = 0
+        self.count = 0
+        self.shift = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.value = nan
+
+    def update(self, x: float) -> float:
+        if self.shift is None:
+            self.shift = x
+        d = x - self.shift
+        old = self.buffer[self.pos]
+        self.buffer[self.pos] = d
+        self.pos += 1
+        if self.pos == self.n:
+            self.pos = 0
+            self.total = sum(self.buffer)
+            self.total_sq = sum(v * v for v in self.buffer)
+        else:
+            self.total += d - old
+            self.total_sq += d * d - old * old
+        self.count += 1
+        if self.count >= self.n:
+            mean = self.total / self.n
+            self.value = sqrt(max(self.total_sq / self.n - mean * mean, 0.0))
+        return self.value
+
+
+class StreamingEMA(object):
+    """指数移动平均，系数 2 / (n + 1)，前 n 个值的简单平均作初值"""
+
+    def __init__(self, n: int):
+        self.n = n
+        self.k = 2.0 / (n + 1)
+        self.count = 0
+        self.total = 0.0
+        self.value = nan
+
+    def update(self, x: float) -> float:
+        self.count += 1
+        if self.count < self.n:
+            self.total += x
+        elif self.count == self.n:
+            self.value = (self.total + x) / self.n
+        else:
+            self.value += self.k * (x - self.value)
+        return self.value
+
+
+class StreamingATR(object):
+    """平均真实波幅，真实波幅从第二根 bar 开始计算，前 n 个真实波幅的简单平均作初值，之后 Wilder 平滑"""
+
+    def __init__(self, n: int):
+        self.n = n
+        self.prev_close = None
+        self.count = 0
+        self.total = 0.0
+        self.value = nan
+
+    def update(self, high: float, low: float, close: float) -> float:
+        prev_close = self.prev_close
+        self.prev_close = close
+        if prev_close is None:
+            return self.value
+        tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        self.count += 1
+        if self.count < self.n:
+            self.total += tr
+        elif self.count == self.n:
+            self.value = (self.total + tr) / self.n
+        else:
+            self.value = (self.value * (self.n - 1) + tr) / self.n
+        return self.value
+
+
+class StreamingRSI(object):
+    """相对强弱指标，前 n 个涨跌幅的平均作初值，之后 Wilder 平滑"""
+
+    def __init__(self, n: int):
+        self.n = n
+        self.prev = None
+        self.count = 0
+        self.gain = 0.0
+        self.loss = 0.0
+        self.value = nan
+
+    def update(self, x: float) -> float:
+        prev = self.prev
+        self.prev = x
+        if prev is None:
+            return self.value
+        change = x - prev
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+        self.count += 1
+        if self.count <= self.n:
+            self.gain += gain
+            self.loss += loss
+            if self.count < self.n:
+                return self.value
+            self.gain /= self.n
+            self.loss /= self.n
+        else:
+            self.gain = (self.gain * (self.n - 1) + gain) / self.n
+            self.loss = (self.loss * (self.n - 1) + loss) / self.n
+        total = self.gain + self.loss
+        self.value = 100.0 * self.gain / total if total != 0 else 0.0
+        return self.value
+
+
+class StreamingMACD(object):
+    """
+    MACD，快慢两条 EMA 之差，再对差值求 signal 周期的 EMA，value 为 (macd, signal, hist)
+    与 TA-Lib 相同：快线跳过前 slow - fast 个值，与慢线同一根 bar 完成初值；signal 有值之前三个值都是 NaN
+    """
+
+    def __init__(self, fast_period: int, slow_period: int, signal_period: int):
+        if slow_period < fast_period:
+            fast_period, slow_period = slow_period, fast_period
+        self.fast = StreamingEMA(fast_period)
+        self.slow = StreamingEMA(slow_period)
+        self.signal = StreamingEMA(signal_period)
+        self.skip = slow_period - fast_period
+        self.count = 0
+        self.value = (nan, nan, nan)
+
+    def update(self, x: float) -> tuple:
+        self.count += 1
+        slow = self.slow.update(x)
+        if self.count <= self.skip:
+            return self.value
+        fast = self.fast.update(x)
+        if slow != slow:
+            return self.value
+        macd = fast - slow
+        signal = self.signal.update(macd)
+        if signal == signal:
+            self.value = (macd, signal, macd - signal)
+        return self.value
+
+
+class StreamingBoll(object):
+    """布林通道，value 为 (上轨, 下轨)"""
+
+    def __init__(self, n: int, dev: float):
+        self.dev = dev
+        self.mid = StreamingSMA(n)
+        self.std = StreamingSTD(n)
+        self.value = (nan, nan)
+
+    def update(self, x: float) -> tuple:
+        mid = self.mid.update(x)
+        std = self.std.update(x)
+        self.value = (mid + std * self.dev, mid - std * self.dev)
+        return self.value
+
+
+def _compress(values: np.ndarray, valid: np.ndarray):
+    """
+    把 日期 × 代码 面板中各代码的有效值按列首尾相接展开成一维，
+    返回 (展开后的值, 所在日期序号, 所在代码序号, 在本代码有效值中的序号)
+    """
+    valid_t = valid.T
+    flat = values.T[valid_t]
+    symbol_pos, date_pos = np.nonzero(valid_t)
+    counts = valid_t.sum(axis=1)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.arange(len(flat)) - np.repeat(starts, counts)
+    return flat, date_pos, symbol_pos, rank
+
+
+def _scatter(shape, result: np.ndarray, date_pos: np.ndarray, symbol_pos: np.ndarray) -> np.ndarray:
+    panel = np.full(shape, np.nan)
+    panel[date_pos, symbol_pos] = result
+    return panel
+
+
+def _window_ok(n: int, date_pos: np.ndarray, rank: np.ndarray, first_index) -> np.ndarray:
+    """窗口内凑满 n 个有效值，且第一个值不早于 first_index[窗口末尾的日期序号]"""
+    ok = rank >= n - 1
+    if first_index is not None:
+        head = np.where(ok, np.arange(len(rank)) - (n - 1), 0)
+        ok &= date_pos[head] >= np.asarray(first_index)[date_pos]
+    return ok
+
+
+def _window_apply(values: np.ndarray, valid: np.ndarray, n: int, first_index, func) -> np.ndarray:
+    """对每个凑满的窗口（n × 有效值）按行调用 func 得到指标值，再放回 日期 × 代码 面板"""
+    flat, date_pos, symbol_pos, rank = _compress(values, valid)
+    ok = _window_ok(n, date_pos, rank, first_index)
+    result = np.full(len(flat), np.nan)
+    end = np.flatnonzero(ok)
+    if len(end) > 0:
+        # 第 i 行是 flat[i:i + n]，不复制数据
+        windows = np.lib.stride_tricks.as_strided(flat, shape=(len(flat) - n + 1, n),
+                                                  strides=(flat.strides[0], flat.strides[0]), writeable=False)
+        result[end] = func(windows[end - (n - 1)])
+    return _scatter(values.shape, result, date_pos, symbol_pos)
+
+
+def panel_sma(values: np.ndarray, valid: np.ndarray, n: int, first_index=None) -> np.ndarray:
+    """
+    日期 × 代码 面板上各代码的简单移动平均，停牌等无效 bar 跳过，只用有效值计算（与逐个代码取有效数据再算 TA-Lib 相同）
+    无效 bar 处、有效值不足 n 个处为 NaN
+    first_index 为每个日期窗口最早可以用到的日期序号，如只用最近 60 个自然日的数据时传入
+    """
+    return _window_apply(values, valid, n, first_index, lambda w: w.mean(axis=1))
+
+
+def panel_std(values: np.ndarray, valid: np.ndarray, n: int, first_index=None) -> np.ndarray:
+    """日期 × 代码 面板上各代码的总体标准差，有效值的取法与 panel_sma 相同"""
+    return _window_apply(values, valid, n, first_index, lambda w: w.std(axis=1))
+
+
+def panel_ema(values: np.ndarray, valid: np.ndarray, n: int) -> np.ndarray:
+    """日期 × 代码 面板上各代码的指数移动平均，前 n 个有效值的简单平均作初值，按日期逐行对全部代码同时递推"""
+    k = 2.0 / (n + 1)
+    seed = panel_sma(values, valid, n)
+    count = np.cumsum(valid, axis=0)
+    result = np.full(values.shape, np.nan)
+    ema = np.full(values.shape[1], np.nan)
+    for t in range(values.shape[0]):
+        is_seed = valid[t] & (count[t] == n)
+        is_next = valid[t] & (count[t] > n)
+        ema[is_seed] = seed[t, is_seed]
+        ema[is_next] += k * (values[t, is_next] - ema[is_next])
+        result[t, valid[t]] = ema[valid[t]]
+    return result
+
+
+def panel_boll(values: np.ndarray, valid: np.ndarray, n: int, dev: float, first_index=None):
+    """日期 × 代码 面板上各代码的布林通道，返回 (上轨, 下轨)"""
+    mid = panel_sma(values, valid, n, first_index)
+    std = panel_std(values, valid, n, first_index)
+    return mid + std * dev, mid - std * dev
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+回测记录的追加式列存日志
+委托、成交、持仓、资金等记录每个 bar 按属性逐列追加到 NumPy 缓冲区，不再把整个 dict 深拷贝保存，
+绩效分析时直接由缓冲区生成 DataFrame
+"""
+import numpy as np
+import pandas as pd
+
+
+def is_number(value) -> bool:
+    """可以存入 float64 列的值：整数、浮点数和 None（存为 NaN）"""
+    return value is None or (isinstance(value, (int, float, np.number)) and not isinstance(value, bool))
+
+
+class ColumnBuffer(object):
+    """
+    一列数据的追加缓冲区，容量不足时按 2 倍扩容
+    第一个值是数值时为 float64 列，否则为 object 列；float64 列中出现非数值时整列转为 object 列
+    """
+
+    def __init__(self, dtype=np.float64, capacity: int = 1024):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def append(self, value):
+        if self.size == len(self.data):
+            data = np.empty(2 * len(self.data), dtype=self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+        if self.data.dtype != object:
+            if not is_number(value):
+                self.data = self.data.astype(object)
+            elif value is None:
+                value = np.nan
+        self.data[self.size] = value
+        self.size += 1
+
+    @property
+    def values(self) -> np.ndarray:
+        return self.data[:self.size]
+
+
+class RecordJournal(object):
+    """一类记录的追加式列存日志，每条记录按 columns 中的属性追加一行"""
+
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+        self.buffers = None
+        self.size = 0
+
+    @classmethod
+    def from_prototype(cls, prototype):
+        """以记录对象的全部公有数据属性为列（与原先由 dir() 取属性的方式相同，按属性名排序）"""
+        columns = [i for i in dir(prototype) if i[0] != '_' and not callable(getattr(prototype, i))]
+        return cls(columns)
+
+    def __len__(self):
+        return self.size
+
+    def append(self, record):
+        values = [getattr(record, column, None) for column in self.columns]
+        if self.buffers is None:
+            self.buffers = [ColumnBuffer(np.float64 if is_number(v) else object) for v in values]
+        for buffer, value in zip(self.buffers, values):
+            buffer.append(value)
+        self.size += 1
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def to_frame(self) -> pd.DataFrame:
+        """由缓冲区生成 DataFrame，各列直接使用缓冲区中的数组"""
+        if self.buffers is None:
+            return pd.DataFrame(columns=self.columns)
+        return pd.DataFrame({column: buffer.values for column, buffer in zip(self.columns, self.buffers)},
+                            columns=self.columns, copy=False)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+两级行情数据仓：每根 bar 都要用到的字段（收盘价算净值、成交量判断停牌）常驻内存，
+开、高、低等其他字段按 (代码, 日期段) 分块，用到时才由 loader 读取，放入有容量上限的 LRU 块缓存，
+读取某块后在后台线程预取同一代码的下一块，全市场、长周期回测的内存占用不随数据量增长
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Sequence
+
+import numpy as np
+
+from .bar_store import BarStore
+
+
+class LazyBarStore(BarStore):
+    """
+    values 只含常驻字段，fields 为全部字段；取数接口与 BarStore 相同
+    loader(symbol, fields, dates) 返回 [len(dates), len(fields)] 的数组，取不到的值为 NaN；
+    所有读取都在同一个后台线程中执行，loader 可以持有只能在一个线程中使用的数据库连接；
+    loader 有 close 方法时，close() 在该线程中调用它释放连接
+    """
+
+    def __init__(self,
+                 resident: BarStore,
+                 fields: Sequence[str],
+                 loader: Callable,
+                 block_size: int = 250,
+                 max_blocks: int = 256,
+                 prefetch: bool = True):
+        self.resident_fields = list(resident.fields)
+        super().__init__(resident.symbols, resident.dates, fields, resident.values, resident.valid)
+        self.lazy_fields = [fd for fd in self.fields if fd not in self.resident_fields]
+        # 全部字段序号 -> (是否常驻, 在常驻数组或块中的位置)
+        self.field_slot = {self.field_index[fd]: (True, i) for i, fd in enumerate(self.resident_fields)
+                           if fd in self.field_index}
+        self.field_slot.update({self.field_index[fd]: (False, i) for i, fd in enumerate(self.lazy_fields)})
+
+        self.loader = loader
+        self.block_size = block_size            # 每块的交易日数
+        self.max_blocks = max_blocks            # 块缓存（含预取中的块）的容量上限
+        self.prefetch = prefetch
+        self.blocks = OrderedDict()             # {(代码序号, 块序号): [块内日期数, 延迟字段数] 数组}
+        self.pending = OrderedDict()            # {(代码序号, 块序号): Future}，预取的块，取用时才移入 blocks
+        self.executor = None                    # 第一次读取时创建，close() 后再读取时重新创建
+        self.hits = 0
+        self.misses = 0
+
+    def _submit(self, fn, *args):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        return self.executor.submit(fn, *args)
+
+    def _load(self, key):
+        si, bi = key
+        d0 = bi * self.block_size
+        d1 = min(d0 + self.block_size, len(self.dates))
+        return self.loader(self.symbols[si], self.lazy_fields, self.dates[d0:d1])
+
+    def _schedule(self, key):
+        if key in self.blocks or key in self.pending or key[1] * self.block_size >= len(self.dates):
+            return
+        # 预取最多占一半容量，超出时丢弃最早的预取
+        while len(self.pending) >= max(self.max_blocks // 2, 1):
+            self.pending.popitem(last=False)[1].cancel()
+        self._evict(1)
+        self.pending[key] = self._submit(self._load, key)
+
+    def _evict(self, n: int):
+        """腾出 n 块的位置，先淘汰最久未用的块，再丢弃最早的、一直没有用到的预取"""
+        while len(self.blocks) + len(self.pending) + n > self.max_blocks:
+            if self.blocks:
+                self.blocks.popitem(last=False)
+            elif self.pending:
+                self.pending.popitem(last=False)[1].cancel()
+            else:
+                break
+
+    def _block(self, si: int, bi: int) -> np.ndarray:
+        key = (si, bi)
+        block = self.blocks.get(key)
+        if block is not None:
+            self.hits += 1
+            self.blocks.move_to_end(key)
+            return block
+
+        future = self.pending.pop(key, None)
+        if future is None:
+            self.misses += 1
+            future = self._submit(self._load, key)
+        else:
+            self.hits += 1
+        block = future.result()
+        self._evict(1)
+        self.blocks[key] = block
+        if self.prefetch:
+            self._schedule((si, bi + 1))
+        return block
+
+    def _lazy_cell(self, slot: int, si: int, di: int) -> float:
+        return self._block(si, di // self.block_size)[di % self.block_size, slot]
+
+    def mask_invalid(self, field: str = 'volume'):
+        """停牌判断所用字段须是常驻字段"""
+        is_resident, slot = self.field_slot[self.field_index[field]]
+        if not is_resident:
+            raise ValueError('{0} 不是常驻字段，不能用于判断停牌'.format(field))
+        with np.errstate(invalid='ignore'):
+            self.valid = self.valid & (self.values[:, :, slot] > 0)
+        if self.values.flags.writeable:
+            self.values[~self.valid] = np.nan
+        return self
+
+    def value(self, field: str, symbol: str, date: int) -> float:
+        si = self.symbol_index.get(symbol)
+        di = self.date_index.get(date)
+        if si is None or di is None or not self.valid[si, di]:
+            return np.nan
+        return self._cell(self.field_index[field], si, di)
+
+    def _cell(self, fi: int, si: int, di: int) -> float:
+        is_resident, slot = self.field_slot[fi]
+        if is_resident:
+            return self.values[si, di, slot]
+        return self._lazy_cell(slot, si, di)
+
+    def _column(self, fi: int, si: np.ndarray, di: int) -> np.ndarray:
+        is_resident, slot = self.field_slot[fi]
+        if is_resident:
+            return self.values[si, di, slot]
+        return np.array([self._lazy_cell(slot, s, di) for s in si.tolist()], dtype=np.float64)
+
+    def _row(self, fi: int, si: int, i0: int, i1: int) -> np.ndarray:
+        is_resident, slot = self.field_slot[fi]
+        if is_resident:
+            return self.values[si, i0:i1, slot]
+        if i1 <= i0:
+            return np.empty(0)
+        parts = []
+        for bi in range(i0 // self.block_size, (i1 - 1) // self.block_size + 1):
+            b0 = bi * self.block_size
+            block = self._block(si, bi)
+            parts.append(block[max(i0 - b0, 0):min(i1 - b0, len(block)), slot])
+        return np.concatenate(parts)
+
+    def close(self):
+        """停止后台读取线程并关闭 loader 的连接，清空块缓存；之后仍可取数，用到延迟字段时重新打开"""
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.blocks.clear()
+        if self.executor is None:
+            return
+        if hasattr(self.loader, 'close'):
+            self.executor.submit(self.loader.close)
+        self.executor.shutdown(wait=True)
+        self.executor = None
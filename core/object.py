@@ -6,7 +6,7 @@
 from dataclasses import dataclass
 from datetime import datetime
 
-from .const import Empty, Status, OrderType, Exchange
+from .const import Empty, Status, StopOrderStatus, OrderType, Exchange
 
 ACTIVE_STATUSES = {Status.SUBMITTING, Status.NOT_TRADED, Status.PART_TRADED}
 
@@ -17,6 +17,45 @@ class BaseData:
     gateway: str = Empty.eSTRING.value
 
 
+class SlotsData(object):
+    """
+    带 __slots__ 的数据对象基类：实例没有 __dict__，内存占用小；copy() 逐个属性浅拷贝，代替 deepcopy
+    属性值都是字符串、数值、枚举等不可变对象，浅拷贝与深拷贝的结果相同
+    """
+    __slots__ = ()
+    _fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = []
+        for klass in reversed(cls.__mro__):
+            fields.extend(klass.__dict__.get('__slots__', ()))
+        cls._fields = tuple(fields)
+
+    def copy(self):
+        new = object.__new__(self.__class__)
+        for name in self._fields:
+            setattr(new, name, getattr(self, name))
+        return new
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self._fields)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{0}({1})'.format(self.__class__.__name__,
+                                 ', '.join(['{0}={1!r}'.format(name, getattr(self, name)) for name in self._fields]))
+
+
 @dataclass
 class BarData(BaseData):
     """K线数据类"""
@@ -35,8 +74,16 @@ class BarData(BaseData):
     bar_index: int = Empty.eINT.value
 
 
-class OrderData(BaseData):
+class OrderData(SlotsData):
     """委托订单类"""
+    __slots__ = ('symbol', 'exchange', 'order_id', 'order_type', 'direction', 'offset', 'price', 'filled_price',
+                 'order_volume', 'filled_volume', 'status', 'order_datetime', 'cancel_datetime', 'filled_datetime',
+                 'comments', 'gateway', 'account', 'symbol_type', 'front_id', 'session_id')
+
+    # 委托单按对象本身区分，不按属性值比较
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
     def __init__(self,
                  symbol=None,
                  exchange=None,
@@ -90,15 +137,18 @@ class OrderData(BaseData):
 
 
 class StopOrder(OrderData):
+    __slots__ = ()
+
     def __init__(self, symbol=None, exchange=None, order_id=None,
                  order_type=OrderType.STOP, direction=None, offset=None,
                  price=None, order_volume=None, account=None,
                  gateway=None, order_datetime=None, comments=None, symbol_type=None):
         # 代码信息
-        super().__init__(symbol, exchange, order_id,
-                         order_type, direction, offset,
-                         price, order_volume, account,
-                         gateway, order_datetime, comments, symbol_type)
+        super().__init__(symbol=symbol, exchange=exchange, order_id=order_id,
+                         order_type=order_type, direction=direction, offset=offset,
+                         price=price, order_volume=order_volume, status=StopOrderStatus.WAITING,
+                         account=account, gateway=gateway, order_datetime=order_datetime,
+                         comments=comments, symbol_type=symbol_type)
 
         # 补充报单信息
         self.filled_datetime = None
@@ -109,78 +159,141 @@ class StopOrder(OrderData):
         self.session_id = Empty.eSTRING.value  # 连接编号，实际交易用
 
     def is_active(self) -> bool:
-        """委托订单还未成交吗？"""
-        if self.status in ACTIVE_STATUSES:
+        """止损单还未触发吗？"""
+        if self.status == StopOrderStatus.WAITING:
             return True
         else:
             return False
 
 
-@dataclass
-class TradeData(BaseData):
+class TradeData(SlotsData):
     """交易/成交数据用于保存委托订单的成交情况，一笔委托可能有多笔成交数据"""
-    # 代码编号信息
-    symbol: str = Empty.eSTRING.value                             # 合约代码
-    exchange: str = Exchange.SSE                     # 交易所代码
-    order_id: str = Empty.eSTRING.value                            # 订单编号
-    trade_id: str = Empty.eSTRING.value                            # 成交单编号
-
-    # 成交相关
-    direction: str = None                 # 交易方向
-    offset: str = None               # 成交开平
-    order_price: float = Empty.eFLOAT.value  # 委托价格
-    price: float = Empty.eFLOAT.value        # 成交价格
-    volume: float = Empty.eFLOAT.value       # 成交数量
-    datetime: datetime = None                   # 成交时间
-    multiplier: int = Empty.eINT.value      # 合约乘数
-    price_tick: float = Empty.eFLOAT.value   # 最小价格跳动
-    margin: float = Empty.eFLOAT.value       # 保证金率
-    slippage: float = Empty.eFLOAT.value     # 滑点值
-    commission: float = Empty.eFLOAT.value   # 手续费率
-    comments: str = Empty.eSTRING.value
-    account: str = Empty.eSTRING.value
-    frozen: int = Empty.eINT.value
-    symbol_type: str = Empty.eSTRING.value
+    __slots__ = ('gateway', 'symbol', 'exchange', 'order_id', 'trade_id', 'direction', 'offset', 'order_price',
+                 'price', 'volume', 'datetime', 'multiplier', 'price_tick', 'margin', 'slippage', 'commission',
+                 'comments', 'account', 'frozen', 'symbol_type')
+
+    def __init__(self,
+                 gateway: str = Empty.eSTRING.value,
+                 symbol: str = Empty.eSTRING.value,
+                 exchange: str = Exchange.SSE,
+                 order_id: str = Empty.eSTRING.value,
+                 trade_id: str = Empty.eSTRING.value,
+                 direction: str = None,
+                 offset: str = None,
+                 order_price: float = Empty.eFLOAT.value,
+                 price: float = Empty.eFLOAT.value,
+                 volume: float = Empty.eFLOAT.value,
+                 datetime: datetime = None,
+                 multiplier: int = Empty.eINT.value,
+                 price_tick: float = Empty.eFLOAT.value,
+                 margin: float = Empty.eFLOAT.value,
+                 slippage: float = Empty.eFLOAT.value,
+                 commission: float = Empty.eFLOAT.value,
+                 comments: str = Empty.eSTRING.value,
+                 account: str = Empty.eSTRING.value,
+                 frozen: int = Empty.eINT.value,
+                 symbol_type: str = Empty.eSTRING.value):
+        self.gateway = gateway
+        # 代码编号信息
+        self.symbol = symbol                    # 合约代码
+        self.exchange = exchange                # 交易所代码
+        self.order_id = order_id                # 订单编号
+        self.trade_id = trade_id                # 成交单编号
 
+        # 成交相关
+        self.direction = direction              # 交易方向
+        self.offset = offset                    # 成交开平
+        self.order_price = order_price          # 委托价格
+        self.price = price                      # 成交价格
+        self.volume = volume                    # 成交数量
+        self.datetime = datetime                # 成交时间
+        self.multiplier = multiplier            # 合约乘数
+        self.price_tick = price_tick            # 最小价格跳动
+        self.margin = margin                    # 保证金率
+        self.slippage = slippage                # 滑点值
+        self.commission = commission            # 手续费率
+        self.comments = comments
+        self.account = account
+        self.frozen = frozen
+        self.symbol_type = symbol_type
 
-@dataclass
-class PositionData(BaseData):
+
+class PositionData(SlotsData):
     """持仓数据，跟踪每一个持仓头寸"""
-    # 编号代码信息
-    symbol: str = Empty.eSTRING.value                                 # 合约代码
-    exchange: str = Exchange.SSE                         # 交易所代码
-    account: str = Empty.eSTRING.value                             # 资金账号代码
-    trade_id: str = Empty.eSTRING.value
-    order_id: str = Empty.eSTRING.value
-
-    # 持仓信息
-    init_datetime = None                    # 建仓时间
-    datetime: str = None
-    direction: str = None                       # 持仓方向
-    offset: str = None
-    init_volume: float = Empty.eFLOAT.value       # 初始持仓数量
-    volume: float = Empty.eFLOAT.value       # 除权除息/换月移仓之后的持仓数量
-    frozen: float = Empty.eFLOAT.value       # 冻结数量
-    init_price: float = Empty.eFLOAT.value        # 初始持仓价格
-    price: float = Empty.eFLOAT.value        # 除权除息/换月移仓之后的持仓价格
-    position_pnl: float = Empty.eFLOAT.value          # 持仓盈亏
-    position_value: float = Empty.eFLOAT.value          # 持仓市值
-    position_value_pre: float = Empty.eFLOAT.value          # 上个bar的持仓市值
-    yd_volume: float = Empty.eFLOAT.value    # 昨持数量（期货）
-    multiplier: int = Empty.eINT.value      # 合约乘数
-    price_tick: float = Empty.eFLOAT.value   # 最小价格跳动
-    margin: float = Empty.eFLOAT.value       # 保证金率
-    symbol_type: str = Empty.eSTRING.value
+    __slots__ = ('gateway', 'symbol', 'exchange', 'account', 'trade_id', 'order_id', 'init_datetime', 'datetime',
+                 'direction', 'offset', 'init_volume', 'volume', 'frozen', 'init_price', 'price', 'position_pnl',
+                 'position_value', 'position_value_pre', 'yd_volume', 'multiplier', 'price_tick', 'margin',
+                 'symbol_type')
 
+    def __init__(self,
+                 gateway: str = Empty.eSTRING.value,
+                 symbol: str = Empty.eSTRING.value,
+                 exchange: str = Exchange.SSE,
+                 account: str = Empty.eSTRING.value,
+                 trade_id: str = Empty.eSTRING.value,
+                 order_id: str = Empty.eSTRING.value,
+                 datetime: str = None,
+                 direction: str = None,
+                 offset: str = None,
+                 init_volume: float = Empty.eFLOAT.value,
+                 volume: float = Empty.eFLOAT.value,
+                 frozen: float = Empty.eFLOAT.value,
+                 init_price: float = Empty.eFLOAT.value,
+                 price: float = Empty.eFLOAT.value,
+                 position_pnl: float = Empty.eFLOAT.value,
+                 position_value: float = Empty.eFLOAT.value,
+                 position_value_pre: float = Empty.eFLOAT.value,
+                 yd_volume: float = Empty.eFLOAT.value,
+                 multiplier: int = Empty.eINT.value,
+                 price_tick: float = Empty.eFLOAT.value,
+                 margin: float = Empty.eFLOAT.value,
+                 symbol_type: str = Empty.eSTRING.value):
+        self.gateway = gateway
+        # 编号代码信息
+        self.symbol = symbol                            # 合约代码
+        self.exchange = exchange                        # 交易所代码
+        self.account = account                          # 资金账号代码
+        self.trade_id = trade_id
+        self.order_id = order_id
 
-@dataclass
-class AccountData(BaseData):
+        # 持仓信息
+        self.init_datetime = None                       # 建仓时间
+        self.datetime = datetime
+        self.direction = direction                      # 持仓方向
+        self.offset = offset
+        self.init_volume = init_volume                  # 初始持仓数量
+        self.volume = volume                            # 除权除息/换月移仓之后的持仓数量
+        self.frozen = frozen                            # 冻结数量
+        self.init_price = init_price                    # 初始持仓价格
+        self.price = price                              # 除权除息/换月移仓之后的持仓价格
+        self.position_pnl = position_pnl                # 持仓盈亏
+        self.position_value = position_value            # 持仓市值
+        self.position_value_pre = position_value_pre    # 上个bar的持仓市值
+        self.yd_volume = yd_volume                      # 昨持数量（期货）
+        self.multiplier = multiplier                    # 合约乘数
+        self.price_tick = price_tick                    # 最小价格跳动
+        self.margin = margin                            # 保证金率
+        self.symbol_type = symbol_type
+
+
+class AccountData(SlotsData):
     """账户信息，包含总资产、冻结资产、可用资金（现金）"""
-    account_id: str = Empty.eSTRING.value                                  # 资金账号代码
-    datetime = None
-    pre_balance: float = Empty.eFLOAT.value      # 昨日账户总资产
-    total_balance: float = Empty.eFLOAT.value    # 今日账户总资产
-    holding: float = Empty.eFLOAT.value          # 今日账户总持仓
-    frozen: float = Empty.eFLOAT.value           # 今日账户总冻结资产（持仓中冻结的部分）
-    gateway: str = Empty.eSTRING.value
-    available: float = Empty.eFLOAT.value        # 今日可用资金
+    __slots__ = ('gateway', 'account_id', 'datetime', 'pre_balance', 'total_balance', 'holding', 'frozen',
+                 'available')
+
+    def __init__(self,
+                 gateway: str = Empty.eSTRING.value,
+                 account_id: str = Empty.eSTRING.value,
+                 pre_balance: float = Empty.eFLOAT.value,
+                 total_balance: float = Empty.eFLOAT.value,
+                 holding: float = Empty.eFLOAT.value,
+                 frozen: float = Empty.eFLOAT.value,
+                 available: float = Empty.eFLOAT.value):
+        self.gateway = gateway
+        self.account_id = account_id                # 资金账号代码
+        self.datetime = None
+        self.pre_balance = pre_balance              # 昨日账户总资产
+        self.total_balance = total_balance          # 今日账户总资产
+        self.holding = holding                      # 今日账户总持仓
+        self.frozen = frozen                        # 今日账户总冻结资产（持仓中冻结的部分）
+        self.available = available                  # 今日可用资金
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+交易日历：回测开始前一次算好每个交易日的整数日期、字符串、时间戳、自然日序数，
+bar 循环中日期之间的转换都是数组下标或 dict 查找，不再逐 bar 调用 strptime / mktime / strftime
+"""
+import time
+from datetime import date as date_type
+from typing import Dict, List, Sequence, Union
+
+import numpy as np
+
+
+class TradingCalendar(object):
+    """由升序排列的交易日（如 20190102）构建，交易日在日历中的序号即 bar 序号"""
+
+    def __init__(self, dates: Sequence[int]):
+        self.dates: np.ndarray = np.unique(np.asarray(dates, dtype=np.int64))
+        self.strings: List[str] = [str(d) for d in self.dates.tolist()]                    # '20190102'
+        self.dashed: List[str] = [s[:4] + '-' + s[4:6] + '-' + s[6:] for s in self.strings]  # '2019-01-02'
+        self.timestamps: np.ndarray = np.array([int(time.mktime(time.strptime(s, '%Y%m%d'))) for s in self.strings],
+                                               dtype=np.int64)
+        self.ordinals: np.ndarray = np.array([date_type(d // 10000, d // 100 % 100, d % 100).toordinal()
+                                              for d in self.dates.tolist()], dtype=np.int64)
+
+        self.index: Dict[Union[int, str], int] = {}
+        for i, (d, s, ds) in enumerate(zip(self.dates.tolist(), self.strings, self.dashed)):
+            self.index[d] = i
+            self.index[s] = i
+            self.index[ds] = i
+        self.timestamp_index: Dict[int, int] = {t: i for i, t in enumerate(self.timestamps.tolist())}
+
+    @classmethod
+    def from_bar_store(cls, bar_store, symbol: str):
+        """以某个代码（一般是 benchmark）有效 bar 的日期为交易日"""
+        return cls(bar_store.dates_of(symbol))
+
+    @classmethod
+    def from_sqlite(cls, conn, start: int = 0, end: int = 99999999, exchange: str = 'SSE'):
+        """由 sqlite 数据库中的 ASHARECALENDAR 表构建"""
+        cur = conn.execute('select TRADE_DAYS from ASHARECALENDAR where S_INFO_EXCHMARKET = ? '
+                           'and TRADE_DAYS >= ? and TRADE_DAYS <= ?', (exchange, start, end))
+        return cls([int(row[0]) for row in cur.fetchall()])
+
+    def add(self, date: int) -> int:
+        """
+        加入一个交易日（如推送的行情中出现了日历以外的日期），返回其序号
+        日期在日历末尾之后时直接追加，否则插入后重建序号索引；YYYYMMDDHHMM 形式的分钟 timetag 按其所在日期加入
+        """
+        date = int(date)
+        if date >= 10 ** 10:
+            date //= 10000
+        i = self.index.get(date)
+        if i is not None:
+            return i
+        s = str(date)
+        ds = s[:4] + '-' + s[4:6] + '-' + s[6:]
+        timestamp = int(time.mktime(time.strptime(s, '%Y%m%d')))
+        ordinal = date_type(date // 10000, date // 100 % 100, date % 100).toordinal()
+        i = int(np.searchsorted(self.dates, date))
+        self.dates = np.insert(self.dates, i, date)
+        self.strings.insert(i, s)
+        self.dashed.insert(i, ds)
+        self.timestamps = np.insert(self.timestamps, i, timestamp)
+        self.ordinals = np.insert(self.ordinals, i, ordinal)
+        if i == len(self.dates) - 1:
+            self.index[date] = i
+            self.index[s] = i
+            self.index[ds] = i
+            self.timestamp_index[timestamp] = i
+        else:
+            self.index = {}
+            for k, (d, s, ds) in enumerate(zip(self.dates.tolist(), self.strings, self.dashed)):
+                self.index[d] = k
+                self.index[s] = k
+                self.index[ds] = k
+            self.timestamp_index = {t: k for k, t in enumerate(self.timestamps.tolist())}
+        return i
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __contains__(self, date):
+        return date in self.index
+
+    def to_index(self, date: Union[int, str]) -> int:
+        """整数日期、'20190102'、'2019-01-02' 转为交易日序号，不是交易日时返回 None"""
+        return self.index.get(date)
+
+    def to_int(self, date: Union[int, str]) -> int:
+        """'20190102'、'2019-01-02' 转为整数日期；不是交易日的按字符串转换"""
+        i = self.index.get(date)
+        if i is not None:
+            return int(self.dates[i])
+        return int(date.replace('-', '')) if isinstance(date, str) else int(date)
+
+    def to_str(self, date: Union[int, str], dashed: bool = False) -> str:
+        i = self.index[date]
+        return self.dashed[i] if dashed else self.strings[i]
+
+    def to_timestamp(self, date: Union[int, str]) -> int:
+        return int(self.timestamps[self.index[date]])
+
+    def from_timestamp(self, timestamp: int) -> int:
+        """时间戳转为整数日期"""
+        return int(self.dates[self.timestamp_index[timestamp]])
+
+    def shift(self, date: Union[int, str], n: int) -> int:
+        """
+        date 之后第 n 个交易日（n 为负数时是之前第 -n 个交易日），超出日历范围时返回 None
+        date 不是交易日时，往后数从其前一个交易日开始数，往前数从其后一个交易日开始数
+        """
+        i = self.index.get(date)
+        if i is None:
+            d = self.to_int(date)
+            if n >= 0:
+                i = int(np.searchsorted(self.dates, d, side='right')) - 1
+            else:
+                i = int(np.searchsorted(self.dates, d, side='left'))
+        i += n
+        if i < 0 or i >= len(self.dates):
+            return None
+        return int(self.dates[i])
+
+    def lookback_index(self, days: int) -> np.ndarray:
+        """每个交易日往前 days 个自然日（含当天往前第 days 天）以内最早的交易日序号"""
+        return np.searchsorted(self.ordinals, self.ordinals - days, side='left')
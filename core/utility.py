@@ -3,10 +3,13 @@
 各类常用的工具函数
 """
 
+import atexit
 import time
+import threading
 import colorlog  # 控制台日志输入颜色
 import logging
-from logging.handlers import RotatingFileHandler  # 按文件大小滚动备份
+from logging.handlers import RotatingFileHandler, MemoryHandler, QueueHandler, QueueListener  # 按文件大小滚动备份
+from queue import Queue
 from typing import Dict, Tuple, Union
 from decimal import Decimal
 from math import floor, ceil, isnan
@@ -20,14 +23,44 @@ import numpy as np
 import talib
 
 from .object import BarData
+from .indicator import (
+    StreamingSMA,
+    StreamingEMA,
+    StreamingSTD,
+    StreamingATR,
+    StreamingRSI,
+    StreamingMACD,
+    StreamingBoll
+)
 from .const import *
 
 log_formatter = logging.Formatter('[%(asctime)s] %(message)s')
 file_handlers: Dict[str, logging.FileHandler] = {}
+color_loggers: Dict[str, 'ColorLogger'] = {}      # 同一个日志文件只保留一个在运行的 ColorLogger
+
+
+class _FlushQueueListener(QueueListener):
+    """队列中遇到带 flush_event 的标记记录时，把各句柄的缓冲写出并通知等待的线程，标记记录本身不输出"""
+
+    def handle(self, record):
+        flush_event = getattr(record, 'flush_event', None)
+        if flush_event is None:
+            super().handle(record)
+            return
+        for handler in self.handlers:
+            handler.flush()
+        flush_event.set()
 
 
 class ColorLogger(object):
-    def __init__(self, log_name):
+    """
+    彩色日志，文件句柄、控制台句柄在创建时打开一次并一直保留
+    记录日志时只把 LogRecord 放入队列，由 QueueListener 后台线程写文件和控制台，不阻塞回测主循环
+    写文件经 MemoryHandler 缓冲，每 batch_size 条或出现 ERROR 级别日志时批量写入一次
+    info/debug/warning/error 支持 '{0}' 形式的参数，级别未开启时不做字符串格式化
+    """
+
+    def __init__(self, log_name, level='DEBUG', console=True, batch_size=256):
         self.logName = log_name
         self.log_colors_config = {
             'DEBUG': 'cyan',
@@ -36,8 +69,6 @@ class ColorLogger(object):
             'ERROR': 'red',
             'CRITICAL': 'red',
         }
-        self.logger = logging.getLogger()
-        self.logger.setLevel(logging.DEBUG)
         # self.formatter = colorlog.ColoredFormatter(
         #     '%(log_color)s[%(asctime)s] '
         #     '[%(filename)s:%(lineno)d] '
@@ -49,50 +80,89 @@ class ColorLogger(object):
             '[%(levelname)s]- %(message)s',
             log_colors=self.log_colors_config)  # 日志输出格式
 
+        if log_name in color_loggers:
+            color_loggers[log_name].close()
+        color_loggers[log_name] = self
+
+        # 使用RotatingFileHandler类，滚动备份日志，经 MemoryHandler 批量写入
+        self.file_handler = RotatingFileHandler(filename=log_name, mode='a', maxBytes=1024 * 1024 * 5, backupCount=5,
+                                                encoding='utf-8')
+        self.file_handler.setFormatter(self.formatter)
+        file_handlers[log_name] = self.file_handler
+        self.buffer_handler = MemoryHandler(capacity=batch_size, flushLevel=logging.ERROR, target=self.file_handler)
+        handlers = [self.buffer_handler]
+        # 创建一个StreamHandler,用于输出到控制台
+        if console:
+            self.console_handler = colorlog.StreamHandler()
+            self.console_handler.setFormatter(self.formatter)
+            handlers.append(self.console_handler)
+        else:
+            self.console_handler = None
+
+        self.queue = Queue(-1)
+        self.listener = _FlushQueueListener(self.queue, *handlers)
+        self.listener.start()
+        self.running = True
+
+        # 独立的 logger，不向 root logger 传递，避免日志输出重复
+        self.logger = logging.getLogger('ColorLogger.{0}'.format(log_name))
+        self.logger.propagate = False
+        for handler in self.logger.handlers[:]:
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(QueueHandler(self.queue))
+        self.set_level(level)
+        atexit.register(self.close)
+
+    def set_level(self, level):
+        """设置输出的等级，可以是 'DEBUG'、'INFO' 等字符串或 logging.DEBUG 等整数"""
+        if isinstance(level, str):
+            level = logging.getLevelName(level.upper())
+        self.logger.setLevel(level)
+
     def timestamp_to_time(self, timestamp):
         """格式化时间"""
         timeStruct = time.localtime(timestamp)
         return str(time.strftime('%Y-%m-%d', timeStruct))
 
-    def __console(self, level, message):
-        # 创建一个FileHandler，用于写到本地
-        fh = RotatingFileHandler(filename=self.logName, mode='a', maxBytes=1024 * 1024 * 5, backupCount=5,
-                                 encoding='utf-8')  # 使用RotatingFileHandler类，滚动备份日志
-        fh.setLevel(logging.DEBUG)
-        fh.setFormatter(self.formatter)
-        self.logger.addHandler(fh)
-
-        # 创建一个StreamHandler,用于输出到控制台
-        ch = colorlog.StreamHandler()
-        ch.setLevel(logging.DEBUG)
-        ch.setFormatter(self.formatter)
-        self.logger.addHandler(ch)
-
-        if level == 'info':
-            self.logger.info(message)
-        elif level == 'debug':
-            self.logger.debug(message)
-        elif level == 'warning':
-            self.logger.warning(message)
-        elif level == 'error':
-            self.logger.error(message)
-
-        # 这两行代码是为了避免日志输出重复问题
-        self.logger.removeHandler(ch)
-        self.logger.removeHandler(fh)
-        fh.close()  # 关闭打开的文件
-
-    def debug(self, message):
-        self.__console('debug', message)
-
-    def info(self, message):
-        self.__console('info', message)
-
-    def warning(self, message):
-        self.__console('warning', message)
-
-    def error(self, message):
-        self.__console('error', message)
+    def __console(self, level, message, args, kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        if args or kwargs:
+            message = message.format(*args, **kwargs)
+        self.logger.log(level, message)
+
+    def debug(self, message, *args, **kwargs):
+        self.__console(logging.DEBUG, message, args, kwargs)
+
+    def info(self, message, *args, **kwargs):
+        self.__console(logging.INFO, message, args, kwargs)
+
+    def warning(self, message, *args, **kwargs):
+        self.__console(logging.WARNING, message, args, kwargs)
+
+    def error(self, message, *args, **kwargs):
+        self.__console(logging.ERROR, message, args, kwargs)
+
+    def flush(self):
+        """放入一条标记记录并等待后台线程处理到它，此前的日志都已写入文件，后台线程不停止"""
+        if not self.running:
+            return
+        flush_event = threading.Event()
+        self.queue.put_nowait(logging.makeLogRecord({'flush_event': flush_event}))
+        flush_event.wait()
+
+    def close(self):
+        """停止后台线程，写完剩余的日志并关闭文件"""
+        if not self.running:
+            return
+        self.running = False
+        atexit.unregister(self.close)
+        self.listener.stop()
+        self.buffer_handler.close()
+        self.file_handler.close()
+        if color_loggers.get(self.logName) is self:
+            color_loggers.pop(self.logName)
+            file_handlers.pop(self.logName, None)
 
 
 class Logger(object):
@@ -128,17 +198,28 @@ class Logger(object):
         self.logger.addHandler(console)
         self.logger.removeHandler(file_handler)
 
-    def info(self, *message):
-        self.logger.info(message)
+    def __console(self, level, message, args, kwargs):
+        if not self.logger.isEnabledFor(level):
+            return
+        if args or kwargs:
+            message = message.format(*args, **kwargs)
+        self.logger.log(level, message)
 
-    def debug(self, *message):
-        self.logger.debug(message)
+    def info(self, message, *args, **kwargs):
+        self.__console(logging.INFO, message, args, kwargs)
 
-    def warning(self, *message):
-        self.logger.warning(message)
+    def debug(self, message, *args, **kwargs):
+        self.__console(logging.DEBUG, message, args, kwargs)
 
-    def error(self, *message):
-        self.logger.error(message)
+    def warning(self, message, *args, **kwargs):
+        self.__console(logging.WARNING, message, args, kwargs)
+
+    def error(self, message, *args, **kwargs):
+        self.__console(logging.ERROR, message, args, kwargs)
+
+    def flush(self):
+        for handler in self.logger.handlers + logging.getLogger().handlers:
+            handler.flush()
 
 
 class Timer(object):
@@ -227,7 +308,15 @@ def get_digits(value: float) -> int:
 
 
 class TimeSeriesContainer(object):
-    """时间序列数据容器及技术指标计算"""
+    """
+    时间序列数据容器及技术指标计算
+    开、高、低、收、量、持仓量六个序列放在一个 6 × 2size 的二维数组中作为环形缓冲区，每个值同时写在 head 和 head + size 两处，
+    最近 size 个值总是 data[:, head:head + size] 这段连续的视图，更新时不必整体左移数组，传给 TA-Lib 也不用复制
+    sma、ema、std、atr、rsi、macd、boll 只取最新值（array=False）时使用增量指标：凑满 size 根 bar（inited）之前返回 NaN，
+    之后第一次调用时用当时的整个窗口初始化，与 TA-Lib 对该窗口的结果相同，之后每次 update_bar 更新一次，不再对整个窗口重算 TA-Lib
+    sma、std、boll 只用最近 n 个值，与 TA-Lib 逐窗口的结果相同；ema、atr、rsi、macd 由全部历史递推，TA-Lib 对每个窗口重新初始化，
+    只有 size 不小于周期的 stream_min_ratio 倍时两者的差异才可忽略，窗口更短时仍对窗口计算 TA-Lib
+    """
 
     def __init__(self, size: int = 10):
         """Constructor"""
@@ -235,12 +324,10 @@ class TimeSeriesContainer(object):
         self.size: int = size
         self.inited: bool = False
 
-        self.open_array: np.ndarray = np.zeros(size)
-        self.high_array: np.ndarray = np.zeros(size)
-        self.low_array: np.ndarray = np.zeros(size)
-        self.close_array: np.ndarray = np.zeros(size)
-        self.volume_array: np.ndarray = np.zeros(size)
-        self.open_interest_array: np.ndarray = np.zeros(size)
+        self.data: np.ndarray = np.zeros((6, 2 * size))
+        self.head: int = 0      # 下一个 bar 写入的位置，也是当前窗口的起点
+        self.stream_min_ratio: int = 11     # 窗口长度不小于周期的这个倍数时，ema、atr、rsi、macd 才使用增量指标
+        self.streams: Dict[tuple, tuple] = {}     # {(指标名, 参数...): (增量指标, 输入序列的行号)}
 
     def update_bar(self, bar: BarData) -> None:
         """
@@ -250,75 +337,131 @@ class TimeSeriesContainer(object):
         if not self.inited and self.count >= self.size:
             self.inited = True
 
-        self.open_array[:-1] = self.open_array[1:]
-        self.high_array[:-1] = self.high_array[1:]
-        self.low_array[:-1] = self.low_array[1:]
-        self.close_array[:-1] = self.close_array[1:]
-        self.volume_array[:-1] = self.volume_array[1:]
-        self.open_interest_array[:-1] = self.open_interest_array[1:]
+        head = self.head
+        values = (bar.open, bar.high, bar.low, bar.close, bar.volume, bar.open_interest)
+        self.data[:, head] = values
+        self.data[:, head + self.size] = values
+        self.head = head + 1 if head + 1 < self.size else 0
+
+        for indicator, rows in self.streams.values():
+            indicator.update(*[values[r] for r in rows])
+
+    def update_bars(self, bars) -> None:
+        """一次写入一段历史 bar（按时间先后排列的 BarData 序列）"""
+        block = np.array([(bar.open, bar.high, bar.low, bar.close, bar.volume, bar.open_interest) for bar in bars],
+                         dtype=np.float64).reshape(-1, 6)
+        self.update_arrays(*block.T)
+
+    def update_arrays(self, open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                      volume: np.ndarray, open_interest: np.ndarray = None) -> None:
+        """一次写入一段历史序列，各数组等长、按时间先后排列，只有最后 size 个值会留在缓冲区中"""
+        n = len(close)
+        if n == 0:
+            return
+        if open_interest is None:
+            open_interest = np.zeros(n)
+        k = min(n, self.size)
+        block = np.vstack([np.asarray(a, dtype=np.float64)[n - k:]
+                           for a in (open_, high, low, close, volume, open_interest)])
+        pos = (self.head + np.arange(k)) % self.size
+        self.data[:, pos] = block
+        self.data[:, pos + self.size] = block
+        self.head = (self.head + k) % self.size
+
+        self.count += n
+        if not self.inited and self.count >= self.size:
+            self.inited = True
+
+        for key, (indicator, rows) in list(self.streams.items()):
+            if n >= self.size:
+                # 新数据覆盖了整个窗口，增量指标按新窗口重新初始化
+                self.streams.pop(key)
+                self._stream(key, type(indicator), rows, *key[1:])
+            else:
+                for values in block[list(rows)].T.tolist():
+                    indicator.update(*values)
 
-        self.open_array[-1] = bar.open
-        self.high_array[-1] = bar.high
-        self.low_array[-1] = bar.low
-        self.close_array[-1] = bar.close
-        self.volume_array[-1] = bar.volume
-        self.open_interest_array[-1] = bar.open_interest
+    def _window(self, row: int) -> np.ndarray:
+        return self.data[row, self.head:self.head + self.size]
+
+    def _stream(self, key: tuple, indicator_class, rows: tuple, *params):
+        """
+        取增量指标的当前值，第一次调用时新建并用窗口内的数据初始化
+        未凑满 size 根 bar 时窗口中还有补位的 0，不初始化，返回 NaN
+        """
+        if key not in self.streams:
+            indicator = indicator_class(*params)
+            if not self.inited:
+                return indicator.value
+            for values in self.data[list(rows), self.head:self.head + self.size].T.tolist():
+                indicator.update(*values)
+            self.streams[key] = (indicator, rows)
+        return self.streams[key][0].value
 
     @property
     def open(self) -> np.ndarray:
         """
         Get open price time series.
         """
-        return self.open_array
+        return self._window(0)
 
     @property
     def high(self) -> np.ndarray:
         """
         Get high price time series.
         """
-        return self.high_array
+        return self._window(1)
 
     @property
     def low(self) -> np.ndarray:
         """
         Get low price time series.
         """
-        return self.low_array
+        return self._window(2)
 
     @property
     def close(self) -> np.ndarray:
         """
         Get close price time series.
         """
-        return self.close_array
+        return self._window(3)
 
     @property
     def volume(self) -> np.ndarray:
         """
         Get trading order_volume time series.
         """
-        return self.volume_array
+        return self._window(4)
 
     @property
     def open_interest(self) -> np.ndarray:
         """
         Get trading order_volume time series.
         """
-        return self.open_interest_array
+        return self._window(5)
+
+    # 兼容原先的属性名
+    open_array = open
+    high_array = high
+    low_array = low
+    close_array = close
+    volume_array = volume
+    open_interest_array = open_interest
 
     def sma(self, n: int, array: bool = False) -> Union[float, np.ndarray]:
         """
         Simple moving average.
         """
-        result = talib.SMA(self.close, n)
-        if array:
-            return result
-        return result[-1]
+        if not array:
+            return self._stream(('sma', n), StreamingSMA, (3,), n)
+        return talib.SMA(self.close, n)
 
     def ema(self, n: int, array: bool = False) -> Union[float, np.ndarray]:
         """
         Exponential moving average.
         """
+        if not array and self.size >= self.stream_min_ratio * n:
+            return self._stream(('ema', n), StreamingEMA, (3,), n)
         result = talib.EMA(self.close, n)
         if array:
             return result
@@ -427,10 +570,9 @@ class TimeSeriesContainer(object):
         """
         Standard deviation.
         """
-        result = talib.STDDEV(self.close, n)
-        if array:
-            return result
-        return result[-1]
+        if not array:
+            return self._stream(('std', n), StreamingSTD, (3,), n)
+        return talib.STDDEV(self.close, n)
 
     def obv(self, n: int, array: bool = False) -> Union[float, np.ndarray]:
         """
@@ -454,6 +596,8 @@ class TimeSeriesContainer(object):
         """
         Average True Range (ATR).
         """
+        if not array and self.size >= self.stream_min_ratio * n:
+            return self._stream(('atr', n), StreamingATR, (1, 2, 3), n)
         result = talib.ATR(self.high, self.low, self.close, n)
         if array:
             return result
@@ -472,6 +616,8 @@ class TimeSeriesContainer(object):
         """
         Relative Strenght Index (RSI).
         """
+        if not array and self.size >= self.stream_min_ratio * n:
+            return self._stream(('rsi', n), StreamingRSI, (3,), n)
         result = talib.RSI(self.close, n)
         if array:
             return result
@@ -490,6 +636,9 @@ class TimeSeriesContainer(object):
         """
         MACD.
         """
+        if not array and self.size >= self.stream_min_ratio * (max(fast_period, slow_period) + signal_period):
+            return self._stream(('macd', fast_period, slow_period, signal_period), StreamingMACD, (3,),
+                                fast_period, slow_period, signal_period)
         macd, signal, hist = talib.MACD(
             self.close, fast_period, slow_period, signal_period
         )
@@ -581,6 +730,8 @@ class TimeSeriesContainer(object):
         """
         Bollinger Channel.
         """
+        if not array:
+            return self._stream(('boll', n, dev), StreamingBoll, (3,), n, dev)
         mid = self.sma(n, array)
         std = self.std(n, array)
 
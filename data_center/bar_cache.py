@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+行情数据仓（BarStore）的本地二进制缓存
+同一组 (数据表, 代码, 字段, 起止日期) 的行情第一次从数据库读取后，把 values / valid / dates 存成 .npy 文件，
+之后的回测用 np.load(mmap_mode='r') 直接映射打开，不再从 sqlite 逐行读取
+数据库文件（含 WAL 文件）的修改时间或大小变化后缓存自动失效
+"""
+import hashlib
+from json import dump, dumps, load
+from os import listdir, makedirs, path, replace, stat
+from shutil import rmtree
+
+import numpy as np
+
+from core.bar_store import BarStore
+
+
+class BarCache(object):
+    """
+    缓存目录下每个条目一个子目录，目录名为请求参数与数据表状态的摘要：
+    meta.json 记录请求参数、数据表状态、代码和字段，values.npy / valid.npy / dates.npy 为对应的数组
+    """
+
+    def __init__(self, root_path: str):
+        self.root_path = root_path      # 第一次写入缓存时才创建
+
+    @staticmethod
+    def request_key(tables: list, symbols: list, fields: list, start, end) -> str:
+        """请求参数的摘要，相同的请求得到相同的 key"""
+        text = '|'.join([','.join(tables), ','.join(symbols), ','.join(fields), str(start), str(end)])
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def table_stamp(conn, tables: list) -> dict:
+        """
+        数据库状态，任一变化即视为缓存失效，不扫描数据表：
+        数据库文件及其 WAL 文件的修改时间和大小，任何写入都会改变；内存数据库没有文件，用各表的最大 rowid
+        WAL 模式下只读查询也会建出空的 WAL 文件，空 WAL 文件与没有 WAL 文件视为同一状态
+        """
+        db_file = [row[2] for row in conn.execute('PRAGMA database_list') if row[1] == 'main'][0]
+        stamp = {}
+        if db_file:
+            for name, file_path in [('db', db_file), ('wal', db_file + '-wal')]:
+                if path.exists(file_path):
+                    file_stat = stat(file_path)
+                    if name == 'wal' and file_stat.st_size == 0:
+                        continue
+                    stamp[name] = [file_stat.st_mtime_ns, file_stat.st_size]
+        else:
+            for table_name in tables:
+                stamp[table_name] = conn.execute('select max(rowid) from {0}'.format(table_name)).fetchone()[0]
+        return stamp
+
+    def _entry_path(self, key: str, stamp: dict) -> str:
+        stamp_text = dumps(stamp, sort_keys=True)
+        stamp_key = hashlib.sha1(stamp_text.encode('utf-8')).hexdigest()[:8]
+        return path.join(self.root_path, key + '_' + stamp_key)
+
+    def load(self, key: str, stamp: dict):
+        """取缓存的行情数据仓，数组以只读内存映射方式打开；没有与当前数据表状态一致的缓存时返回 None"""
+        entry_path = self._entry_path(key, stamp)
+        meta_file = path.join(entry_path, 'meta.json')
+        if not path.exists(meta_file):
+            return None
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            meta = load(f)
+        if meta['stamp'] != stamp:
+            return None
+
+        values = np.load(path.join(entry_path, 'values.npy'), mmap_mode='r')
+        valid = np.load(path.join(entry_path, 'valid.npy'), mmap_mode='r')
+        dates = np.load(path.join(entry_path, 'dates.npy'))
+        return BarStore(meta['symbols'], dates, meta['fields'], values, valid)
+
+    def save(self, key: str, stamp: dict, store: BarStore, request: dict = None):
+        """写入缓存，meta.json 最后写入，作为条目完整的标志；同一请求失效的旧条目一并删除"""
+        entry_path = self._entry_path(key, stamp)
+        makedirs(entry_path, exist_ok=True)
+        np.save(path.join(entry_path, 'values.npy'), np.ascontiguousarray(store.values))
+        np.save(path.join(entry_path, 'valid.npy'), np.ascontiguousarray(store.valid))
+        np.save(path.join(entry_path, 'dates.npy'), store.dates)
+
+        meta = {
+            'request': request or {},
+            'stamp': stamp,
+            'symbols': store.symbols,
+            'fields': store.fields
+        }
+        tmp_file = path.join(entry_path, 'meta.json.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            dump(meta, f, ensure_ascii=False)
+        replace(tmp_file, path.join(entry_path, 'meta.json'))
+
+        for name in listdir(self.root_path):
+            stale_path = path.join(self.root_path, name)
+            if name.startswith(key + '_') and stale_path != entry_path:
+                # 其他进程仍在映射旧文件时（windows）删除会失败，留待下次清理
+                rmtree(stale_path, ignore_errors=True)
+
+    def clear(self):
+        """删除全部缓存"""
+        if not path.isdir(self.root_path):
+            return
+        for name in listdir(self.root_path):
+            rmtree(path.join(self.root_path, name), ignore_errors=True)
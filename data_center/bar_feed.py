@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+流式行情推送：各数据源为每个代码提供一个按时间升序的 bar 迭代器，BarFeed 用 heapq.merge 归并，
+按时间逐个产出 (timetag, 该时刻全部代码的 bar)，只要有一个代码有 bar 的时刻都会推送，不依赖 benchmark 的时间轴
+数据源可以是 sqlite 游标、BarStore（含 BarCache 内存映射缓存、LazyBarStore）、MinuteBarStore 分区文件、mongodb 游标，
+都是边读边推送，不需要预先把数据全部读入内存
+BarStoreFeed 直接按日期推送 BarStore 的只读视图，某个代码的字段值在取用时才读取，是回测默认的日线推送
+"""
+from collections.abc import Mapping
+from heapq import merge
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from core.bar_store import BarStore
+from data_center.minute_bar_store import MinuteBarStore, minute_fields
+
+
+def _tag(k: int, stream):
+    """给一个代码的 bar 迭代器加上序号，timetag 相同时按数据源、代码的顺序归并"""
+    for timetag, symbol, values in stream:
+        yield timetag, k, symbol, values
+
+
+class BarSource(object):
+    """数据源基类，streams() 返回各代码的迭代器，每个迭代器按 timetag 升序产出 (timetag, 代码, 字段值 tuple)"""
+
+    def __init__(self, symbols: Sequence[str], fields: Sequence[str]):
+        self.symbols = list(symbols)
+        self.fields = list(fields)
+
+    def streams(self) -> List[Iterator[tuple]]:
+        return [self.stream(symbol) for symbol in self.symbols]
+
+    def stream(self, symbol: str) -> Iterator[tuple]:
+        raise NotImplementedError
+
+
+class SqliteCursorSource(BarSource):
+    """sqlite 日线行情表，每个代码一个游标，按 fetchmany 逐批读取"""
+
+    def __init__(self, conn, symbols: Sequence[str], fields: Sequence[str], start: int, end: int,
+                 table_name: str = 'ASHAREEODPRICES', fetch_size: int = 5000):
+        super().__init__(symbols, fields)
+        self.conn = conn
+        self.start = start
+        self.end = end
+        self.table_name = table_name
+        self.fetch_size = fetch_size
+
+    def stream(self, symbol: str):
+        get_data_sql = 'select trade_dt,{0} from {1} where s_info_windcode=? and trade_dt>=? and trade_dt<=? ' \
+                       'order by trade_dt'.format(','.join(['s_dq_' + i for i in self.fields]), self.table_name)
+        cur = self.conn.execute(get_data_sql, [symbol, self.start, self.end])
+        while True:
+            rows = cur.fetchmany(self.fetch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield int(row[0]), symbol, row[1:]
+
+
+class BarStoreSource(BarSource):
+    """
+    BarStore 中的有效 bar，每个代码按 chunk_size 个交易日分段读取，LazyBarStore 的非常驻字段推送到时才从数据库取
+    fields 为空时只读 valid 判断哪些日期有 bar，推送的字段值为空 tuple，可以只用来推动时间
+    """
+
+    def __init__(self, bar_store: BarStore, symbols: Sequence[str] = None, fields: Sequence[str] = None,
+                 start: int = 0, end: int = 0, chunk_size: int = 250):
+        super().__init__(bar_store.symbols if symbols is None else symbols,
+                         bar_store.fields if fields is None else fields)
+        self.bar_store = bar_store
+        self.start = start
+        self.end = end
+        self.chunk_size = chunk_size
+
+    def stream(self, symbol: str):
+        store = self.bar_store
+        si = store.symbol_index.get(symbol)
+        if si is None:
+            return
+        i0 = int(np.searchsorted(store.dates, self.start, side='left')) if self.start else 0
+        i1 = int(np.searchsorted(store.dates, self.end, side='right')) if self.end else len(store.dates)
+        for c0 in range(i0, i1, self.chunk_size):
+            c1 = min(c0 + self.chunk_size, i1)
+            di = c0 + np.flatnonzero(store.valid[si, c0:c1])
+            if len(di) == 0:
+                continue
+            timetags = store.dates[di].tolist()
+            if not self.fields:
+                for timetag in timetags:
+                    yield timetag, symbol, ()
+                continue
+            columns = [store._row(store.field_index[fd], si, c0, c1)[di - c0] for fd in self.fields]
+            for timetag, row in zip(timetags, np.column_stack(columns).tolist()):
+                yield timetag, symbol, tuple(row)
+
+
+class MinuteStoreSource(BarSource):
+    """MinuteBarStore 中的分钟 bar，按块读取内存映射的分区文件"""
+
+    def __init__(self, minute_store: MinuteBarStore, symbols: Sequence[str], fields: Sequence[str] = None,
+                 start: int = 0, end: int = 0):
+        super().__init__(symbols, ['open', 'high', 'low', 'close', 'volume'] if fields is None else fields)
+        self.minute_store = minute_store
+        self.start = start
+        self.end = end
+
+    def stream(self, symbol: str):
+        for chunk in self.minute_store.iter_chunks(symbol, self.start, self.end):
+            values = np.column_stack([chunk[fd] for fd in self.fields]).tolist()
+            for timetag, row in zip(chunk['timetag'].tolist(), values):
+                yield timetag, symbol, tuple(row)
+
+
+class MinuteReplayFeed(object):
+    """
+    MinuteBarStore.replay 分块归并后按分钟推送，迭代产出 (timetag, {代码: 字段值 tuple})，用法与 BarFeed 相同
+    各代码的分钟 bar 已在 replay 中向量化归并，比 MinuteStoreSource 逐个 bar 经 heapq.merge 归并快，内存中只有每个代码的一块
+    """
+
+    def __init__(self, minute_store: MinuteBarStore, symbols: Sequence[str], start: int = 0, end: int = 0,
+                 fields: Sequence[str] = None, chunk_size: int = None):
+        self.minute_store = minute_store
+        self.symbols = list(symbols)
+        self.start = start
+        self.end = end
+        self.fields = minute_fields if fields is None else [fd for fd in fields if fd in minute_fields]
+        self.chunk_size = chunk_size
+
+    def __iter__(self) -> Iterator[Tuple[int, Dict[str, tuple]]]:
+        symbols = self.symbols
+        for chunk in self.minute_store.replay(symbols, self.start, self.end, self.chunk_size):
+            rows = np.column_stack([chunk[fd] for fd in self.fields]).tolist()
+            merged = zip(chunk['timetag'].tolist(), chunk['symbol'].tolist(), rows)
+            # replay 不会把同一个 timetag 的 bar 拆到两块中
+            for timetag, group in groupby(merged, key=itemgetter(0)):
+                yield timetag, {symbols[k]: tuple(row) for _, k, row in group}
+
+
+class MongoCursorSource(BarSource):
+    """mongodb 行情库，每个代码一个集合，游标按 timetag 排序"""
+
+    def __init__(self, db, symbols: Sequence[str], fields: Sequence[str], start: int, end: int,
+                 batch_size: int = 5000):
+        super().__init__(symbols, fields)
+        self.db = db
+        self.start = start
+        self.end = end
+        self.batch_size = batch_size
+
+    def stream(self, symbol: str):
+        query = {"timetag": {"$gte": self.start, "$lte": self.end}}
+        colum = {"_id": 0, "timetag": 1}
+        for fd in self.fields:
+            colum[fd] = 1
+        cursor = self.db[symbol].find(query, colum, batch_size=self.batch_size).sort('timetag', 1)
+        for doc in cursor:
+            yield int(doc['timetag']), symbol, tuple(doc.get(fd, np.nan) for fd in self.fields)
+
+
+class BarFeed(object):
+    """
+    多个数据源的 bar 按时间归并，迭代产出 (timetag, {代码: 字段值 tuple})，字段顺序为 fields
+    各数据源的字段须相同；同一时刻同一代码出现在多个数据源中时以后面的数据源为准
+    """
+
+    def __init__(self, sources: Sequence[BarSource]):
+        self.sources = list(sources)
+        self.fields = self.sources[0].fields if self.sources else []
+
+    def __iter__(self) -> Iterator[Tuple[int, Dict[str, tuple]]]:
+        streams = [stream for source in self.sources for stream in source.streams()]
+        merged = merge(*[_tag(k, stream) for k, stream in enumerate(streams)], key=itemgetter(0, 1))
+        for timetag, group in groupby(merged, key=itemgetter(0)):
+            yield timetag, {symbol: values for _, _, symbol, values in group}
+
+
+class BarSnapshot(Mapping):
+    """BarStore 某一日全部有效 bar 的只读视图，用法与 {代码: 字段值 tuple} 相同，取某个代码时才读取其字段值"""
+
+    def __init__(self, bar_store: BarStore, di: int, field_ids: List[int]):
+        self.bar_store = bar_store
+        self.di = di
+        self.field_ids = field_ids
+        self._symbols = None
+
+    def _valid_symbols(self) -> List[str]:
+        if self._symbols is None:
+            store = self.bar_store
+            self._symbols = [store.symbols[si] for si in np.flatnonzero(store.valid[:, self.di]).tolist()]
+        return self._symbols
+
+    def __getitem__(self, symbol: str) -> tuple:
+        store = self.bar_store
+        si = store.symbol_index.get(symbol)
+        if si is None or not store.valid[si, self.di]:
+            raise KeyError(symbol)
+        return tuple(float(store._cell(fi, si, self.di)) for fi in self.field_ids)
+
+    def __contains__(self, symbol) -> bool:
+        si = self.bar_store.symbol_index.get(symbol)
+        return si is not None and bool(self.bar_store.valid[si, self.di])
+
+    def __iter__(self):
+        return iter(self._valid_symbols())
+
+    def __len__(self) -> int:
+        return len(self._valid_symbols())
+
+
+class BarStoreFeed(object):
+    """
+    按日期推送 BarStore 中任一代码有 bar 的日期，迭代产出 (timetag, BarSnapshot)，用法与 BarFeed 相同
+    不预先读取字段值，LazyBarStore 的非常驻字段只在策略取用某个代码时才读取
+    """
+
+    def __init__(self, bar_store: BarStore, fields: Sequence[str] = None, start: int = 0, end: int = 0):
+        self.bar_store = bar_store
+        self.fields = list(bar_store.fields if fields is None else fields)
+        self.start = start
+        self.end = end
+
+    def __iter__(self) -> Iterator[Tuple[int, BarSnapshot]]:
+        store = self.bar_store
+        field_ids = [store.field_index[fd] for fd in self.fields]
+        i0 = int(np.searchsorted(store.dates, self.start, side='left')) if self.start else 0
+        i1 = int(np.searchsorted(store.dates, self.end, side='right')) if self.end else len(store.dates)
+        for di in (i0 + np.flatnonzero(store.valid[:, i0:i1].any(axis=0))).tolist():
+            yield int(store.dates[di]), BarSnapshot(store, di, field_ids)
+
+
+def is_intraday(timetag: int) -> bool:
+    """YYYYMMDDHHMM 形式的日内 timetag，YYYYMMDD 形式的日期返回 False"""
+    return timetag >= 10 ** 10
+
+
+def daily_batches(feed) -> Iterator[tuple]:
+    """
+    把推送按交易日分组：日线 timetag 原样产出 (日期, 该日的 bar)；
+    分钟等日内 timetag（YYYYMMDDHHMM）把同一天的推送收集起来，产出 (日期, [(timetag, 该时刻的 bar), ...])
+    """
+    day = None
+    bars = []
+    for timetag, batch in feed:
+        if not is_intraday(timetag):
+            if bars:
+                yield day, bars
+                day, bars = None, []
+            yield timetag, batch
+            continue
+        date = timetag // 10000
+        if date != day and bars:
+            yield day, bars
+            bars = []
+        day = date
+        bars.append((timetag, batch))
+    if bars:
+        yield day, bars
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+把 sqlite 中的日线行情表导出为按年分区的 parquet 文件，供 GetArrowData 使用（需安装 pyarrow）
+目录结构为 arrow_path/表名/year=YYYY/part-0.parquet，每年内按 (代码, 日期) 排序，
+读取时按年分区裁剪文件，按 row group 的代码、日期统计信息跳过不相关的数据块
+除权除息表数据量小，不分区，整表导出为 arrow_path/表名/part-0.parquet
+"""
+import sqlite3
+from os import makedirs, path
+
+from pandas import read_sql
+
+from core.const import SqliteDbName
+
+# 导出的日线行情表及字段，列名统一为小写
+arrow_tables = ['ASHAREEODPRICES', 'AINDEXEODPRICES']
+arrow_fields = ['s_info_windcode', 'trade_dt', 's_dq_preclose', 's_dq_open', 's_dq_high', 's_dq_low', 's_dq_close',
+                's_dq_change', 's_dq_pctchange', 's_dq_volume', 's_dq_amount']
+
+# 导出的除权除息表及字段，回测中按除权除息日调整未成交委托的价格、数量
+ex_rights_table = 'AShareEXRightDividendRecord'
+ex_rights_fields = ['s_info_windcode', 'ex_date', 'cash_dividend_ratio', 'bonus_share_ratio', 'rightsissue_ratio',
+                    'rightsissue_price', 'conversed_ratio']
+
+
+def sqlite_to_arrow(db_path: str, arrow_path: str, tables: list = None, row_group_size: int = 50000):
+    """逐年从 sqlite 读出日线行情写入 parquet 分区，每次只在内存中保留一年的数据"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if tables is None:
+        tables = arrow_tables
+    cx = sqlite3.connect(db_path)
+    for table_name in tables:
+        min_date, max_date = cx.execute('select min(cast(trade_dt as integer)), max(cast(trade_dt as integer)) '
+                                        'from {0}'.format(table_name)).fetchone()
+        if min_date is None:
+            continue
+        columns = [row[1].lower() for row in cx.execute('pragma table_info({0})'.format(table_name))]
+        fields = [fd for fd in arrow_fields if fd in columns]
+        for year in range(min_date // 10000, max_date // 10000 + 1):
+            sql = 'select {0} from {1} where trade_dt>=? and trade_dt<=? ' \
+                  'order by s_info_windcode, trade_dt'.format(','.join(fields), table_name)
+            data = read_sql(sql, cx, params=[year * 10000 + 101, year * 10000 + 1231])
+            if len(data) == 0:
+                continue
+            data.columns = [c.lower() for c in data.columns]
+            data['trade_dt'] = data['trade_dt'].astype('int64')
+            for fd in fields[2:]:
+                data[fd] = data[fd].astype('float64')
+
+            part_path = path.join(arrow_path, table_name, 'year={0}'.format(year))
+            makedirs(part_path, exist_ok=True)
+            pq.write_table(pa.Table.from_pandas(data, preserve_index=False),
+                           path.join(part_path, 'part-0.parquet'),
+                           row_group_size=row_group_size)
+            print('{0} {1} 年数据导出完毕，共 {2} 条'.format(table_name, year, len(data)))
+    cx.close()
+
+
+def ex_rights_to_arrow(db_path: str, arrow_path: str, table_name: str = ex_rights_table):
+    """把除权除息表整表导出为一个 parquet 文件，除权除息日转为整数"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    cx = sqlite3.connect(db_path)
+    sql = 'select {0} from {1} where ex_date is not null and ex_date != \'\' ' \
+          'order by s_info_windcode, ex_date'.format(','.join(ex_rights_fields), table_name)
+    data = read_sql(sql, cx)
+    cx.close()
+    data.columns = [c.lower() for c in data.columns]
+    data['ex_date'] = data['ex_date'].astype('int64')
+    for fd in ex_rights_fields[2:]:
+        data[fd] = data[fd].astype('float64')
+
+    part_path = path.join(arrow_path, table_name)
+    makedirs(part_path, exist_ok=True)
+    pq.write_table(pa.Table.from_pandas(data, preserve_index=False), path.join(part_path, 'part-0.parquet'))
+    print('{0} 导出完毕，共 {1} 条'.format(table_name, len(data)))
+
+
+if __name__ == '__main__':
+    db_path = 'D:/python projects/quandomo/data_center/data/' + SqliteDbName.DB.value
+    arrow_path = 'D:/python projects/quandomo/data_center/data/arrow/'
+    sqlite_to_arrow(db_path, arrow_path)
+    ex_rights_to_arrow(db_path, arrow_path)
@@ -3,9 +3,18 @@
 将从 wd 数据库取到并保存到本地的 csv 数据保存入本地 sqlite 数据库中
 """
 import sqlite3
-from os import listdir
-from pandas import read_table
-from const import *
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha1
+from io import BytesIO
+from json import load, dump
+from os import listdir, path, replace
+from queue import Queue
+from threading import Thread
+from time import time
+
+import numpy as np
+from pandas import read_table, read_csv
+from core.const import SqliteDbName
 
 unique_keys = {
     'AINDEXEODPRICES': 'S_INFO_WINDCODE,TRADE_DT',
@@ -23,14 +32,127 @@ unique_keys = {
     'SWINDEXMEMBERS': 'S_INFO_WINDCODE,S_CON_INDATE'
 }
 
+# 日线行情表：typed 模式下建 (代码, 日期)、(日期, 代码) 两个覆盖索引，回测的区间查询只需扫描索引
+eod_tables = ['AINDEXEODPRICES', 'ASHAREEODPRICES', 'ASWSINDEXEOD']
+eod_covering_fields = ['S_DQ_OPEN', 'S_DQ_HIGH', 'S_DQ_LOW', 'S_DQ_CLOSE', 'S_DQ_VOLUME']
+
+# typed 模式下声明为 INTEGER 的日期字段
+date_fields = ['TRADE_DT', 'TRADE_DAYS', 'ANN_DT', 'REPORT_PERIOD', 'CHANGE_DT', 'EX_DATE',
+               'S_CON_INDATE', 'S_CON_OUTDATE', 'S_PROFITNOTICE_DATE', 'S_PROFITNOTICE_PERIOD']
+
+# typed 模式下不论源数据类型都声明为 REAL 的数值字段：日线行情、估值字段，除权除息比例、价格字段
+# 逐个列出，S_DQ_TRADESTATUS 等同前缀的文本字段不在其中，仍按源数据类型建表
+real_fields = ['S_DQ_PRECLOSE', 'S_DQ_OPEN', 'S_DQ_HIGH', 'S_DQ_LOW', 'S_DQ_CLOSE', 'S_DQ_CHANGE', 'S_DQ_PCTCHANGE',
+               'S_DQ_VOLUME', 'S_DQ_AMOUNT', 'S_DQ_ADJPRECLOSE', 'S_DQ_ADJOPEN', 'S_DQ_ADJHIGH', 'S_DQ_ADJLOW',
+               'S_DQ_ADJCLOSE', 'S_DQ_ADJFACTOR', 'S_DQ_AVGPRICE', 'S_DQ_MV', 'S_VAL_MV', 'S_VAL_PE', 'S_VAL_PB',
+               'CASH_DIVIDEND_RATIO', 'BONUS_SHARE_RATIO', 'RIGHTSISSUE_RATIO', 'RIGHTSISSUE_PRICE',
+               'CONVERSED_RATIO', 'SEO_PRICE', 'SEO_RATIO']
+
+# typed 模式下写入时的 sqlite 参数
+sqlite_pragmas = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -262144,          # 负值单位为 KB，即 256MB
+    'mmap_size': 1073741824         # 1GB
+}
+
+
+def set_pragmas(cx):
+    """设置 WAL 等写入/查询参数"""
+    for key, value in sqlite_pragmas.items():
+        cx.execute('PRAGMA {0}={1}'.format(key, value))
+
+
+def column_type(column: str, dtype, typed: bool = False) -> str:
+    """
+    由 pandas 推断的字段类型得到建表时的字段类型
+    typed 模式下日期字段固定为 INTEGER，行情、估值等数值字段（见 real_fields）固定为 REAL，
+    源数据中是 VARCHAR 的也一样，不再依赖首批数据的类型推断
+    """
+    dtype = str(dtype)
+    if typed:
+        if column.upper() in date_fields:
+            return 'INTEGER'
+        elif column.upper() in real_fields:
+            return 'REAL'
+        elif 'int' in dtype[:3]:
+            return 'INTEGER'
+        elif 'float' in dtype:
+            return 'REAL'
+        else:
+            return 'TEXT'
+
+    if 'int' in dtype[:3]:
+        return 'INT'
+    elif 'float' in dtype:
+        return 'FLOAT'
+    elif 'object' in dtype:
+        return 'VARCHAR(255)'
+    elif 'datetime' in dtype:
+        return 'DATETIME'
+    else:
+        return 'VARCHAR(255)'
+
+
+def create_table_sql(table_name: str, chunk, typed: bool = False) -> str:
+    """按首批数据的字段及类型，生成新建与文件同名的表的 sql"""
+    types = chunk.dtypes
+    tables = ','.join([item + ' ' + column_type(item, types[item], typed) for item in chunk.columns.tolist()])
+    return 'CREATE TABLE IF NOT EXISTS {0}' \
+           '(id0 INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,{1},UNIQUE({2}));'.format(table_name,
+                                                                                      tables,
+                                                                                      unique_keys[table_name])
 
-def data_to_sqlite(root_path, sub_path, db_name):
-    """将市场数据写入 sqlite 数据库中"""
+
+def create_eod_indexes(cx, table_name: str):
+    """为日线行情表建 (代码, 日期) 与 (日期, 代码) 两个覆盖索引，并更新查询优化器的统计信息"""
+    columns = [row[1].upper() for row in cx.execute('PRAGMA table_info({0})'.format(table_name))]
+    covering = [fd for fd in eod_covering_fields if fd in columns]
+    covering_str = ''.join([',' + fd for fd in covering])
+    cx.execute('CREATE INDEX IF NOT EXISTS idx_{0}_code_dt ON {0}(S_INFO_WINDCODE,TRADE_DT{1})'.format(
+        table_name, covering_str))
+    cx.execute('CREATE INDEX IF NOT EXISTS idx_{0}_dt_code ON {0}(TRADE_DT,S_INFO_WINDCODE{1})'.format(
+        table_name, covering_str))
+    cx.execute('ANALYZE {0}'.format(table_name))
+    cx.commit()
+
+
+def convert_to_typed_table(cx, table_name: str):
+    """将已有的表按 typed 模式的字段类型重建（日期转为 INTEGER，价格转为 REAL），日线行情表同时建覆盖索引"""
+    table_info = [row for row in cx.execute('PRAGMA table_info({0})'.format(table_name)) if row[1] != 'id0']
+    dtypes = {'INT': 'int64', 'INTEGER': 'int64', 'FLOAT': 'float64', 'REAL': 'float64'}
+    types = [column_type(row[1], dtypes.get(row[2].upper(), 'object'), typed=True) for row in table_info]
+    table = [row[1] + ' ' + tp for row, tp in zip(table_info, types)]
+    fields = ','.join([row[1] for row in table_info])
+    # 原来是 TEXT 的数值字段按新字段的类型转换，空字符串转为 NULL
+    select_fields = ','.join(['CAST(NULLIF({0}, \'\') AS {1})'.format(row[1], tp) if tp in ('INTEGER', 'REAL')
+                              else row[1] for row, tp in zip(table_info, types)])
+
+    # 数据换到新表后删除旧表，新表改回原来的名字
+    cx.execute('CREATE TABLE {0}_typed(id0 INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,{1},UNIQUE({2}))'.format(
+        table_name, ','.join(table), unique_keys[table_name]))
+    cx.execute('INSERT INTO {0}_typed({1}) SELECT {2} FROM {0}'.format(table_name, fields, select_fields))
+    cx.execute('DROP TABLE {0}'.format(table_name))
+    cx.execute('ALTER TABLE {0}_typed RENAME TO {0}'.format(table_name))
+    cx.commit()
+
+    if table_name in eod_tables:
+        create_eod_indexes(cx, table_name)
+
+
+def data_to_sqlite(root_path, sub_path, db_name, typed=False):
+    """
+    将市场数据写入 sqlite 数据库中
+    typed 为 True 时：日期字段建为 INTEGER、价格字段建为 REAL，开启 WAL，日线行情表导入后建覆盖索引并 ANALYZE
+    """
 
     files = listdir(root_path + sub_path)
     if len(files) > 0:
         try:
             cx = sqlite3.connect(root_path + db_name)
+            if typed:
+                set_pragmas(cx)
             cur = cx.cursor()
             print('数据库 {0} 连接成功！'.format(db_name))
             print(' ')
@@ -50,31 +172,10 @@ def data_to_sqlite(root_path, sub_path, db_name):
                         cnt = 0
                         for chunk in data:      # 取第一批数据时新建表、设定表属性
                             if cnt < 1:
-                                columns = chunk.columns.tolist()
-                                types = chunk.dtypes
-                                field = []  # 用来接收字段名称的列表
-                                table = []  # 用来接收字段名称和字段类型的列表
-                                for item in columns:
-                                    if 'int' in str(types[item])[:3]:
-                                        char = item + ' INT'
-                                    elif 'float' in str(types[item]):
-                                        char = item + ' FLOAT'
-                                    elif 'object' in str(types[item]):
-                                        char = item + ' VARCHAR(255)'
-                                    elif 'datetime' in str(types[item]):
-                                        char = item + ' DATETIME'
-                                    else:
-                                        char = item + ' VARCHAR(255)'
-                                    table.append(char)
-                                    field.append(item)
-                                tables = ','.join(table)
-                                fields = ','.join(field)
+                                fields = ','.join(chunk.columns.tolist())
 
                                 # 新建与文件同名的表
-                                table_sql = 'CREATE TABLE IF NOT EXISTS {0}' \
-                                            '(id0 INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,{1},UNIQUE({2}));'. \
-                                    format(file_name, tables, unique_keys[file_name])
-                                cur.execute(table_sql)
+                                cur.execute(create_table_sql(file_name, chunk, typed))
                                 cx.commit()
 
                                 print('数据库 {0} 中表 {1} 已创建'.format(db_name, file_name))
@@ -86,11 +187,225 @@ def data_to_sqlite(root_path, sub_path, db_name):
                             insert_sql = 'insert or ignore into {0}({1}) values({2})'.format(file_name, fields, s)
                             cur.executemany(insert_sql, values)
                             cx.commit()
+                        if typed and file_name in eod_tables:
+                            create_eod_indexes(cx, file_name)
                         print('数据库 {0} 中表 {1} 数据导入完成'.format(db_name, file_name))
             # cur.close()
             # cx.close()
 
 
+def scan_chunk_offsets(file_path: str, start_offset: int = 0, chunksize: int = 100000, block_size: int = 1 << 22):
+    """
+    扫描 csv 文件的换行位置，按每 chunksize 行切分成 (起始字节, 字节长度) 的数据块
+    只统计引号外的换行，最后一个换行之后的不完整行不计入（文件可能仍在写入）
+    返回 (表头字节, 数据块列表, 已完整扫描到的字节位置)
+    """
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        offset = max(start_offset, len(header))
+        f.seek(offset)
+
+        chunks = []
+        chunk_start = offset
+        last_end = offset
+        line_cnt = 0
+        quote_parity = 0
+        position = offset
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            buf = np.frombuffer(block, dtype=np.uint8)
+            quotes = np.cumsum(buf == 34) + quote_parity        # 34: '"'
+            ends = np.flatnonzero((buf == 10) & (quotes % 2 == 0)) + position + 1     # 10: '\n'
+            quote_parity = int(quotes[-1]) % 2
+            position += len(block)
+            if len(ends) > 0:
+                last_end = int(ends[-1])
+
+            # 每满 chunksize 行切出一个数据块
+            while line_cnt + len(ends) >= chunksize:
+                chunk_end = int(ends[chunksize - line_cnt - 1])
+                chunks.append((chunk_start, chunk_end - chunk_start))
+                ends = ends[chunksize - line_cnt:]
+                chunk_start = chunk_end
+                line_cnt = 0
+            line_cnt += len(ends)
+
+        if last_end > chunk_start:
+            chunks.append((chunk_start, last_end - chunk_start))
+    return header, chunks, last_end
+
+
+def parse_csv_chunk(file_path: str, header: bytes, offset: int, length: int):
+    """在子进程中读取并解析一个数据块，返回 DataFrame"""
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    return read_csv(BytesIO(header + data), sep=',', encoding='gbk', low_memory=False)
+
+
+def prefix_sha1(file_path: str, length: int, block_size: int = 1 << 22) -> str:
+    """文件前 length 个字节的 sha1"""
+    digest = sha1()
+    with open(file_path, 'rb') as f:
+        while length > 0:
+            block = f.read(min(block_size, length))
+            if not block:
+                break
+            digest.update(block)
+            length -= len(block)
+    return digest.hexdigest()
+
+
+class SqliteWriter(Thread):
+    """
+    唯一的写入线程：按提交顺序取出解析好的数据块，以大事务批量写入
+    每次提交事务后，将已写入的文件偏移量、文件修改时间记录到 manifest 中，中断后重新运行只导入新增部分；
+    全部写完后再记录已导入部分的 sha1，文件被改写（而不只是追加）时据此从头导入
+    """
+
+    def __init__(self, db_path: str, manifest: dict, manifest_path: str, typed: bool = False,
+                 commit_rows: int = 1000000, max_pending: int = 8):
+        super().__init__()
+        self.db_path = db_path
+        self.manifest = manifest
+        self.manifest_path = manifest_path
+        self.typed = typed
+        self.commit_rows = commit_rows
+        self.queue = Queue(maxsize=max_pending)
+        self.error = None
+        self.row_count = {}
+
+    def run(self):
+        cx = sqlite3.connect(self.db_path)
+        if self.typed:
+            set_pragmas(cx)
+        created = set()
+        pending = {}
+        touched = {}        # {表名: csv 文件路径}，本次导入过的文件
+        rows_in_txn = 0
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:      # 出错后只消费队列，不再写入，避免主线程阻塞
+                continue
+
+            file_name, future, end_offset, file_size, file_mtime, csv_path, overwrite = item
+            try:
+                chunk = future.result()
+                if file_name not in created:
+                    cx.execute(create_table_sql(file_name, chunk, self.typed))
+                    created.add(file_name)
+                # 改写过的文件从头导入时，主键相同的记录以新内容为准
+                insert_sql = 'insert or {0} into {1}({2}) values({3})'.format(
+                    'replace' if overwrite else 'ignore',
+                    file_name, ','.join(chunk.columns.tolist()), ','.join(['?'] * len(chunk.columns)))
+                cx.executemany(insert_sql, chunk.itertuples(index=False, name=None))
+
+                self.row_count[file_name] = self.row_count.get(file_name, 0) + len(chunk)
+                pending[file_name] = {'offset': end_offset, 'size': file_size, 'mtime': file_mtime, 'sha1': None}
+                touched[file_name] = csv_path
+                rows_in_txn += len(chunk)
+                if rows_in_txn >= self.commit_rows:
+                    self._commit(cx, pending)
+                    rows_in_txn = 0
+            except BaseException as e:
+                self.error = e
+
+        if self.error is None:
+            self._commit(cx, pending)
+            for file_name, csv_path in touched.items():
+                entry = self.manifest[file_name]
+                entry['sha1'] = prefix_sha1(csv_path, entry['offset'])
+            save_manifest(self.manifest, self.manifest_path)
+            if self.typed:
+                for file_name in created:
+                    if file_name in eod_tables:
+                        create_eod_indexes(cx, file_name)
+        cx.close()
+
+    def _commit(self, cx, pending: dict):
+        cx.commit()
+        self.manifest.update(pending)
+        pending.clear()
+        save_manifest(self.manifest, self.manifest_path)
+
+
+def load_manifest(manifest_path: str) -> dict:
+    if path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return load(f)
+    return {}
+
+
+def save_manifest(manifest: dict, manifest_path: str):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        dump(manifest, f, indent=2)
+    replace(tmp_path, manifest_path)
+
+
+def data_to_sqlite_parallel(root_path, sub_path, db_name, typed=False, workers=None, chunksize=100000,
+                            commit_rows=1000000):
+    """
+    多进程解析 csv、单线程写入 sqlite 的导入流程，可断点续传
+    已导入到的文件字节偏移量保存在 sub_path 目录下的 ingest_manifest.json 中，重新运行时只导入新增的行；
+    文件修改时间变化时先核对已导入部分的 sha1，不一致（文件被重新生成）则从头导入
+    """
+    file_path = root_path + sub_path
+    files = [file for file in listdir(file_path) if file.split('.')[-1] in ['csv']]      # 只处理 .csv 文件
+    if len(files) == 0:
+        return {}
+
+    manifest_path = file_path + 'ingest_manifest.json'
+    manifest = load_manifest(manifest_path)
+    writer = SqliteWriter(root_path + db_name, manifest, manifest_path, typed, commit_rows)
+    writer.start()
+
+    t0 = time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # 提交过程中出错时也要让写入线程收到结束标记并退出，否则进程会一直等待写入线程
+        try:
+            for file in files:
+                file_name = file.split('.')[0]
+                file_size = path.getsize(file_path + file)
+                file_mtime = path.getmtime(file_path + file)
+                entry = manifest.get(file_name, {})
+                done = entry.get('offset', 0)
+                overwrite = False
+                if done > 0 and entry.get('mtime') != file_mtime:
+                    # 文件修改过：只有已导入部分原样保留（追加写入）时才接着导入，否则从头导入
+                    if done > file_size or entry.get('sha1') is None or \
+                            prefix_sha1(file_path + file, done) != entry['sha1']:
+                        print('表 {0} 的 csv 文件已被改写，从头导入'.format(file_name))
+                        done = 0
+                        overwrite = True
+                    else:
+                        entry['mtime'] = file_mtime
+
+                header, chunks, _ = scan_chunk_offsets(file_path + file, done, chunksize)
+                print('表 {0} 待导入 {1} 个数据块（从第 {2} 字节开始）'.format(file_name, len(chunks), done))
+                for offset, length in chunks:
+                    future = pool.submit(parse_csv_chunk, file_path + file, header, offset, length)
+                    writer.queue.put((file_name, future, offset + length, file_size, file_mtime, file_path + file,
+                                      overwrite))
+        finally:
+            writer.queue.put(None)
+            writer.join()
+
+    if writer.error is not None:
+        raise writer.error
+
+    elapsed = time() - t0
+    total = sum(writer.row_count.values())
+    for file_name, cnt in writer.row_count.items():
+        print('数据库 {0} 中表 {1} 导入 {2} 行'.format(db_name, file_name, cnt))
+    print('共导入 {0} 行，耗时 {1:.1f} 秒，{2:.0f} 行/秒'.format(total, elapsed, total / max(elapsed, 1e-9)))
+    return writer.row_count
+
+
 if __name__ == '__main__':
     root_path = "D:/python projects/quandomo/data_center/data/"
     # db_name_list = [SqliteDbName.MARKET,
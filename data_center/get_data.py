@@ -2,16 +2,34 @@
 """
 从数据库中取数据，用于策略运行
 """
+import numpy as np
 import pandas as pd
 import sqlite3
+from time import time
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABCMeta, abstractmethod, ABC
 
 from data_center.mongodb_conn import MongoConn
 from core.const import Interval, MongoDbName, SqliteDbName
 from core.utility import date_str_to_int
+from core.bar_store import BarStore
+from core.lazy_bar_store import LazyBarStore
+from data_center.bar_cache import BarCache
+from data_center.minute_bar_store import MinuteBarStore
+
+try:
+    import pyarrow.dataset as ds
+except ImportError:     # 只在使用 GetArrowData 时需要 pyarrow
+    ds = None
 
 sqlite_config = {
-    'db_path': 'D:/python projects/quandomo/data_center/data/'
+    'db_path': 'D:/python projects/quandomo/data_center/data/',
+    'cache_path': 'D:/python projects/quandomo/data_center/data/bar_cache/',
+    'minute_path': 'D:/python projects/quandomo/data_center/data/minute/'
+}
+
+arrow_config = {
+    'arrow_path': 'D:/python projects/quandomo/data_center/data/arrow/'
 }
 
 
@@ -37,64 +55,187 @@ class GetDBData(object):
         pass
 
 
+class _ColumnBuffer(object):
+    """
+    按列接收游标结果的缓冲区：前 n_fields 列为 float64 行情字段，之后依次为代码列、日期列
+    容量不足时按 2 倍扩容，避免先把全部结果收集成 list of tuple
+    """
+
+    def __init__(self, n_fields: int, capacity: int = 65536):
+        self.n_fields = n_fields
+        self.size = 0
+        self.values = np.empty((capacity, n_fields), dtype=np.float64)
+        self.symbols = np.empty(capacity, dtype=object)
+        self.dates = np.empty(capacity, dtype=np.int64)
+
+    def _reserve(self, n: int):
+        capacity = len(self.dates)
+        if self.size + n <= capacity:
+            return
+        while capacity < self.size + n:
+            capacity *= 2
+        values = np.empty((capacity, self.n_fields), dtype=np.float64)
+        values[:self.size] = self.values[:self.size]
+        symbols = np.empty(capacity, dtype=object)
+        symbols[:self.size] = self.symbols[:self.size]
+        dates = np.empty(capacity, dtype=np.int64)
+        dates[:self.size] = self.dates[:self.size]
+        self.values, self.symbols, self.dates = values, symbols, dates
+
+    def read_cursor(self, cur, fetch_size: int):
+        """按 fetchmany 逐批读取游标，每批直接转换写入对应的类型列"""
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            n = len(rows)
+            self._reserve(n)
+            cols = list(zip(*rows))
+            end = self.size + n
+            for fi in range(self.n_fields):
+                self.values[self.size:end, fi] = np.array(cols[fi], dtype=np.float64)
+            self.symbols[self.size:end] = cols[self.n_fields]
+            self.dates[self.size:end] = np.array(cols[self.n_fields + 1], dtype=np.float64)
+            self.size = end
+
+    def to_columns(self, field: list):
+        """返回 BarStore.from_columns 所需的 (代码列, 日期列, 字段列字典)"""
+        field_cols = {fd: self.values[:self.size, fi] for fi, fd in enumerate(field)}
+        return self.symbols[:self.size], self.dates[:self.size], field_cols
+
+
+class SqliteBlockLoader(object):
+    """
+    LazyBarStore 的 sqlite 分块读取：取一个代码在一段交易日内的多个字段，按日期对齐成 [日期数, 字段数] 数组
+    LazyBarStore 在它自己的后台线程中调用，连接在第一次调用时于该线程内打开
+    """
+
+    def __init__(self, db_path: str, index_codes=(),
+                 index_table_name: str = 'AINDEXEODPRICES', symbol_table_name: str = 'ASHAREEODPRICES'):
+        self.db_path = db_path
+        self.index_codes = set(index_codes)
+        self.index_table_name = index_table_name
+        self.symbol_table_name = symbol_table_name
+        self.conn = None
+
+    def __call__(self, symbol: str, field: list, dates: np.ndarray) -> np.ndarray:
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path)
+        table_name = self.index_table_name if symbol in self.index_codes else self.symbol_table_name
+        get_data_sql = 'select {0},trade_dt from {1} where s_info_windcode=? ' \
+                       'and trade_dt>=? and trade_dt<=?'.format(','.join(['s_dq_' + i for i in field]), table_name)
+        rows = self.conn.execute(get_data_sql, [symbol, int(dates[0]), int(dates[-1])]).fetchall()
+
+        block = np.full((len(dates), len(field)), np.nan)
+        if rows:
+            cols = list(zip(*rows))
+            row_dates = np.array(cols[-1], dtype=np.float64).astype(np.int64)
+            pos = np.minimum(np.searchsorted(dates, row_dates), len(dates) - 1)
+            hit = dates[pos] == row_dates
+            for fi in range(len(field)):
+                block[pos[hit], fi] = np.array(cols[fi], dtype=np.float64)[hit]
+        return block
+
+    def close(self):
+        """关闭连接，须在打开连接的线程中调用"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
 class GetSqliteData(GetDBData, ABC):
-    def __init__(self):
+    def __init__(self, use_cache: bool = True):
         super().__init__()
         self.conn = sqlite3.connect(sqlite_config['db_path'] + SqliteDbName.DB.value)
+        self.bar_cache = BarCache(sqlite_config['cache_path']) if use_cache else None   # 行情数据的 .npy 缓存
+        self.symbol_chunk_size = 500        # 每条 IN (...) 查询的股票数量，须小于 sqlite 的参数个数上限 999
+        self.fetch_size = 50000             # 每次 fetchmany 的行数
+        self.load_time = None               # 最近一次取行情数据的耗时（秒）
 
     def get_all_market_data(self, all_symbol_code=None, field=None, start=None, end=None, interval=Interval.DAILY):
-        """从 sqlite 取数据"""
+        """
+        从 sqlite 取数据
+        股票按 symbol_chunk_size 分批以 IN (...) 一次取出，游标结果按 fetchmany 逐批直接写入 NumPy 列，不再逐个股票查询
+        启用缓存时，数据库文件（含 WAL 文件）的修改时间和大小未变化的相同请求直接映射打开缓存文件
+        分钟数据不读入内存，返回分区存储 MinuteBarStore，由 replay 按时间归并回放
+        """
 
         if all_symbol_code is None:
             all_symbol_code = []
         if field is None:
             field = []
         if interval == Interval.DAILY:
+            load_start = time()
             index_table_name = 'AINDEXEODPRICES'
             symbol_table_name = 'ASHAREEODPRICES'
             index_code = all_symbol_code[-1]
             symbol_code = all_symbol_code[:-1]
+
+            if self.bar_cache is not None:
+                tables = [symbol_table_name, index_table_name]
+                cache_key = BarCache.request_key(tables, all_symbol_code, field, start, end)
+                cache_stamp = BarCache.table_stamp(self.conn, tables)
+                market_data = self.bar_cache.load(cache_key, cache_stamp)
+                if market_data is not None:
+                    self.load_time = time() - load_start
+                    return market_data
             field_sql = ['s_dq_' + i for i in field]
-            field.extend(['s_info_windcode', 'trade_dt'])
             field_sql.extend(['s_info_windcode', 'trade_dt'])
             fields = ','.join(field_sql)
 
+            columns = _ColumnBuffer(len(field))
+
             # 取股票数据
-            all_symbol_data_list = []
-            for stock in symbol_code:
-                get_data_sql = 'select {0} from {1} where s_info_windcode="{2}" ' \
-                               'and trade_dt>={3} and trade_dt<={4}'.format(fields,
-                                                                            symbol_table_name,
-                                                                            stock,
-                                                                            start,
-                                                                            end)
-                cur = self.conn.execute(get_data_sql)
-                data = cur.fetchall()
-                all_symbol_data_list.extend(data)
+            for ii in range(0, len(symbol_code), self.symbol_chunk_size):
+                chunk = symbol_code[ii:ii + self.symbol_chunk_size]
+                get_data_sql = 'select {0} from {1} where s_info_windcode in ({2}) ' \
+                               'and trade_dt>=? and trade_dt<=?'.format(fields,
+                                                                        symbol_table_name,
+                                                                        ','.join(['?'] * len(chunk)))
+                cur = self.conn.execute(get_data_sql, chunk + [start, end])
+                columns.read_cursor(cur, self.fetch_size)
 
             # 取指数数据
-            get_index_sql = 'select {0} from {1} where s_info_windcode="{2}" ' \
-                            'and trade_dt>={3} and trade_dt<={4}'.format(fields,
-                                                                         index_table_name,
-                                                                         index_code,
-                                                                         start,
-                                                                         end)
-            cur = self.conn.execute(get_index_sql)
-            data = cur.fetchall()
-            all_symbol_data_list.extend(data)
-
-            market_data = pd.DataFrame(all_symbol_data_list, columns=field)
-            market_data = market_data.set_index(['s_info_windcode', 'trade_dt'])
+            get_index_sql = 'select {0} from {1} where s_info_windcode=? ' \
+                            'and trade_dt>=? and trade_dt<=?'.format(fields, index_table_name)
+            cur = self.conn.execute(get_index_sql, [index_code, start, end])
+            columns.read_cursor(cur, self.fetch_size)
+
+            market_data = BarStore.from_columns(*columns.to_columns(field))
+            if self.bar_cache is not None:
+                self.bar_cache.save(cache_key, cache_stamp, market_data,
+                                    request={'symbols': len(all_symbol_code), 'fields': field,
+                                             'start': start, 'end': end})
+            self.load_time = time() - load_start
+        elif interval == Interval.MIN:
+            market_data = MinuteBarStore(sqlite_config['minute_path'])
         else:
             market_data = None
 
         return market_data
 
+    def get_lazy_market_data(self, all_symbol_code=None, field=None, start=None, end=None,
+                             resident_fields=('close', 'volume'), block_size: int = 250, max_blocks: int = 256):
+        """
+        两级行情数据：resident_fields（默认收盘价、成交量）一次读入内存，其余字段由 SqliteBlockLoader 按
+        (代码, block_size 个交易日) 分块在用到时读取，最多缓存 max_blocks 块，返回 LazyBarStore
+        all_symbol_code 的最后一个为指数，与 get_all_market_data 相同
+        """
+        if field is None:
+            field = []
+        resident_fields = [fd for fd in resident_fields if fd in field]
+        resident = self.get_all_market_data(all_symbol_code, resident_fields, start, end, Interval.DAILY)
+        loader = SqliteBlockLoader(sqlite_config['db_path'] + SqliteDbName.DB.value, index_codes=all_symbol_code[-1:])
+        return LazyBarStore(resident, field, loader, block_size=block_size, max_blocks=max_blocks)
+
     def get_market_data(self, market_data, all_symbol_code=None, field=None, start="", end="", count=-1):
         """
         从 dataframe 解析数据成最终的数据格式
         因为停牌或者其他原因取不到数据的，１　２　３　返回的是－１，其他返回的是 pandas 的空或者 NaN，所以可以使用　＞０判断是否取到值
         """
+        if isinstance(market_data, BarStore):
+            return market_data.get_market_data(all_symbol_code, field, start, end, count)
+
         if start != "":
             if isinstance(start, str):
                 start = date_str_to_int(start)
@@ -174,6 +315,15 @@ class GetSqliteData(GetDBData, ABC):
                 result_dict[stock] = market_data.loc[stock][field].loc[index]
             return pd.concat(result_dict, keys=all_symbol_code)
 
+    def get_end_timestamp(self, benchmark, interval=Interval.DAILY):
+        """基准指数最后一个 bar 的日期，格式为 YYYY-MM-DD"""
+        end_timestamp = self.conn.execute('select max(trade_dt) from AINDEXEODPRICES where s_info_windcode=?',
+                                          [benchmark]).fetchone()[0]
+        if end_timestamp is None:
+            return None
+        end_timestamp = str(int(end_timestamp))
+        return end_timestamp[:4] + "-" + end_timestamp[4:6] + "-" + end_timestamp[6:]
+
     def get_ex_rights_data(self, table_name: str, fields: list, date_field: str = None, start_date: str = None):
         """
         取所有股票的除权除息数据，返回两层结构的 dict
@@ -233,34 +383,147 @@ class GetSqliteData(GetDBData, ABC):
         return data_dict
 
 
+class GetArrowData(GetDBData, ABC):
+    """
+    从按年分区的 parquet 文件取数据（由 data_center.data_to_arrow 导出）
+    日期、代码条件下推到 pyarrow：按年裁剪分区文件，按 row group 统计信息跳过不相关的数据块
+    """
+
+    def __init__(self, arrow_path: str = None):
+        super().__init__()
+        if ds is None:
+            raise ImportError('GetArrowData 需要安装 pyarrow')
+        self.arrow_path = arrow_path if arrow_path is not None else arrow_config['arrow_path']
+        self.datasets = {}
+        self.load_time = None               # 最近一次取行情数据的耗时（秒）
+
+    def _dataset(self, table_name: str):
+        if table_name not in self.datasets:
+            self.datasets[table_name] = ds.dataset(self.arrow_path + table_name, format='parquet',
+                                                   partitioning='hive')
+        return self.datasets[table_name]
+
+    def _read(self, table_name: str, symbols: list, columns: list, start: int, end: int):
+        condition = (ds.field('year') >= start // 10000) & (ds.field('year') <= end // 10000) & \
+                    (ds.field('trade_dt') >= start) & (ds.field('trade_dt') <= end) & \
+                    ds.field('s_info_windcode').isin(symbols)
+        return self._dataset(table_name).to_table(columns=columns, filter=condition)
+
+    def get_all_market_data(self, all_symbol_code=None, field=None, start=None, end=None, interval=Interval.DAILY):
+        """从 parquet 分区文件取数据，返回 BarStore"""
+        if all_symbol_code is None:
+            all_symbol_code = []
+        if field is None:
+            field = []
+        if interval == Interval.DAILY:
+            load_start = time()
+            if isinstance(start, str):
+                start = date_str_to_int(start)
+            if isinstance(end, str):
+                end = date_str_to_int(end)
+            columns = ['s_dq_' + i for i in field]
+            columns.extend(['s_info_windcode', 'trade_dt'])
+
+            tables = [self._read('ASHAREEODPRICES', all_symbol_code[:-1], columns, start, end),
+                      self._read('AINDEXEODPRICES', all_symbol_code[-1:], columns, start, end)]
+            symbol_col = np.concatenate([t.column('s_info_windcode').to_pandas().values for t in tables])
+            date_col = np.concatenate([t.column('trade_dt').to_pandas().values for t in tables])
+            field_cols = {fd: np.concatenate([t.column('s_dq_' + fd).to_pandas().values for t in tables])
+                          for fd in field}
+
+            market_data = BarStore.from_columns(symbol_col, date_col, field_cols)
+            self.load_time = time() - load_start
+        else:
+            market_data = None
+
+        return market_data
+
+    def get_market_data(self, market_data, all_symbol_code=None, field=None, start="", end="", count=-1):
+        """与 GetSqliteData.get_market_data 相同，market_data 为 BarStore"""
+        return market_data.get_market_data(all_symbol_code, field, start, end, count)
+
+    def get_end_timestamp(self, benchmark, interval=Interval.DAILY):
+        """基准指数最后一个 bar 的日期，格式为 YYYY-MM-DD"""
+        table = self._dataset('AINDEXEODPRICES').to_table(columns=['trade_dt'],
+                                                          filter=ds.field('s_info_windcode') == benchmark)
+        if table.num_rows == 0:
+            return None
+        end_timestamp = str(int(table.column('trade_dt').to_pandas().max()))
+        return end_timestamp[:4] + "-" + end_timestamp[4:6] + "-" + end_timestamp[6:]
+
+
+    def get_ex_rights_data(self, table_name: str, fields: list, date_field: str = None, start_date: str = None):
+        """
+        与 GetSqliteData.get_ex_rights_data 相同，从 data_to_arrow 导出的除权除息 parquet 文件读取
+        返回两层结构的 dict，第一层的 key 是股票代码，第二层的 key 是整数日期，空值按 0 处理
+        """
+        condition = None
+        if date_field is not None and start_date is not None:
+            start_date = date_str_to_int(start_date) if isinstance(start_date, str) else int(start_date)
+            condition = ds.field(date_field.lower()) >= start_date
+        table = self._dataset(table_name).to_table(columns=[fd.lower() for fd in fields], filter=condition)
+        data = table.to_pandas().fillna(0)
+
+        data_dict = {}
+        for row in data.itertuples(index=False, name=None):
+            data_dict.setdefault(row[0], {})[int(row[1])] = dict(zip(fields[2:], row[2:]))
+        return data_dict
+
+
 class GetMongoData(GetDBData):
-    def __init__(self):
+    def __init__(self, max_workers: int = 8, batch_size: int = 5000):
         super().__init__()
         self.conn = MongoConn()
+        self.max_workers = max_workers      # 并发查询各股票集合的线程数，共用同一个 MongoClient
+        self.batch_size = batch_size        # 游标每次从服务端取回的文档数
+        self.load_time = None               # 最近一次取行情数据的耗时（秒）
+
+    def _read_collection(self, db, stock: str, query: dict, colum: dict, field: list):
+        """读取一个股票集合，文档直接解码写入预先分配的 NumPy 列，返回 (timetag 列, 字段值二维数组)"""
+        collection = db[stock]
+        n = collection.count_documents(query)
+        timetag = np.empty(n, dtype=np.int64)
+        values = np.full((n, len(field)), np.nan)
+        size = 0
+        for doc in collection.find(query, colum, batch_size=self.batch_size):
+            if size == n:       # 统计数量之后又有新写入的文档
+                break
+            timetag[size] = doc['timetag']
+            values[size] = [doc.get(fd, np.nan) for fd in field]
+            size += 1
+        return timetag[:size], values[:size]
 
     def get_all_market_data(self, stock_code=None, field=None, start="", end="", interval=Interval.DAILY):
-        """从mongodb取数据"""
+        """
+        从mongodb取数据
+        各股票集合用线程池并发查询，只取所需字段，返回 (代码, timetag) 两层索引、列为字段的 DataFrame
+        """
 
         if interval == Interval.DAILY:
+            load_start = time()
             db_name = MongoDbName.MARKET_DATA_DAILY.value
             if isinstance(start, str):
                 start = date_str_to_int(start)
                 end = date_str_to_int(end)
-            values = []
+            query = {"timetag": {"$gte": start, "$lte": end}}
             colum = {"_id": 0, "timetag": 1}
             for i in field:
                 colum[i] = 1
-            for stock in stock_code:
-                self.conn.check_connected()
-                stock_market_data = self.conn.select_colum(db_name=db_name,
-                                                           table=stock,
-                                                           value={"timetag": {"$gte": start, "$lte": end}},
-                                                           colum=colum)
-                stock_market_data_list = list(stock_market_data)
-                if stock_market_data_list:
-                    df = pd.DataFrame(stock_market_data_list)
-                    values.append(pd.DataFrame(df[field].values, index=df['timetag'], columns=field))
-            market_data = pd.concat(values, keys=stock_code)
+
+            self.conn.check_connected()
+            db = self.conn.connect_db(db_name)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                results = list(executor.map(lambda stock: self._read_collection(db, stock, query, colum, field),
+                                            stock_code))
+
+            keys = [stock for stock, (timetag, _) in zip(stock_code, results) if len(timetag) > 0]
+            counts = [len(timetag) for timetag, _ in results if len(timetag) > 0]
+            index = pd.MultiIndex.from_arrays([np.repeat(keys, counts),
+                                               np.concatenate([timetag for timetag, _ in results])],
+                                              names=[None, 'timetag'])
+            market_data = pd.DataFrame(np.concatenate([values for _, values in results]),
+                                       index=index, columns=field)
+            self.load_time = time() - load_start
         else:
             market_data = None
 
@@ -271,6 +534,9 @@ class GetMongoData(GetDBData):
         从 dataframe 解析数据成最终的数据格式
         因为停牌或者其他原因取不到数据的，１　２　３　返回的是－１，其他返回的是 pandas 的空或者 NaN，所以可以使用　＞０判断是否取到值
         """
+        if isinstance(market_data, BarStore):
+            return market_data.get_market_data(stock_code, field, start, end, count)
+
         if start != "":
             if isinstance(start, str):
                 start = date_str_to_int(start)
@@ -2,33 +2,98 @@
 """
 远程连接局域网内的oracle数据库（wd），并获取数据
 """
-import cx_Oracle as co
-import pandas as pd
+import csv
+from time import time
+
+try:
+    import cx_Oracle as co
+except ImportError:     # 用 sqlite 等 DB-API 连接代替 oracle 时（如测试）可以不装 cx_Oracle
+    co = None
 
 
 class GetDataFromDb(object):
-    def __init__(self, db_id, db_pw, db_ip):
+    def __init__(self, db_id, db_pw, db_ip, conn=None):
+        """conn 不为 None 时直接使用传入的 DB-API 连接（如 sqlite3），不再连接 oracle"""
         self.db_id = db_id
         self.db_pw = db_pw
         self.db_ip = db_ip
-        self.conn = None
+        self.conn = conn
         self.cr = None
         self.rs = None
         self.connect_db()
 
     def connect_db(self):
-        self.conn = co.connect(db_id, db_pw, db_ip)
+        if self.conn is None:
+            self.conn = co.connect(self.db_id, self.db_pw, self.db_ip)
         self.cr = self.conn.cursor()
 
-    def get_data(self, sql_str: str, fpath: str, dt_type: str):
+    def execute(self, sql_str: str, batch_size: int = 50000) -> list:
+        """执行查询，返回字段名列表，结果由 fetch_batches 或游标逐批读取"""
+        self.cr.arraysize = batch_size
         self.cr.execute(sql_str)
-        self.rs = self.cr.fetchall()
-
-        col_name = [ii[0] for ii in self.cr.description]
-        df = pd.DataFrame(self.rs, columns=col_name)
-        df.to_csv(fpath, index=None)
-
-        print('{0} 数据从初始数据库抽取并保存到本地完毕。'.format(dt_type))
+        return [ii[0] for ii in self.cr.description]
+
+    def fetch_batches(self, sql_str: str, batch_size: int = 50000):
+        """执行查询，按 fetchmany 逐批返回 (字段名列表, 本批数据行)，内存占用只与 batch_size 有关"""
+        col_name = self.execute(sql_str, batch_size)
+        while True:
+            rows = self.cr.fetchmany(batch_size)
+            if not rows:
+                break
+            yield col_name, rows
+
+    def get_data(self, sql_str: str, fpath: str, dt_type: str, batch_size: int = 50000):
+        """
+        流式抽取数据并逐批写入本地文件，按文件扩展名决定格式：
+        .csv 为 csv 文件，.parquet 为 parquet 文件，.feather / .arrow 为 arrow IPC 文件（后两者需安装 pyarrow）
+        """
+        t0 = time()
+        row_cnt = 0
+        fmt = fpath.split('.')[-1].lower()
+        if fmt == 'csv':
+            with open(fpath, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                # 表头取自游标的字段描述，查询结果为空时也写入
+                writer.writerow(self.execute(sql_str, batch_size))
+                while True:
+                    rows = self.cr.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    writer.writerows(rows)
+                    row_cnt += len(rows)
+        elif fmt in ['parquet', 'feather', 'arrow']:
+            row_cnt = self._write_arrow(sql_str, fpath, fmt, batch_size)
+        else:
+            raise ValueError('不支持的文件格式：{0}'.format(fpath))
+
+        elapsed = time() - t0
+        print('{0} 数据从初始数据库抽取并保存到本地完毕，共 {1} 行，耗时 {2:.1f} 秒，{3:.0f} 行/秒。'.format(
+            dt_type, row_cnt, elapsed, row_cnt / max(elapsed, 1e-9)))
+        return row_cnt
+
+    def _write_arrow(self, sql_str: str, fpath: str, fmt: str, batch_size: int):
+        """逐批转成 arrow 的列式数据写入 parquet / arrow IPC 文件，字段类型以第一批数据为准"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        row_cnt = 0
+        try:
+            for col_name, rows in self.fetch_batches(sql_str, batch_size):
+                table = pa.Table.from_arrays([pa.array(col) for col in zip(*rows)], names=col_name)
+                if writer is None:
+                    if fmt == 'parquet':
+                        writer = pq.ParquetWriter(fpath, table.schema)
+                    else:
+                        writer = pa.RecordBatchFileWriter(fpath, table.schema)
+                else:
+                    table = table.cast(writer.schema)
+                writer.write_table(table)
+                row_cnt += len(rows)
+        finally:
+            if writer is not None:
+                writer.close()
+        return row_cnt
 
 
 if __name__ == '__main__':
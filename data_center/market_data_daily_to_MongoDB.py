@@ -1,34 +1,50 @@
 # -*- coding: utf-8 -*-
-
+"""
+把各股票的日线 csv 文件写入 mongodb，每个股票一个集合，多进程并行处理各文件
+按 timetag 更新插入，重复运行不会产生重复记录
+"""
+from concurrent.futures import ProcessPoolExecutor
 from os import listdir, path
-from pandas import read_csv
 from re import sub
-from json import loads
+from time import time
 
-from data_center.mongodb_conn import MongoConn
-from core.const import DatabaseName
+from pandas import read_csv
 
+from data_center.mongodb_conn import MongoConn
+from core.const import MongoDbName
 
-db_name = DatabaseName.MARKET_DATA_DAILY.value
-my_conn = MongoConn()
-db = my_conn.connect_db(db_name)
+db_name = MongoDbName.MARKET_DATA_DAILY.value
 root_path = "D:/python projects/quandomo/data/"
 market_list = ["SH", "SZ"]
 
-for market in market_list:
-    files = listdir(root_path + market)
-    for file_num in range(len(files)):
-        if not path.isdir(files[file_num]):
-            # print(files[file_num])
-            collection_data = read_csv(root_path + market + "/" + files[file_num], sep=",", encoding="utf8")
-            collection_name = str(sub(r"\D", "", files[file_num])) + "." + market
-            print(collection_name)
-
-            collection_data = collection_data.sort_values(axis=0, ascending=True, by="timetag")
-            collection_data_list = loads(collection_data.T.to_json()).values()
-            collection_data_list_sort = sorted(collection_data_list, key=lambda x: x.__getitem__("timetag"))
-            # print(collection_data_list)
-
-            # 插入数据
-            if collection_data_list_sort:
-                my_conn.insert(db_name, collection_name, collection_data_list_sort)
+
+def csv_to_mongo(file_path: str, collection_name: str) -> dict:
+    """在子进程中读取一个 csv 文件并写入对应的集合，返回写入统计"""
+    my_conn = MongoConn()
+    collection_data = read_csv(file_path, sep=",", encoding="utf8")
+    collection_data = collection_data.sort_values(axis=0, ascending=True, by="timetag")
+    my_conn.connect_db(db_name)[collection_name].create_index('timetag')
+    return my_conn.bulk_write_frame(db_name, collection_name, collection_data, keys=['timetag'])
+
+
+if __name__ == '__main__':
+    start = time()
+    total_rows = 0
+    with ProcessPoolExecutor() as executor:
+        futures = {}
+        for market in market_list:
+            for file_name in listdir(root_path + market):
+                file_path = root_path + market + "/" + file_name
+                if not path.isdir(file_path):
+                    collection_name = str(sub(r"\D", "", file_name)) + "." + market
+                    futures[collection_name] = executor.submit(csv_to_mongo, file_path, collection_name)
+
+        for collection_name, future in futures.items():
+            stats = future.result()
+            total_rows += stats['rows']
+            print('{0}: {1} 条，新增 {2} 条，更新 {3} 条，错误 {4} 条，{5:.0f} 条/秒'.format(
+                collection_name, stats['rows'], stats['inserted'] + stats['upserted'], stats['modified'],
+                stats['errors'], stats.get('rows_per_sec', 0)))
+
+    elapsed = time() - start
+    print('共写入 {0} 条，耗时 {1:.1f} 秒，{2:.0f} 条/秒'.format(total_rows, elapsed, total_rows / max(elapsed, 1e-9)))
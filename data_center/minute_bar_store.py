@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+分钟行情的分区存储与流式回放
+每个代码每个月一个 .npy 文件（root_path/代码/YYYYMM.npy），内容是按时间升序的结构化数组，
+时间为 YYYYMMDDHHMM 形式的整数 timetag；读取时以只读内存映射方式打开，按 chunk_size 切块
+回放时对各代码的块迭代器做分块 k 路归并：每轮以各代码当前块最后一个 timetag 的最小值为水位，
+把所有代码不晚于水位的 bar 一次取出按 timetag 稳定排序，内存中只有每个代码的一个块，与历史长度无关
+"""
+from os import listdir, makedirs, path, replace
+from typing import Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+minute_fields = ['open', 'high', 'low', 'close', 'volume']
+minute_dtype = np.dtype([('timetag', np.int64)] + [(fd, np.float64) for fd in minute_fields])
+# 回放输出的 bar 多一列 symbol，为代码在 symbols 中的序号
+replay_dtype = np.dtype([('timetag', np.int64), ('symbol', np.int32)] + [(fd, np.float64) for fd in minute_fields])
+
+
+def empty_bars(n: int) -> np.ndarray:
+    """n 个字段值为 NaN 的分钟 bar"""
+    bars = np.zeros(n, dtype=minute_dtype)
+    for fd in minute_fields:
+        bars[fd] = np.nan
+    return bars
+
+
+def to_timetag(date: int, end: bool = False) -> int:
+    """YYYYMMDD 形式的日期转为当日第一分钟（end 为 True 时为最后一分钟）的 timetag，已是 timetag 的原样返回"""
+    date = int(date)
+    if date >= 10 ** 10:
+        return date
+    return date * 10000 + (2359 if end else 0)
+
+
+class MinuteBarStore(object):
+    """分钟行情的分区存储，写入时按月拆分，与已有分区合并去重（timetag 相同的以新写入的为准）"""
+
+    def __init__(self, root_path: str, chunk_size: int = 65536):
+        self.root_path = root_path
+        self.chunk_size = chunk_size    # 回放时每个代码每次读取的 bar 数
+        makedirs(root_path, exist_ok=True)
+
+    def _partition_file(self, symbol: str, month: int) -> str:
+        return path.join(self.root_path, symbol, '{0}.npy'.format(month))
+
+    def symbols(self) -> List[str]:
+        return sorted(name for name in listdir(self.root_path) if path.isdir(path.join(self.root_path, name)))
+
+    def partitions(self, symbol: str, start: int = 0, end: int = 0) -> List[int]:
+        """某个代码在 [start, end] 内的分区月份（YYYYMM），升序排列"""
+        symbol_path = path.join(self.root_path, symbol)
+        if not path.isdir(symbol_path):
+            return []
+        months = sorted(int(name[:-4]) for name in listdir(symbol_path) if name.endswith('.npy'))
+        if start:
+            months = [m for m in months if m >= to_timetag(start) // 1000000]
+        if end:
+            months = [m for m in months if m <= to_timetag(end, True) // 1000000]
+        return months
+
+    def write(self, symbol: str, bars: np.ndarray):
+        """写入一个代码的分钟 bar，bars 为 minute_dtype 结构化数组（或含这些字段的结构化数组），不要求有序"""
+        data = np.empty(len(bars), dtype=minute_dtype)
+        for name in minute_dtype.names:
+            data[name] = bars[name]
+        months = data['timetag'] // 1000000
+        makedirs(path.join(self.root_path, symbol), exist_ok=True)
+        for month in np.unique(months).tolist():
+            part = data[months == month]
+            part_file = self._partition_file(symbol, month)
+            if path.exists(part_file):
+                part = np.concatenate([part, np.load(part_file)])
+            # 新写入的在前，稳定排序后 timetag 相同的只保留第一个
+            part = part[np.argsort(part['timetag'], kind='stable')]
+            keep = np.ones(len(part), dtype=bool)
+            keep[1:] = part['timetag'][1:] != part['timetag'][:-1]
+            tmp_file = part_file + '.tmp'
+            with open(tmp_file, 'wb') as f:
+                np.save(f, part[keep])
+            replace(tmp_file, part_file)
+
+    def write_columns(self, symbol: str, timetag, **field_cols):
+        """由 timetag 列和各字段列写入，缺少的字段为 NaN"""
+        bars = empty_bars(len(timetag))
+        bars['timetag'] = timetag
+        for fd, col in field_cols.items():
+            bars[fd] = col
+        self.write(symbol, bars)
+
+    def read(self, symbol: str, start: int = 0, end: int = 0) -> np.ndarray:
+        """一次读出一个代码在 [start, end] 内的全部分钟 bar"""
+        chunks = list(self.iter_chunks(symbol, start, end))
+        if not chunks:
+            return np.empty(0, dtype=minute_dtype)
+        return np.concatenate(chunks)
+
+    def iter_chunks(self, symbol: str, start: int = 0, end: int = 0, chunk_size: int = None) -> Iterator[np.ndarray]:
+        """按时间顺序逐块产出一个代码在 [start, end] 内的分钟 bar，每块最多 chunk_size 个，是内存映射文件的只读视图"""
+        chunk_size = chunk_size or self.chunk_size
+        t0 = to_timetag(start) if start else 0
+        t1 = to_timetag(end, True) if end else 0
+        for month in self.partitions(symbol, start, end):
+            part = np.load(self._partition_file(symbol, month), mmap_mode='r')
+            i0 = int(np.searchsorted(part['timetag'], t0, side='left')) if t0 else 0
+            i1 = int(np.searchsorted(part['timetag'], t1, side='right')) if t1 else len(part)
+            for ii in range(i0, i1, chunk_size):
+                yield part[ii:min(ii + chunk_size, i1)]
+
+    def replay(self, symbols: Sequence[str], start: int = 0, end: int = 0,
+               chunk_size: int = None) -> Iterator[np.ndarray]:
+        """
+        多个代码按时间归并后的分钟 bar 流，逐块产出 replay_dtype 结构化数组
+        块内按 timetag 升序，timetag 相同的按代码在 symbols 中的顺序；同一个 timetag 的 bar 不会被拆到两块中
+        """
+        iters = [self.iter_chunks(symbol, start, end, chunk_size) for symbol in symbols]
+        buffers = [next(it, None) for it in iters]
+        while True:
+            live = [k for k, buf in enumerate(buffers) if buf is not None]
+            if not live:
+                return
+            # 各代码当前块的末尾都不早于水位，不晚于水位的 bar 都已经在当前块中
+            watermark = min(int(buffers[k]['timetag'][-1]) for k in live)
+            parts = []
+            for k in live:
+                buf = buffers[k]
+                cut = int(np.searchsorted(buf['timetag'], watermark, side='right'))
+                if cut == 0:
+                    continue
+                parts.append((k, buf[:cut]))
+                if cut < len(buf):
+                    buffers[k] = buf[cut:]
+                else:
+                    buffers[k] = next(iters[k], None)
+
+            total = sum(len(part) for _, part in parts)
+            merged = np.empty(total, dtype=replay_dtype)
+            pos = 0
+            for k, part in parts:
+                n = len(part)
+                merged['symbol'][pos:pos + n] = k
+                for name in minute_dtype.names:
+                    merged[name][pos:pos + n] = part[name]
+                pos += n
+            yield merged[np.argsort(merged['timetag'], kind='stable')]
+
+
+def group_by_timetag(chunks: Iterator[np.ndarray]) -> Iterator[Tuple[int, np.ndarray]]:
+    """把 MinuteBarStore.replay 的输出按 timetag 分组，逐个产出 (timetag, 该分钟全部代码的 bar)"""
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        timetag = chunk['timetag']
+        bounds = np.flatnonzero(timetag[1:] != timetag[:-1]) + 1
+        starts = [0] + bounds.tolist()
+        ends = bounds.tolist() + [len(chunk)]
+        for i0, i1 in zip(starts, ends):
+            yield int(timetag[i0]), chunk[i0:i1]
+
+
+def _write_docs(minute_store: MinuteBarStore, symbol: str, docs: list):
+    """把一批 mongodb 文档写入分区存储"""
+    bars = empty_bars(len(docs))
+    bars['timetag'] = [doc['timetag'] for doc in docs]
+    for fd in minute_fields:
+        bars[fd] = [doc.get(fd, np.nan) for doc in docs]
+    minute_store.write(symbol, bars)
+
+
+def mongo_to_minute_store(minute_store: MinuteBarStore, symbols: Sequence[str] = None, batch_size: int = 5000):
+    """
+    把 mongodb market_data_1min 库中各代码集合（timetag 为 YYYYMMDDHHMM）导入分区存储
+    游标按 timetag 排序，每 batch_size 条写入一次，内存中只有一批文档，与历史长度无关；返回各代码导入的条数
+    """
+    from data_center.mongodb_conn import MongoConn
+    from core.const import MongoDbName
+
+    conn = MongoConn()
+    conn.check_connected()
+    db = conn.connect_db(MongoDbName.MARKET_DATA_1_MIN.value)
+    if symbols is None:
+        symbols = db.list_collection_names()
+    colum = {'_id': 0, 'timetag': 1}
+    for fd in minute_fields:
+        colum[fd] = 1
+
+    counts = {}
+    for symbol in symbols:
+        cursor = db[symbol].find({}, colum, batch_size=batch_size).sort('timetag', 1)
+        docs = []
+        count = 0
+        for doc in cursor:
+            docs.append(doc)
+            if len(docs) >= batch_size:
+                _write_docs(minute_store, symbol, docs)
+                count += len(docs)
+                docs = []
+        if docs:
+            _write_docs(minute_store, symbol, docs)
+            count += len(docs)
+        counts[symbol] = count
+    print('分钟数据导入完毕，共 {0} 个代码 {1} 条'.format(len(counts), sum(counts.values())))
+    return counts
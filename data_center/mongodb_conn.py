@@ -4,7 +4,11 @@
 """
 import sys
 import traceback
-from pymongo import MongoClient
+from time import time
+
+from bson import BSON
+from pymongo import MongoClient, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
 
 from core.utility import singleton
 
@@ -77,14 +81,49 @@ class MongoConn(object):
         # 如果更新的字段在mongo中不存在，则直接新增一个字段
         try:
             db = self.conn[db_name]
-            bulk = db[table].initialize_ordered_bulk_op()
-            for data in datas:
-                _id = data['_id']
-                bulk.find({'_id': _id}).upsert().update({'$set': data})
-            bulk.execute()
+            requests = [UpdateOne({'_id': data['_id']}, {'$set': data}, upsert=True) for data in datas]
+            if requests:
+                db[table].bulk_write(requests, ordered=False)
         except Exception:
             print(traceback.format_exc())
 
+    def bulk_write_frame(self, db_name, table, data, keys=None, max_batch_bytes=8 * 1024 * 1024):
+        """
+        把 DataFrame 的每一行作为一条记录批量写入，返回写入统计
+        keys 为 None 时用 InsertOne 插入；否则按 keys 中的字段 UpdateOne 更新插入（upsert），重复写入同样的数据不会产生重复记录
+        每批的记录数按第一条记录的 BSON 大小和 max_batch_bytes 估算，批内无序执行（ordered=False），单条出错不影响其余记录
+        """
+        start = time()
+        stats = {'rows': len(data), 'inserted': 0, 'upserted': 0, 'modified': 0, 'errors': 0}
+        if len(data) == 0:
+            return stats
+
+        columns = [str(c) for c in data.columns]
+        # 按列 tolist 得到 python 原生类型，bson 不能编码 numpy 标量
+        records = [dict(zip(columns, row)) for row in zip(*[data[c].tolist() for c in data.columns])]
+        doc_bytes = len(BSON.encode(records[0]))
+        batch_rows = max(1, max_batch_bytes // max(doc_bytes, 1))
+
+        collection = self.conn[db_name][table]
+        for ii in range(0, len(records), batch_rows):
+            if keys is None:
+                requests = [InsertOne(record) for record in records[ii:ii + batch_rows]]
+            else:
+                requests = [UpdateOne({key: record[key] for key in keys}, {'$set': record}, upsert=True)
+                            for record in records[ii:ii + batch_rows]]
+            try:
+                result = collection.bulk_write(requests, ordered=False).bulk_api_result
+            except BulkWriteError as e:
+                result = e.details
+                stats['errors'] += len(result['writeErrors'])
+            stats['inserted'] += result['nInserted']
+            stats['upserted'] += result['nUpserted']
+            stats['modified'] += result['nModified']
+
+        stats['seconds'] = time() - start
+        stats['rows_per_sec'] = stats['rows'] / max(stats['seconds'], 1e-9)
+        return stats
+
     def upsert_one(self, db_name, table, data):
         # 更新插入，根据‘_id’更新一条记录，如果‘_id’的值不存在，则插入一条记录
         try:
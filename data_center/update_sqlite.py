@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+本地 sqlite 数据库的增量更新
+按各表已有数据的最大日期，只从数据源（wd 的 oracle 库，或本地放置的 csv 文件）取更新的数据，按唯一键 upsert 写入
+已有记录会被修改的表（成分股剔除时补上剔除日期、财务报表更正）按记录更新时间 OPDATE 增量更新
+"""
+import sqlite3
+from datetime import datetime, timedelta
+from os import path
+
+from pandas import DataFrame, read_csv, to_numeric
+
+from core.const import SqliteDbName
+from data_center.data_to_sqlite import unique_keys, create_table_sql
+
+# 各表增量更新时依据的日期字段
+date_keys = {
+    'AINDEXEODPRICES': 'TRADE_DT',
+    'ASHAREEODPRICES': 'TRADE_DT',
+    'AINDEXMEMBERS': 'S_CON_INDATE',
+    'AShareBalanceSheet': 'ANN_DT',
+    'ASHARECALENDAR': 'TRADE_DAYS',
+    'ASHARECAPITALIZATION': 'CHANGE_DT',
+    'AShareCashFlow': 'ANN_DT',
+    'AShareEXRightDividendRecord': 'EX_DATE',
+    'ASHAREINCOME': 'ANN_DT',
+    'ASHAREPROFITEXPRESS': 'ANN_DT',
+    'ASHAREPROFITNOTICE': 'S_PROFITNOTICE_DATE',
+    'ASWSINDEXEOD': 'TRADE_DT',
+    'SWINDEXMEMBERS': 'S_CON_INDATE'
+}
+
+# 已有记录会被修改的表，按记录更新时间增量更新（取更新时间不早于本地最大值的记录）
+update_time_field = 'OPDATE'
+update_time_tables = ['AINDEXMEMBERS', 'SWINDEXMEMBERS',
+                      'AShareBalanceSheet', 'AShareCashFlow', 'ASHAREINCOME', 'ASHAREPROFITEXPRESS']
+# 本地表没有 OPDATE 字段时：财务报表按公告日期回看若干天重新取，成分股表（不在此列）全量刷新
+lookback_days = {
+    'AShareBalanceSheet': 730,
+    'AShareCashFlow': 730,
+    'ASHAREINCOME': 730,
+    'ASHAREPROFITEXPRESS': 730
+}
+
+
+class OracleSource(object):
+    """从 wd 的 oracle 库取增量数据，db 为 GetDataFromDb 实例"""
+
+    def __init__(self, db, schema: str = 'cxb1', batch_size: int = 50000):
+        self.db = db
+        self.schema = schema
+        self.batch_size = batch_size
+
+    def fetch(self, table_name: str, date_field: str, after):
+        """按批返回 date_field 大于 after 的数据（DataFrame），按 OPDATE 时取不早于 after 的；after 为 0 时取全部"""
+        if not after:
+            sql = 'select * from {0}.{1}'.format(self.schema, table_name)
+        elif date_field == update_time_field:
+            sql = "select * from {0}.{1} where {2} >= to_date('{3}', 'yyyy-mm-dd hh24:mi:ss') " \
+                  "order by {2} asc".format(self.schema, table_name, date_field, after)
+        else:
+            sql = "select * from {0}.{1} where {2} > '{3}' order by {2} asc".format(self.schema,
+                                                                                   table_name,
+                                                                                   date_field,
+                                                                                   after)
+        for col_name, rows in self.db.fetch_batches(sql, self.batch_size):
+            yield DataFrame(rows, columns=col_name)
+
+
+class CsvDropSource(object):
+    """从本地目录中与表同名的 csv 文件（get_data_from_remote_db 导出的格式）取增量数据"""
+
+    def __init__(self, drop_path: str, encoding: str = 'gbk', chunksize: int = 100000):
+        self.drop_path = drop_path
+        self.encoding = encoding
+        self.chunksize = chunksize
+
+    def fetch(self, table_name: str, date_field: str, after):
+        """按批返回 date_field 大于 after 的数据（DataFrame），按 OPDATE 时取不早于 after 的；after 为 0 时取全部"""
+        file_path = path.join(self.drop_path, table_name + '.csv')
+        if not path.exists(file_path):
+            return
+        for chunk in read_csv(file_path, sep=',', encoding=self.encoding, chunksize=self.chunksize,
+                              low_memory=False):
+            if not after:
+                pass
+            elif date_field == update_time_field:
+                chunk = chunk[chunk[date_field].astype(str) >= after]
+            else:
+                chunk = chunk[to_numeric(chunk[date_field], errors='coerce') > after]
+            if len(chunk) > 0:
+                yield chunk
+
+
+def upsert_sql(table_name: str, columns: list) -> str:
+    """按唯一键写入：已存在的记录更新，不存在的插入（sqlite 3.24 之前的版本没有 on conflict，用 insert or replace）"""
+    fields = ','.join(columns)
+    s = ','.join(['?'] * len(columns))
+    keys = unique_keys[table_name]
+    updates = [col for col in columns if col.upper() not in keys.upper().split(',')]
+    if sqlite3.sqlite_version_info >= (3, 24, 0) and updates:
+        return 'insert into {0}({1}) values({2}) on conflict({3}) do update set {4}'.format(
+            table_name, fields, s, keys, ','.join(['{0}=excluded.{0}'.format(col) for col in updates]))
+    return 'insert or replace into {0}({1}) values({2})'.format(table_name, fields, s)
+
+
+def table_columns(cx, table_name: str) -> list:
+    """表的字段名（大写），表不存在时为空"""
+    return [row[1].upper() for row in cx.execute('PRAGMA table_info({0})'.format(table_name))]
+
+
+def get_max_date(cx, table_name: str, date_field: str) -> int:
+    """表中已有数据的最大日期，表不存在或为空时返回 0"""
+    exists = cx.execute("select count(*) from sqlite_master where type='table' and name=?", [table_name]).fetchone()
+    if not exists[0]:
+        return 0
+    max_date = cx.execute('select max(cast({0} as integer)) from {1}'.format(date_field, table_name)).fetchone()[0]
+    return int(max_date) if max_date is not None else 0
+
+
+def incremental_key(cx, table_name: str):
+    """
+    增量更新依据的字段及起点，返回 (字段, 起点)，起点为 0 时全量取
+    update_time_tables 中的表按 OPDATE；本地表没有 OPDATE 时，财务报表按公告日期回看 lookback_days 天，成分股表全量刷新
+    """
+    date_field = date_keys[table_name]
+    if table_name not in update_time_tables:
+        return date_field, get_max_date(cx, table_name, date_field)
+
+    columns = table_columns(cx, table_name)
+    if not columns:
+        return update_time_field, 0
+    if update_time_field in columns:
+        max_time = cx.execute('select max({0}) from {1}'.format(update_time_field, table_name)).fetchone()[0]
+        return update_time_field, str(max_time) if max_time is not None else 0
+    if table_name in lookback_days:
+        max_date = get_max_date(cx, table_name, date_field)
+        if max_date == 0:
+            return date_field, 0
+        after = datetime.strptime(str(max_date), '%Y%m%d') - timedelta(days=lookback_days[table_name])
+        return date_field, int(after.strftime('%Y%m%d'))
+    return date_field, 0
+
+
+def update_sqlite(db_path: str, source, tables: list = None) -> dict:
+    """
+    增量更新本地 sqlite 数据库，返回各表新增的记录数
+    source 为 OracleSource 或 CsvDropSource，或任意提供 fetch(table_name, date_field, after) 的数据源
+    """
+    if tables is None:
+        tables = list(unique_keys.keys())
+
+    cx = sqlite3.connect(db_path)
+    added = {}
+    for table_name in tables:
+        key_field, after = incremental_key(cx, table_name)
+        row_cnt = 0
+        before_cnt = None
+
+        for chunk in source.fetch(table_name, key_field, after):
+            if before_cnt is None:
+                cx.execute(create_table_sql(table_name, chunk))
+                before_cnt = cx.execute('select count(*) from {0}'.format(table_name)).fetchone()[0]
+            cx.executemany(upsert_sql(table_name, chunk.columns.tolist()), chunk.itertuples(index=False, name=None))
+            row_cnt += len(chunk)
+        cx.commit()
+
+        if before_cnt is None:
+            added[table_name] = 0
+        else:
+            added[table_name] = cx.execute('select count(*) from {0}'.format(table_name)).fetchone()[0] - before_cnt
+        print('表 {0} 自 {1} {2} 之后取到 {3} 条，新增 {4} 条'.format(table_name, key_field, after, row_cnt,
+                                                                added[table_name]))
+    cx.close()
+    return added
+
+
+if __name__ == '__main__':
+    db_path = 'D:/python projects/quandomo/data_center/data/' + SqliteDbName.DB.value
+
+    # 从本地 csv 文件增量更新
+    csv_source = CsvDropSource('D:/python projects/quandomo/data/update/')
+    update_sqlite(db_path, csv_source)
+
+    # 从 oracle 数据库增量更新
+    # from data_center.get_data_from_remote_db import GetDataFromDb
+    # oracle_source = OracleSource(GetDataFromDb('cxb1', 'oracle', '192.168.3.9:1521/orcl'))
+    # update_sqlite(db_path, oracle_source)
@@ -6,7 +6,7 @@ from const import *
 from queue import Queue
 from threading import Thread, RLock
 from time import sleep
-from collections import defaultdict
+from collections import defaultdict, deque
 
 from core.event import MakeEvent
 
@@ -125,3 +125,71 @@ class EventManager:
     def get(self, is_block: bool = False, time_out: float = 1):
         """从队列中取事件"""
         return self._eventQueue.get(block=is_block, timeout=time_out)
+
+
+class BacktestEventManager(object):
+    """
+    回测用的同步事件管理器，register / put / get / event_process 与 EventManager 相同，实盘仍用 EventManager
+    回测只有一个线程，事件队列用 deque，不加锁；队列为空时 get 返回 None，不抛出 queue.Empty
+    每种事件的处理函数（含通用处理函数）注册时预先合成 tuple，分发时只查一次字典
+    """
+
+    def __init__(self):
+        self._eventQueue = deque()
+        self._handlers = defaultdict(list)
+        self._handlers_general = []
+        self._dispatch = {}             # {事件类型: 处理函数 tuple}
+        self._dispatch_general = ()     # 没有注册专门处理函数的事件类型只交给通用处理函数
+
+    def _compile(self):
+        """重新合成各事件类型的处理函数 tuple，与 EventManager.event_process 的调用顺序相同"""
+        general = tuple(self._handlers_general)
+        self._dispatch = {type_: tuple(handlers) + (general if type_ != 'event_timer' else ())
+                          for type_, handlers in self._handlers.items()}
+        self._dispatch_general = general
+
+    def event_process(self, event):
+        """处理事件"""
+        handlers = self._dispatch.get(event.type_)
+        if handlers is None:
+            handlers = self._dispatch_general if event.type_ != 'event_timer' else ()
+        for handler in handlers:
+            handler(event)
+
+    def register(self, type_, handler):
+        """绑定事件和监听器处理函数"""
+        handler_list = self._handlers[type_]
+        if handler not in handler_list:
+            handler_list.append(handler)
+        self._compile()
+
+    def unregister(self, type_, handler):
+        """移除监听器的处理函数"""
+        handler_list = self._handlers.get(type_)
+        if handler_list is not None and handler in handler_list:
+            handler_list.remove(handler)
+            if not handler_list:
+                del self._handlers[type_]
+            self._compile()
+
+    def register_general(self, handler):
+        """注册通用事件处理函数监听"""
+        if handler not in self._handlers_general:
+            self._handlers_general.append(handler)
+            self._compile()
+
+    def unregister_general(self, handler):
+        """注销通用事件处理函数监听"""
+        if handler in self._handlers_general:
+            self._handlers_general.remove(handler)
+            self._compile()
+
+    def put(self, event):
+        """发送事件，向事件队列中存入事件"""
+        self._eventQueue.append(event)
+
+    def get(self, is_block: bool = False, time_out: float = 1):
+        """从队列中取事件，队列为空时返回 None；参数只为与 EventManager 保持一致，回测中不会阻塞等待"""
+        if self._eventQueue:
+            return self._eventQueue.popleft()
+        return None
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+限价单的批量撮合：一个 bar 上全部未成交限价单按列放入 NumPy 数组，
+一次算出能否成交、成交方向和含滑点的成交价，再由策略逐单生成委托、成交对象
+止损单按代码、方向放在按触发价排序的止损单簿中，用二分查找找出被触发的止损单
+"""
+from bisect import bisect_left, bisect_right, insort
+from math import inf, isnan
+
+import numpy as np
+
+from core.const import Direction, Offset, Slippage, Status
+
+
+class LimitOrderMatcher(object):
+    """
+    撮合规则与逐单处理时完全相同：
+    1）停牌（当日无有效 bar 或开盘价缺失）的委托单不处理，待提交（SUBMITTING）的委托单不处理
+    2）多开委托、空开委托总是成交；空平委托在 委托价 >= 最低价 > 0 时、多平委托在 委托价 <= 最高价 且 最高价 > 0 时成交，
+       成交价为委托价与开盘价中较优者
+    3）不能成交的委托单撤单后按开盘价追单成交，多开/空平按开盘价，空开/多平按委托价与开盘价中的较高者
+    4）买入方向加滑点，卖出方向减滑点
+    """
+
+    def __init__(self, slippage_dict: dict):
+        self.slippage_dict = slippage_dict
+
+    def _slippage(self, orders: list, tradable: np.ndarray):
+        """各委托单的固定滑点、百分比滑点，只查可成交的委托单"""
+        fix_value = np.zeros(len(orders))
+        pct_value = np.zeros(len(orders))
+        for ii in np.flatnonzero(tradable):
+            slippage = self.slippage_dict[orders[ii].symbol_type.value.split('_')[0]]
+            if slippage["slippage_type"] == Slippage.FIX:
+                fix_value[ii] = slippage["value"]
+            elif slippage["slippage_type"] == Slippage.PERCENT:
+                pct_value[ii] = slippage["value"]
+        return fix_value, pct_value
+
+    def match(self, orders: list, daily_data, date: int):
+        """
+        返回四个长度与 orders 相同的数组：
+        tradable 是否参与撮合，crossed 是否按委托价直接成交（否则为撤单追单），trade_price 含滑点的成交价，open_price 开盘价
+        """
+        valid, bar = daily_data.cross_section(['open', 'low', 'high'], [o.symbol for o in orders], date)
+        open_price, low_price, high_price = bar[:, 0], bar[:, 1], bar[:, 2]
+
+        price = np.array([o.price for o in orders], dtype=np.float64)
+        is_long = np.array([o.direction == Direction.LONG for o in orders], dtype=bool)
+        is_short = np.array([o.direction == Direction.SHORT for o in orders], dtype=bool)
+        is_open = np.array([o.offset == Offset.OPEN for o in orders], dtype=bool)
+        is_close = np.array([o.offset == Offset.CLOSE for o in orders], dtype=bool)
+        submitting = np.array([o.status == Status.SUBMITTING for o in orders], dtype=bool)
+
+        with np.errstate(invalid='ignore'):
+            tradable = ~submitting & valid & ~np.isnan(open_price) & ~(open_price < 0)
+
+            long_side = (is_long & is_open) | (is_short & is_close)
+            short_side = (is_short & is_open) | (is_long & is_close)
+            long_cross = (is_long & is_open) | (is_short & is_close & (price >= low_price) & (low_price > 0))
+            short_cross = (is_short & is_open) | (is_long & is_close & (price <= high_price) & (high_price > 0))
+        crossed = long_cross | short_cross
+
+        # 直接成交取委托价与开盘价中较优者；追单时多方按开盘价，空方按委托价与开盘价中的较高者
+        trade_price = np.where(crossed,
+                               np.where(long_cross, np.minimum(price, open_price), np.maximum(price, open_price)),
+                               np.where(short_side, np.maximum(price, open_price), open_price))
+        side = np.where(crossed,
+                        np.where(long_cross, 1.0, -1.0),
+                        np.where(long_side, 1.0, np.where(short_side, -1.0, 0.0)))
+
+        fix_value, pct_value = self._slippage(orders, tradable)
+        trade_price = (trade_price + side * fix_value) * (1 + side * pct_value)
+        return tradable, crossed, trade_price, open_price
+
+
+class StopOrderBook(object):
+    """
+    按代码分组的未触发止损单簿，多、空两侧各是按 (触发价, 序号) 排序的 list
+    多方止损单在 触发价 <= 最高价 时触发，是 list 的前段；空方止损单在 触发价 >= 最低价 时触发，是 list 的后段
+    每个 bar 对每个有止损单的代码做一次二分查找，不再逐单比较
+    """
+
+    def __init__(self):
+        self.long_triggers = {}         # {代码: [(触发价, 序号, 止损单编号)]}
+        self.short_triggers = {}
+        self.locations = {}             # {止损单编号: (所在的一侧, 代码, 排序键)}
+        self.seq = 0                    # 加入的先后顺序，触发后按此顺序处理
+
+    def __len__(self):
+        return len(self.locations)
+
+    def add(self, stop_order):
+        if stop_order.direction == Direction.LONG:
+            side = self.long_triggers
+        elif stop_order.direction == Direction.SHORT:
+            side = self.short_triggers
+        else:
+            return
+        self.seq += 1
+        key = (stop_order.price, self.seq, stop_order.order_id)
+        insort(side.setdefault(stop_order.symbol, []), key)
+        self.locations[stop_order.order_id] = (side, stop_order.symbol, key)
+
+    def remove(self, order_id: str):
+        """撤销止损单"""
+        if order_id not in self.locations:
+            return
+        side, symbol, key = self.locations.pop(order_id)
+        triggers = side[symbol]
+        del triggers[bisect_left(triggers, key)]
+        if not triggers:
+            side.pop(symbol)
+
+    def trigger(self, daily_data, date: int) -> list:
+        """取出当前 bar 被触发的止损单编号，按加入的先后顺序排列"""
+        symbols = list(set(self.long_triggers) | set(self.short_triggers))
+        if not symbols:
+            return []
+        valid, bar = daily_data.cross_section(['high', 'low'], symbols, date)
+
+        hits = []
+        for symbol, is_valid, (high_price, low_price) in zip(symbols, valid, bar.tolist()):
+            if not is_valid:
+                continue
+            triggers = self.long_triggers.get(symbol)
+            if triggers and not isnan(high_price):
+                k = bisect_right(triggers, (high_price, inf))
+                hits.extend(triggers[:k])
+                del triggers[:k]
+                if not triggers:
+                    self.long_triggers.pop(symbol)
+            triggers = self.short_triggers.get(symbol)
+            if triggers and not isnan(low_price):
+                k = bisect_left(triggers, (low_price, -inf))
+                hits.extend(triggers[k:])
+                del triggers[k:]
+                if not triggers:
+                    self.short_triggers.pop(symbol)
+
+        hits.sort(key=lambda key: key[1])
+        for _, _, order_id in hits:
+            self.locations.pop(order_id)
+        return [order_id for _, _, order_id in hits]
@@ -3,14 +3,13 @@
 策略模板基类
 """
 
-from copy import deepcopy
 from abc import abstractmethod
 from time import sleep, time
-from pandas import DataFrame, to_datetime, isna, merge, read_pickle, isnull
-from numpy import cov, var, std, nan, hstack
+from pandas import to_datetime, merge, read_pickle, isnull
+import numpy as np
+from numpy import cov, var, std
 from math import sqrt
 from pyecharts import Line, Page
-from queue import Empty
 # from collections import OrderedDict
 
 from core.const import (
@@ -25,7 +24,6 @@ from core.const import (
 )
 from core.event import MakeEvent
 from core.utility import (
-    datetime_to_timestamp,
     timestamp_to_datetime,
     date_str_to_int,
     get_exchange,
@@ -36,8 +34,14 @@ from core.utility import (
 )
 from core.object import OrderData, StopOrder, TradeData
 from core.context import Context
-from engine.event_manager import EventManager
-from data_center.get_data import GetMongoData, GetSqliteData
+from core.bar_store import BarStore
+from core.trading_calendar import TradingCalendar
+from core.index_membership import IndexMembership
+from core.event_journal import EventJournalWriter
+from engine.event_manager import BacktestEventManager
+from engine.order_matching import LimitOrderMatcher, StopOrderBook
+from data_center.get_data import GetSqliteData
+from data_center.bar_feed import BarStoreFeed, MinuteReplayFeed, daily_batches
 
 
 class EmptyClass(object):
@@ -50,15 +54,16 @@ class StrategyBaseBacktestStock(object):
         self.run_mode = None
         self.start = None
         self.end = None
-        self.interval = None
+        self.interval = None    # 推送行情的周期，为 Interval.MIN 时回放股票池的分钟分区存储 MinuteBarStore
         self.account = None
         self.benchmark = None
         self.rights_adjustment = None
         self.universe = None
         self.set_slippage_type = None
 
-        # self.get_data = GetMongoData()  # 从 mongodb 取数据
+        # self.get_data = GetMongoData()  # 从 mongodb 取数据，需从 data_center.get_data 导入 GetMongoData
         self.get_data = GetSqliteData()  # 从 sqlite 取数据
+        # self.get_data = GetArrowData()  # 从按年分区的 parquet 文件取数据，需导入 GetArrowData
         self.timestamp = None
         self.datetime = None
         self.bar_index = None
@@ -66,20 +71,27 @@ class StrategyBaseBacktestStock(object):
         self.activate_trade_signal = False
         self.is_universe_dynamic = False
         self.universe = None
-        self.index_members = DataFrame()
+        self.index_membership = None    # 动态股票池所用指数的成分股区间索引
+        self.universe_members = frozenset()     # 当前的指数成分股
         self.universe_limit = universe_limit
 
         self.context = Context(self.gateway)  # 记录、计算交易过程中各类信息
+        self.limit_order_matcher = LimitOrderMatcher(self.context.slippage_dict)  # 未成交限价单的批量撮合
+        self.stop_order_book = StopOrderBook()  # 未触发止损单按触发价排序的止损单簿
+        self.event_journal = None  # 委托、成交、持仓、资金变动的二进制事件日志，由 set_event_journal 开启
         self.fields = ['open', 'high', 'low', 'close', 'volume']
+        self.lazy_market_data = None    # 两级行情数据的参数，由 set_lazy_market_data 开启
+        self.bar_feed = None    # 推动回测时间的行情推送 BarFeed，未设置时由 daily_data 逐日推送
 
-        # 事件驱动引擎实例化
-        self.event_engine = EventManager()
+        # 事件驱动引擎实例化，回测用不加锁的同步事件管理器
+        self.event_engine = BacktestEventManager()
 
         # 各类事件的监听/回调函数注册
         self.event_engine.register(Event.BAR, self.update_bar)
-        self.event_engine.register(Event.ORDER, self.handle_order)
+        self.event_engine.register(Event.ORDER, self.handle_order_)
         self.event_engine.register(Event.PORTFOLIO, self.handle_portfolio_risk)
         self.event_engine.register(Event.TRADE, self.handle_trade_)
+        self.event_engine.register(Event.POOL, self.handle_pool)
         # self.event_engine.register_general(self.update_bar_info)
 
         # 绩效指标
@@ -108,6 +120,37 @@ class StrategyBaseBacktestStock(object):
                                                      "min_commission": min_commission
                                                      }
 
+    # 回测事件日志
+    def set_event_journal(self, file_path, batch_size=1024):
+        """把每根 bar、每次委托状态变化、成交及成交后的持仓、资金写入二进制事件日志，用 EventJournalReader 读取"""
+        self.event_journal = EventJournalWriter(file_path, batch_size)
+
+    # 两级行情数据
+    def set_lazy_market_data(self, block_size=250, max_blocks=256):
+        """
+        只把收盘价、成交量读入内存，其他字段按 (代码, block_size 个交易日) 分块在用到时从数据库读取，
+        最多缓存 max_blocks 块，全市场、长周期回测的内存占用有上限；目前只支持 GetSqliteData
+        """
+        self.lazy_market_data = {'block_size': block_size, 'max_blocks': max_blocks}
+
+    # 行情推送
+    def set_bar_feed(self, bar_feed):
+        """
+        由 BarFeed 推送的行情推动回测，如 BarFeed([SqliteCursorSource(...), MongoCursorSource(...)])，
+        每个交易日一个 BAR 事件，event_bar.data 为该日推送的 {代码: 字段值 tuple}；分钟等日内推送按交易日分组，
+        event_bar.data 为该日的 [(timetag, {代码: 字段值 tuple}), ...]
+        推送中出现日历以外的日期时加入交易日历；委托撮合、账户估值仍按日线从 daily_data 取数
+        """
+        self.bar_feed = bar_feed
+
+    # 动态股票池的成分股
+    def set_index_membership(self, index_membership):
+        """
+        指定动态股票池所用的成分股区间索引，如 IndexMembership.from_sqlite(conn, '000905.SH')；
+        不从 GetSqliteData 取数时，沪深300 以外的指数需要先调用此方法
+        """
+        self.index_membership = index_membership
+
     def set_black_list(self):
         """设置黑名单"""
         pass
@@ -117,113 +160,105 @@ class StrategyBaseBacktestStock(object):
         if self.account:
             self.context.init_account(self.account)
 
-        # 从数据库读取数据
-        # todo: 现在先将所有数据都取到内存，以后为了减少内存占用，考虑只读入close（每个bar上都要用来计算账户净值，必须读入内存中），
-        #  其他数据用到时才从数据库中取，交易次数不多的话，对速度的影响不大。
+        # 从数据库读取数据，开启 set_lazy_market_data 时只有收盘价、成交量常驻内存，其他字段用到时才从数据库中取
         if not self.universe:
             self.update_universe(self.start)
 
         symbol_all_list = self.universe + [self.benchmark]
-        daily_data = self.get_data.get_all_market_data(all_symbol_code=symbol_all_list,
-                                                       field=self.fields,
-                                                       start=self.start,
-                                                       end=self.end,
-                                                       interval=Interval.DAILY)
-        self.context.daily_data = daily_data[daily_data['volume'] > 0]
-        # 将 benchmark 的时间轴转成时间戳 list，最后转成迭代器，供推送时间事件用
-        self.context.benchmark_index = [datetime_to_timestamp(str(int(i)), '%Y%m%d')
-                                        for i in self.context.daily_data["close"].loc[self.benchmark].index]
-        bmi_iter = iter(self.context.benchmark_index)
+        if self.lazy_market_data is not None:
+            if not isinstance(self.get_data, GetSqliteData):
+                raise ValueError('两级行情数据只支持 GetSqliteData，当前数据源 {0} 请不要调用 set_lazy_market_data'.format(
+                    type(self.get_data).__name__))
+            daily_data = self.get_data.get_lazy_market_data(all_symbol_code=symbol_all_list,
+                                                            field=self.fields,
+                                                            start=self.start,
+                                                            end=self.end,
+                                                            **self.lazy_market_data)
+        else:
+            daily_data = self.get_data.get_all_market_data(all_symbol_code=symbol_all_list,
+                                                           field=self.fields,
+                                                           start=self.start,
+                                                           end=self.end,
+                                                           interval=Interval.DAILY)
+        if not isinstance(daily_data, BarStore):
+            daily_data = BarStore.from_frame(daily_data)
+        self.context.daily_data = daily_data.mask_invalid('volume')
+        # 任一代码有 bar 的日期都是交易日，日期、时间戳的转换都预先算好；推送中出现日历以外的日期时再加入日历
+        self.context.calendar = TradingCalendar(daily_data.dates[daily_data.valid.any(axis=0)])
+        # 未设置 BarFeed 时由 daily_data 逐日推送，推送的是只读视图，策略取用某个代码时才读取字段值；
+        # interval 为 Interval.MIN 时回放股票池的分钟行情，每个交易日一个 BAR 事件，带该日的全部分钟 bar
+        if self.bar_feed is not None:
+            bar_feed = self.bar_feed
+        elif self.interval == Interval.MIN:
+            minute_store = self.get_data.get_all_market_data(all_symbol_code=symbol_all_list,
+                                                             field=self.fields,
+                                                             start=self.start,
+                                                             end=self.end,
+                                                             interval=Interval.MIN)
+            if minute_store is None:
+                raise ValueError('分钟行情回放只支持 GetSqliteData，当前数据源 {0} 没有分钟分区存储'.format(
+                    type(self.get_data).__name__))
+            bar_feed = MinuteReplayFeed(minute_store, self.universe, self.start, self.end, self.fields)
+        else:
+            bar_feed = BarStoreFeed(self.context.daily_data, self.fields)
+        feed_iter = daily_batches(bar_feed)
 
         self.bar_index = 0
         # self.event_engine.start()
         while True:
             # todo：以后外围包裹一个父函数，用来进行时间控制，只在交易时间内启动
-            try:
-                cur_event = self.event_engine.get()
-            except Empty:
-                try:
-                    self.timestamp = next(bmi_iter)
-                    self.datetime = timestamp_to_datetime(self.timestamp, format="%Y%m%d")
-                    event_bar = MakeEvent(Event.BAR, self.datetime, self.gateway)
-                    self.event_engine.put(event_bar)
-                except StopIteration:
-                    self.context.logger.info('策略运行完成，开始计算绩效。')
-                    break
-            else:
+            cur_event = self.event_engine.get()
+            if cur_event is not None:
                 # 监听/回调函数根据事件类型处理事件
                 self.event_engine.event_process(cur_event)
                 # sleep(0.8)      # 模拟实时行情中每个行情之间的时间间隔
+                continue
+
+            # 事件队列处理完，推送下一根 bar
+            bar = next(feed_iter, None)
+            if bar is None:
+                self.context.logger.info('策略运行完成，开始计算绩效。')
+                self.context.logger.flush()
+                if self.event_journal is not None:
+                    self.event_journal.close()
+                # 两级行情数据停止后台读取线程、关闭数据库连接
+                if hasattr(self.context.daily_data, 'close'):
+                    self.context.daily_data.close()
+                break
+            date, bars = bar
+            bar_pos = self.context.calendar.add(date)
+            self.timestamp = int(self.context.calendar.timestamps[bar_pos])
+            self.datetime = self.context.calendar.strings[bar_pos]
+            self.context.benchmark_index.append(self.timestamp)
+            event_bar = MakeEvent(Event.BAR, self.datetime, bars)
+            self.event_engine.put(event_bar)
 
     def deal_limit_order(self, event_bar, cur_mkt_data):
         """处理未成交限价单，如有成交即新建成交事件"""
         # self.context.logger.info("-- this is deal_limit_order() @ {0}".format(event_market.dt))
 
-        # 逐个未成交委托进行判断
-        for order in list(self.context.active_limit_orders.values()):
-            # 只处理已发出的（状态为“未成交”）未成交委托
-            if order.status == Status.SUBMITTING:
-                continue
-
-            # 只处理有市场数据的(停牌则当日数据为 -1)
-            cur_open = self.get_data.get_market_data(self.context.daily_data,
-                                                     all_symbol_code=[order.symbol],
-                                                     field=["open"],
-                                                     start=event_bar.dt,
-                                                     end=event_bar.dt)
-            if isna(cur_mkt_data['open'][order.symbol]) or cur_open < 0:
-                continue
-
-            long_cross_price = cur_mkt_data['low'][order.symbol]
-            short_cross_price = cur_mkt_data['high'][order.symbol]
-            long_best_price = cur_mkt_data['open'][order.symbol]
-            short_best_price = cur_mkt_data['open'][order.symbol]
-
-            # 检查限价单是否能被成交
-            long_cross = ((order.direction == Direction.LONG and order.offset == Offset.OPEN)
-                          or (order.direction == Direction.SHORT and order.offset == Offset.CLOSE)
-                          and order.price >= long_cross_price > 0
-                          )
-
-            short_cross = ((order.direction == Direction.SHORT and order.offset == Offset.OPEN)
-                           or (order.direction == Direction.LONG and order.offset == Offset.CLOSE)
-                           and order.price <= short_cross_price
-                           and short_cross_price > 0
-                           )
-
-            if long_cross or short_cross:
-                symbol_type_short = order.symbol_type.value.split('_')[0]
-
-                # 成交价格算上滑点的影响
-                if long_cross:
-                    trade_price = min(order.price, long_best_price)
-
-                    if self.context.slippage_dict[symbol_type_short]["slippage_type"] == Slippage.FIX:
-                        trade_price += self.context.slippage_dict[symbol_type_short]["value"]
-                    elif self.context.slippage_dict[symbol_type_short]["slippage_type"] == Slippage.PERCENT:
-                        trade_price *= (1 + self.context.slippage_dict[symbol_type_short]["value"])
-
-                else:
-                    trade_price = max(order.price, short_best_price)
-                    if self.context.slippage_dict[symbol_type_short]["slippage_type"] == Slippage.FIX:
-                        trade_price -= self.context.slippage_dict[symbol_type_short]["value"]
-                    elif self.context.slippage_dict[symbol_type_short]["slippage_type"] == Slippage.PERCENT:
-                        trade_price *= (1 - self.context.slippage_dict[symbol_type_short]["value"])
-
+        # 全部未成交委托一次批量撮合，再逐个生成委托、成交事件
+        orders = list(self.context.active_limit_orders.values())
+        tradable, crossed, trade_prices, open_prices = self.limit_order_matcher.match(orders,
+                                                                                      self.context.daily_data,
+                                                                                      self.context.calendar.to_int(event_bar.dt))
+        for ii in np.flatnonzero(tradable):
+            order = orders[ii]
+            if crossed[ii]:
                 # 委托单被成交了，相应的属性变更
                 order.filled_volume = order.order_volume
                 order.filled_datetime = event_bar.dt
-                order.filled_price = round(trade_price, 2)
+                order.filled_price = round(float(trade_prices[ii]), 2)
                 order.status = Status.ALL_TRADED
                 # self.context.limit_orders[order.order_id].status = Status.ALL_TRADED
 
-                self.context.bar_order_data_dict[order.symbol] = deepcopy(order)
+                self.context.bar_order_data_dict[order.symbol] = order.copy()
 
                 # live状态下的运行逻辑是将 event_order 事件送到队列中，
                 # 但是在回测中暂无法并行处理，直接调用 handle_order 更好一些
                 event_order = MakeEvent(Event.ORDER, event_bar.dt, order)
                 # self.event_engine.put(event_order)
-                self.handle_order(event_order)
+                self.handle_order_(event_order)
 
                 # 将当前委托单从未成交委托单清单中去掉
                 self.context.active_limit_orders.pop(order.order_id)
@@ -253,24 +288,22 @@ class StrategyBaseBacktestStock(object):
 
             # 如果委托单本次不能被成交（即挂出买入委托单时价格跳空高开，或者卖出委托单时价格跳空低开）
             # 就将原委托单撤回，按当前 bar 的 open 重新下单
-            # elif not long_cross and not short_cross:
             else:
                 # 不能正常触发时的处理方式：撤单后追单
-                order_new = deepcopy(order)
+                order_new = order.copy()
 
                 # 原委托单撤销
                 order.cancel_datetime = event_bar.dt
                 self.context.limit_orders[order.order_id].status = Status.WITHDRAW
                 self.context.active_limit_orders.pop(order.order_id)
 
-                self.context.logger.info('-- {0} 的委托单 {1} 无法成交，撤回重发'.format(order.symbol, order.order_id))
+                self.context.logger.info('-- {0} 的委托单 {1} 无法成交，撤回重发', order.symbol, order.order_id)
                 event_order = MakeEvent(Event.ORDER, event_bar.dt, order)
-                self.handle_order(event_order)
+                self.handle_order_(event_order)
 
                 # 重新下单
                 order_new.order_datetime = event_bar.dt
                 order_new.order_id = generate_random_id('order')
-                order_new.order_price = cur_mkt_data['open'][order_new.symbol]
                 order_new.comments = order.comments + '_追单'
 
                 self.context.limit_orders[order_new.order_id] = order_new
@@ -284,41 +317,19 @@ class StrategyBaseBacktestStock(object):
                     cur_str = '卖出'
                     frozen_volume = 0
 
-                self.context.logger.info(
-                    "-- 资金账号 {0} 发出委托{1} {2} {3} 股，委托价为 {4}".format(order_new.account,
-                                                                    cur_str,
-                                                                    order_new.symbol,
-                                                                    order_new.order_volume,
-                                                                    order_new.order_price))
-                self.handle_order(event_order)
+                self.context.logger.info("-- 资金账号 {0} 发出委托{1} {2} {3} 股，委托价为 {4}",
+                                         order_new.account, cur_str, order_new.symbol, order_new.order_volume,
+                                         float(open_prices[ii]))
+                self.handle_order_(event_order)
 
                 # 新追单成交，相关状态更新
                 order_new.status = Status.ALL_TRADED
                 order_new.filled_volume = order_new.order_volume
                 order_new.filled_datetime = event_bar.dt
-
-                # 成交价格算上滑点的影响
-                long_cross = ((order_new.direction == Direction.LONG and order_new.offset == Offset.OPEN)
-                              or (order_new.direction == Direction.SHORT and order_new.offset == Offset.CLOSE))
-                short_cross = ((order_new.direction == Direction.SHORT and order_new.offset == Offset.OPEN)
-                               or (order_new.direction == Direction.LONG and order_new.offset == Offset.CLOSE))
-                symbol_type_short = order_new.symbol_type.value.split('_')[0]
-                trade_price = cur_mkt_data['open'][order.symbol]
-                if long_cross:
-                    if self.context.slippage_dict[symbol_type_short]["slippage_type"] == Slippage.FIX:
-                        trade_price += self.context.slippage_dict[symbol_type_short]["value"]
-                    elif self.context.slippage_dict[symbol_type_short]["slippage_type"] == Slippage.PERCENT:
-                        trade_price *= (1 + self.context.slippage_dict[symbol_type_short]["value"])
-                elif short_cross:
-                    trade_price = max(order.price, short_best_price)
-                    if self.context.slippage_dict[symbol_type_short]["slippage_type"] == Slippage.FIX:
-                        trade_price -= self.context.slippage_dict[symbol_type_short]["value"]
-                    elif self.context.slippage_dict[symbol_type_short]["slippage_type"] == Slippage.PERCENT:
-                        trade_price *= (1 - self.context.slippage_dict[symbol_type_short]["value"])
-                order_new.filled_price = round(trade_price, 2)
+                order_new.filled_price = round(float(trade_prices[ii]), 2)
 
                 event_order = MakeEvent(Event.ORDER, event_bar.dt, order_new)
-                self.handle_order(event_order)
+                self.handle_order_(event_order)
 
                 # 新建交易事件并送入事件驱动队列中
                 trade = TradeData(symbol=order_new.symbol,
@@ -354,29 +365,17 @@ class StrategyBaseBacktestStock(object):
         """处理未成交止损单"""
         # self.context.logger.info("-- this is deal_stop_order() @ {0}.".format(event_market.dt))
 
-        # 逐个未成交委托进行判断
-        for stop_order in list(self.context.active_stop_orders.values()):
-            long_cross_price = cur_mkt_data['high'][stop_order.symbol]
-            short_cross_price = cur_mkt_data['low'][stop_order.symbol]
-            long_best_price = cur_mkt_data['open'][stop_order.symbol]
-            short_best_price = cur_mkt_data['open'][stop_order.symbol]
-
-            # 检查止损单是否能被触发
-            long_cross = (
-                    stop_order.direction == Direction.LONG
-                    and stop_order.price <= long_cross_price
-            )
-
-            short_cross = (
-                    stop_order.direction == Direction.SHORT
-                    and stop_order.price >= short_cross_price
-            )
-
-            # 如果委托单仍然不能被触发，则其所有状态都不改变，继续等待被触发
-            if not long_cross and not short_cross:
+        # 止损单簿按触发价二分查找出本 bar 被触发的止损单，未触发的止损单所有状态都不改变，继续等待被触发
+        cur_date = self.context.calendar.to_int(event_bar.dt)
+        for stop_order_id in self.stop_order_book.trigger(self.context.daily_data, cur_date):
+            # 已经从未成交止损单清单中去掉（撤销）的不再处理
+            stop_order = self.context.active_stop_orders.get(stop_order_id)
+            if stop_order is None:
                 continue
+            long_cross = stop_order.direction == Direction.LONG
+            best_price = self.context.daily_data.value('open', stop_order.symbol, cur_date)
 
-            # 否则新增一笔限价单（止损单在本地被触发后，最终以限价单形式发送到交易所）
+            # 新增一笔限价单（止损单在本地被触发后，最终以限价单形式发送到交易所）
             self.context.limit_order_count += 1
 
             order = OrderData(symbol=stop_order.symbol,
@@ -388,47 +387,40 @@ class StrategyBaseBacktestStock(object):
                               order_volume=stop_order.order_volume,
                               filled_volume=stop_order.order_volume,
                               status=Status.ALL_TRADED,
-                              account=stop_order.accnt,
+                              account=stop_order.account,
+                              gateway=self.gateway,
                               order_datetime=event_bar.dt,
-                              symbol_type=stop_order.symbol_sype,
+                              symbol_type=stop_order.symbol_type,
                               comments=stop_order.comments
                               )
 
             if long_cross:
-                trade_price = max(order.price, long_best_price)
+                trade_price = max(order.price, best_price)
             else:
-                trade_price = min(order.price, short_best_price)
+                trade_price = min(order.price, best_price)
 
             # 委托单被成交了，相应的属性变更
             order.filled_price = trade_price
-            order.filled_datetime = event_bar.dt,
+            order.filled_datetime = event_bar.dt
 
             self.context.limit_orders[order.order_id] = order
 
             # 更新止损单总清单中当前止损单的属性
-            self.context.stop_orders[stop_order.order_id].fill_datetime = event_bar.dt
+            self.context.stop_orders[stop_order.order_id].filled_datetime = event_bar.dt
             self.context.stop_orders[stop_order.order_id].status = StopOrderStatus.TRIGGERED
 
             # 将止损单及其转化成的limit单都加进来，保证信息不丢失
-            self.context.bar_order_data_dict[order.symbol] = [deepcopy(order),
-                                                              deepcopy(self.context.stop_orders[stop_order.order_id])]
+            self.context.bar_order_data_dict[order.symbol] = [order.copy(),
+                                                              self.context.stop_orders[stop_order.order_id].copy()]
 
             # 未成交止损单清单中将本止损单去掉
-            if stop_order.order_id in self.context.active_stop_orders:
-                self.context.active_stop_orders.pop(stop_order.order_id)
+            self.context.active_stop_orders.pop(stop_order.order_id)
 
             # 止损单被触发，本地止损单转成限价单成交，新增order_event并送入队列中
             # event_order = Event(Event.ORDER, Event.BAR.dt, order)
             # self.event_engine.put(event_order)
 
             # 止损单被触发，新建一个成交对象
-            if long_cross:
-                trade_price = max(stop_order.price, long_best_price)
-                # pos_change = order.order_volume
-            else:
-                trade_price = min(stop_order.price, short_best_price)
-                # pos_change = -order.order_volume
-
             self.context.trade_count += 1
 
             trade = TradeData(symbol=order.symbol,
@@ -437,12 +429,14 @@ class StrategyBaseBacktestStock(object):
                               trade_id=generate_random_id('filled'),
                               direction=order.direction,
                               offset=order.offset,
+                              order_price=order.price,
                               price=trade_price,
                               volume=order.order_volume,
                               frozen=order.order_volume,
                               datetime=self.datetime,
                               gateway=self.gateway,
                               account=order.account,
+                              symbol_type=order.symbol_type,
                               comments=order.comments
                               )
 
@@ -477,18 +471,13 @@ class StrategyBaseBacktestStock(object):
 
         # 取最新的市场数据，看未成交订单在当前 bar 是否能成交
         cur_mkt_data = {'low': {}, 'high': {}, 'open': {}}
-        cur_date = date_str_to_int(event_bar.dt)
+        cur_date = self.context.calendar.to_int(event_bar.dt)
         position_symbol = [pos.symbol for pos in self.context.active_limit_orders.values()]
         cur_all_symbol = self.universe + position_symbol
         for uii in cur_all_symbol:
-            try:
-                cur_mkt_data['low'][uii] = self.context.daily_data['low'].loc[uii, cur_date]
-                cur_mkt_data['high'][uii] = self.context.daily_data['high'].loc[uii, cur_date]
-                cur_mkt_data['open'][uii] = self.context.daily_data['open'].loc[uii, cur_date]
-            except KeyError:
-                cur_mkt_data['low'][uii] = nan
-                cur_mkt_data['high'][uii] = nan
-                cur_mkt_data['open'][uii] = nan
+            cur_mkt_data['low'][uii] = self.context.daily_data.value('low', uii, cur_date)
+            cur_mkt_data['high'][uii] = self.context.daily_data.value('high', uii, cur_date)
+            cur_mkt_data['open'][uii] = self.context.daily_data.value('open', uii, cur_date)
         self.deal_limit_order(event_bar, cur_mkt_data)  # 处理委托时间早于当前bar的未成交限价单
         self.deal_stop_order(event_bar, cur_mkt_data)  # 处理委托时间早于当前bar的未成交止损单
 
@@ -517,6 +506,12 @@ class StrategyBaseBacktestStock(object):
 
         pass
 
+    def handle_order_(self, event_order):
+        """委托状态变化时先写入事件日志，再交给策略的 handle_order"""
+        if self.event_journal is not None:
+            self.event_journal.record('order', event_order.dt, event_order.data)
+        self.handle_order(event_order)
+
     def handle_trade_(self, event_trade):
         """
         订单成交后，在 context 中更新相关数据:
@@ -524,17 +519,15 @@ class StrategyBaseBacktestStock(object):
         2）并保存入 current_xx_data 中，随后 current_xxx_data 的最新值存入以当前 bar 的时间戳为 key 的 bar_xxx_data_dict 中
         """
         # self.context.logger.info('handle_trade() method @ {0}'.format(event_trade.data.datetime))
-        self.context.logger.info('-- {0} 的委托单 {1} 于 {2} 成交，成交价为 {3}'.format(event_trade.data.symbol,
-                                                                            event_trade.data.order_id,
-                                                                            event_trade.data.datetime,
-                                                                            event_trade.data.price))
+        self.context.logger.info('-- {0} 的委托单 {1} 于 {2} 成交，成交价为 {3}', event_trade.data.symbol,
+                                 event_trade.data.order_id, event_trade.data.datetime, event_trade.data.price)
 
         cur_symbol = event_trade.data.symbol
         cur_symbol_type = event_trade.data.symbol_type
         symbol_type_short = cur_symbol_type.value.split('_')[0]
 
         # context 中当前头寸信息更新为最新的成交信息
-        self.context.current_trade_data = deepcopy(event_trade.data)
+        self.context.current_trade_data = event_trade.data.copy()
 
         # 计算滑点成交价位
         # if self.context.slippage_dict[symbol_type_short]["slippage_type"] == Slippage.FIX:
@@ -722,6 +715,14 @@ class StrategyBaseBacktestStock(object):
                 # 做空平仓时
                 pass
 
+        if self.event_journal is not None:
+            self.event_journal.record('trade', event_trade.dt, self.context.current_trade_data)
+            if cur_symbol in self.context.bar_position_data_dict:
+                self.event_journal.record('position', event_trade.dt, self.context.bar_position_data_dict[cur_symbol])
+            if event_trade.data.account in self.context.bar_account_data_dict:
+                self.event_journal.record('account', event_trade.dt,
+                                          self.context.bar_account_data_dict[event_trade.data.account])
+
         # 交易完成，相应的委托清除
         self.context.refresh_current_data()
 
@@ -732,7 +733,7 @@ class StrategyBaseBacktestStock(object):
 
     def handle_timer(self, event_timer):
         """每隔固定时间，就获取一次账户状态数据，只在 live 模式中有效"""
-        self.context.logger.info('... di da di, {0} goes, updates account status'.format(event_timer.type_))
+        self.context.logger.info('... di da di, {0} goes, updates account status', event_timer.type_)
         pass
 
     def update_bar_info(self, event_bar: object):
@@ -748,6 +749,15 @@ class StrategyBaseBacktestStock(object):
         # 将每根bar上的资金、持仓、委托、成交存入以时间戳为键索引的字典变量中
         self.save_current_bar_data(event_bar.dt)
 
+        if self.event_journal is not None:
+            self.event_journal.record_values('bar', event_bar.dt,
+                                             bar_index=self.bar_index,
+                                             active_limit_orders=len(self.context.active_limit_orders),
+                                             active_stop_orders=len(self.context.active_stop_orders),
+                                             positions=len(self.context.bar_position_data_dict))
+            for account_data in self.context.bar_account_data_dict.values():
+                self.event_journal.record('account', event_bar.dt, account_data)
+
         # 更新当前bar的委托、交易情况
         self.context.refresh_bar_dict()
 
@@ -804,25 +814,32 @@ class StrategyBaseBacktestStock(object):
                                account=account,
                                gateway=self.gateway,
                                order_datetime=dt,
-                               comments=comments
+                               comments=comments,
+                               symbol_type=self.get_symbol_type(stock)
                                )
 
         self.context.active_stop_orders[stop_order.order_id] = stop_order
         self.context.stop_orders[stop_order.order_id] = stop_order
-        self.context.bar_order_data_dict[stop_order.symbol] = deepcopy(stop_order)
+        self.stop_order_book.add(stop_order)
+        self.context.bar_order_data_dict[stop_order.symbol] = stop_order.copy()
 
         event_order = MakeEvent(Event.ORDER, dt, stop_order)
         self.event_engine.put(event_order)
 
-    def send_limit_order(self, dt, account, symbol, direction, offset, price, volume, comments):
-        self.context.limit_order_count += 1
-        cur_exchange = get_exchange(symbol)
+    @staticmethod
+    def get_symbol_type(symbol):
+        """按代码后缀判断合约类型"""
         if symbol.split('.')[1] == 'SH':
-            cur_symbol_type = Product.STOCK_SH
+            return Product.STOCK_SH
         elif symbol.split('.')[1] == 'SZ':
-            cur_symbol_type = Product.STOCK_SZ
+            return Product.STOCK_SZ
         else:
-            cur_symbol_type = Product.FUTURES
+            return Product.FUTURES
+
+    def send_limit_order(self, dt, account, symbol, direction, offset, price, volume, comments):
+        self.context.limit_order_count += 1
+        cur_exchange = get_exchange(symbol)
+        cur_symbol_type = self.get_symbol_type(symbol)
 
         order = OrderData(symbol=symbol,
                           exchange=cur_exchange,
@@ -841,44 +858,26 @@ class StrategyBaseBacktestStock(object):
 
         self.context.active_limit_orders[order.order_id] = order
         self.context.limit_orders[order.order_id] = order
-        self.context.bar_order_data_dict[order.symbol] = deepcopy(order)
+        self.context.bar_order_data_dict[order.symbol] = order.copy()
 
         event_order = MakeEvent(Event.ORDER, dt, order)
         self.event_engine.put(event_order)
 
-    def data_to_dataframe(self, data_obj, data_dict, output_path):
-        data_property = [i for i in dir(data_obj) if i not in dir(deepcopy(EmptyClass()))]
-        data_property = [i for i in data_property if i[0] != '_']
-        if 'is_active' in data_property:
-            data_property.remove('is_active')
-
-        values = []
-        for timestamp in self.context.benchmark_index:
-            timestamp_data_list = []
-            dict_data = dict(data_dict[timestamp])
-            if len(dict_data) > 0:
-                for k, v in dict_data.items():
-                    timestamp_data_list.append([v.__dict__[property_data] for property_data in data_property])
-                values.extend(timestamp_data_list)
-
-        all_data = DataFrame(values, columns=data_property)
+    def data_to_dataframe(self, journal, output_path):
+        all_data = journal.to_frame()
         all_data.to_pickle(output_path)
         return all_data
 
     def strategy_analysis(self, output_path):
         """策略的绩效分析"""
         # 1、将 order、trade、position、account 数据转成 dataframe，并以 pkl 格式保存到指定目录
-        self.context.backtesting_record_order = self.data_to_dataframe(self.context.current_order_data,
-                                                                       self.context.order_data_dict,
+        self.context.backtesting_record_order = self.data_to_dataframe(self.context.order_journal,
                                                                        output_path + 'order_data.pkl')
-        self.context.backtesting_record_trade = self.data_to_dataframe(self.context.current_trade_data,
-                                                                       self.context.trade_data_dict,
+        self.context.backtesting_record_trade = self.data_to_dataframe(self.context.trade_journal,
                                                                        output_path + 'trade_data.pkl')
-        self.context.backtesting_record_position = self.data_to_dataframe(self.context.current_position_data,
-                                                                          self.context.position_data_dict,
+        self.context.backtesting_record_position = self.data_to_dataframe(self.context.position_journal,
                                                                           output_path + 'position_data.pkl')
-        self.context.backtesting_record_account = self.data_to_dataframe(self.context.current_account_data,
-                                                                         self.context.account_data_dict,
+        self.context.backtesting_record_account = self.data_to_dataframe(self.context.account_journal,
                                                                          output_path + 'account_data.pkl')
 
         # 2、计算绩效指标
@@ -889,7 +888,6 @@ class StrategyBaseBacktestStock(object):
                                                  start=self.start,
                                                  end=self.end
                                                  )
-        bm_nv = bm_close / bm_close.iloc[0]
 
         # 计算策略的净值，为消除 warning，用中间变量 x 处理一下
         strat_value = self.context.backtesting_record_account[['datetime', 'total_balance']]
@@ -899,6 +897,10 @@ class StrategyBaseBacktestStock(object):
 
         strat_nv = strat_value['total_balance'] / strat_value['total_balance'].iloc[0]
 
+        # benchmark 没有 bar 的交易日沿用前一日的收盘价，与策略净值逐日对齐
+        bm_close = bm_close.reindex(strat_nv.index).ffill()
+        bm_nv = bm_close / bm_close.iloc[0]
+
         # 计算收益率、年化收益率
         bt_period = (to_datetime(str(self.end)) - to_datetime(str(self.start))).days / 365
         bm_ret = bm_nv.iloc[-1] / bm_nv.iloc[0] - 1
@@ -1005,12 +1007,12 @@ class StrategyBaseBacktestStock(object):
     def show_results(self, output_path):
         """将策略绩效分析结果保存到 html 文件中"""
         # 结果打印，必须用英文，否则排版有问题
-        last_timestamp = list(self.context.account_data_dict)[-1]
+        account_record = self.context.backtesting_record_account
+        final_equity = account_record[account_record['account_id'] == self.account[0]['name']]['total_balance'].iloc[-1]
         results = {'Start Date': self.start,
                    'End Date': self.end,
                    'Initial Equity': round(self.account[0]['equity'], 2),
-                   'Final Equity': round(
-                       self.context.account_data_dict[last_timestamp][self.account[0]['name']].total_balance, 2),
+                   'Final Equity': round(final_equity, 2),
                    'total commission': round(self.performance_indicator['total commission'], 4),
                    'Benchmark Annual Return % (arith)': round(self.performance_indicator['bm_annnual_ret_arith'] * 100,
                                                               4),
@@ -1057,12 +1059,13 @@ class StrategyBaseBacktestStock(object):
     def update_position_frozen(self, dt):
         """处理当日情况前，先更新当日股票的持仓冻结数量"""
         if self.bar_index > 0 and self.context.bar_position_data_dict:
+            cur_date = self.context.calendar.to_int(dt)
             for position_data in self.context.bar_position_data_dict.values():
                 cur_price = self.get_data.get_market_data(self.context.daily_data,
                                                           all_symbol_code=[position_data.symbol],
                                                           field=["open"],
-                                                          start=dt,
-                                                          end=dt)
+                                                          start=cur_date,
+                                                          end=cur_date)
                 if cur_price > 0:
                     if position_data.frozen != 0:
                         position_data.frozen = 0
@@ -1084,7 +1087,7 @@ class StrategyBaseBacktestStock(object):
         1、基于close，更新每个持仓的持仓盈亏，更新账户总资产
         2、已冻结持仓、资金的解冻，涉及到在不同 bar 上的情况，这里暂时不处理
         """
-        dt_ = dt[:4] + '-' + dt[4:6] + '-' + dt[6:]
+        cur_date = self.context.calendar.to_int(dt)
         if self.context.bar_position_data_dict:
             for account in self.context.bar_account_data_dict.values():
                 hold_balance = 0
@@ -1098,8 +1101,8 @@ class StrategyBaseBacktestStock(object):
                     cur_close = self.get_data.get_market_data(self.context.daily_data,
                                                               all_symbol_code=[position_data.symbol],
                                                               field=["close"],
-                                                              start=dt_,
-                                                              end=dt_)
+                                                              start=cur_date,
+                                                              end=cur_date)
 
                     position_data.datetime = dt
                     position_data.position_value_pre = position_data.position_value
@@ -1112,8 +1115,8 @@ class StrategyBaseBacktestStock(object):
                             frozen += position_data.position_value
                     else:
                         frozen += position_data.position_value
-                        self.context.logger.info('-- {0} 在 {1} 的 close price = -1'.format(position_data.symbol,
-                                                                                          position_data.datetime))
+                        self.context.logger.info('-- {0} 在 {1} 的 close price = -1', position_data.symbol,
+                                                 position_data.datetime)
                     hold_balance += position_data.position_value
                     position_data.position_pnl = position_data.position_value - \
                                                  position_data.init_volume * position_data.init_price
@@ -1133,12 +1136,17 @@ class StrategyBaseBacktestStock(object):
     def save_current_bar_data(self, dt: str):
         """记录每根bar的信息，包括资金、持仓、委托、成交等"""
         # print('-- save_current_bar_data() @ {0} 记录每根bar的信息，包括资金、持仓、委托、成交'.format(dt))
-        cur_timestamp = datetime_to_timestamp(dt)
-        self.context.order_data_dict[cur_timestamp] = self.context.bar_order_data_dict
-        self.context.trade_data_dict[cur_timestamp] = self.context.bar_trade_data_dict
-        self.context.position_data_dict[cur_timestamp] = deepcopy(self.context.bar_position_data_dict)
-        self.context.commission_data_dict[cur_timestamp] = deepcopy(self.context.bar_commission_data_dict)
-        self.context.account_data_dict[cur_timestamp] = deepcopy(self.context.bar_account_data_dict)
+        cur_timestamp = self.context.calendar.to_timestamp(dt)
+        for order_data in self.context.bar_order_data_dict.values():
+            # 止损单被触发时保存的是 [转成的限价单, 止损单]
+            if isinstance(order_data, list):
+                self.context.order_journal.extend(order_data)
+            else:
+                self.context.order_journal.append(order_data)
+        self.context.trade_journal.extend(self.context.bar_trade_data_dict.values())
+        self.context.position_journal.extend(self.context.bar_position_data_dict.values())
+        self.context.commission_data_dict[cur_timestamp] = dict(self.context.bar_commission_data_dict)
+        self.context.account_journal.extend(self.context.bar_account_data_dict.values())
 
     def prior_risk_control(self, dt, account, symbol, diretion, offset, price, volume):
         """市场数据触发的交易信号，需要事前风控审核"""
@@ -1197,7 +1205,7 @@ class StrategyBaseBacktestStock(object):
                     res = False
 
                 if res and dt_int in self.context.ex_rights_dict[cur_pos.symbol].keys():
-                    self.context.logger.info('-- {0} 今日 {1} 除权除息，所持仓位量价相应变动'.format(cur_pos.symbol, dt))
+                    self.context.logger.info('-- {0} 今日 {1} 除权除息，所持仓位量价相应变动', cur_pos.symbol, dt)
 
                     # 换算当前持仓除权除息之后的量
                     cur_rights_price = cur_pos.position_value / cur_pos.volume
@@ -1248,7 +1256,7 @@ class StrategyBaseBacktestStock(object):
                     res = False
 
                 if res and dt_int in self.context.ex_rights_dict[cur_order.symbol].keys():
-                    self.context.logger.info('-- {0} 今日 {1} 除权除息，委托单量价相应变动'.format(cur_order.symbol, dt))
+                    self.context.logger.info('-- {0} 今日 {1} 除权除息，委托单量价相应变动', cur_order.symbol, dt)
 
                     # 除权除息价 = [(股权登记日收盘价 - 股息）+配股价 * 配股比例 * 配股发行结果] / （1+送股转增导致股份变动比例）
                     cur_price = cur_order.price
@@ -1263,7 +1271,7 @@ class StrategyBaseBacktestStock(object):
                     volume_new = (cur_price - cur_dividend) * cur_order.order_volume / price_new
 
                     # 更新持仓信息：原委托单撤除，按新参数发出新委托单
-                    order_new = deepcopy(cur_order)
+                    order_new = cur_order.copy()
                     order_new.order_id = generate_random_id('order')
                     order_new.order_datetime = dt
                     order_new.price = price_new
@@ -1275,7 +1283,7 @@ class StrategyBaseBacktestStock(object):
                     self.context.limit_orders[cur_order.order_id].status = Status.WITHDRAW
                     self.context.limit_orders[cur_order.order_id].cancel_datetime = dt
                     order_event = MakeEvent(Event.ORDER, dt, cur_order)
-                    self.handle_order(order_event)
+                    self.handle_order_(order_event)
                     # self.context.logger.info(
                     #     "-- {0} 的委托单 {1} 当前状态是 {2}".format(cur_order.symbol, cur_order.order_id, cur_order.status))
 
@@ -1284,11 +1292,10 @@ class StrategyBaseBacktestStock(object):
                         offset_str = '买入'
                     else:
                         offset_str = '卖出'
-                    self.context.logger.info(
-                        "-- 资金账号 {0} 发出委托{0} {1} {2} 股，委托价为 {3}".format(order_new.account, offset_str,
-                                                                        order_new.symbol, order_new.price))
+                    self.context.logger.info("-- 资金账号 {0} 发出委托{0} {1} {2} 股，委托价为 {3}", order_new.account,
+                                             offset_str, order_new.symbol, order_new.price)
                     order_event = MakeEvent(Event.ORDER, dt, order_new)
-                    self.handle_order(order_event)
+                    self.handle_order_(order_event)
 
     def order_move_warehouse(self, dt: str):
         """期货订单发出之前，如果主力合约换月，需要将持仓移仓"""
@@ -1296,27 +1303,44 @@ class StrategyBaseBacktestStock(object):
         if self.context.bar_order_data_dict:
             pass
 
+    def load_index_membership(self, index_code: str) -> IndexMembership:
+        """
+        动态股票池所用指数的成分股区间索引
+        沪深300 沿用原先的成分股 pkl 文件，其他指数从数据库读取：申万行业指数（.SI）取 SWINDEXMEMBERS 表，其余取 AINDEXMEMBERS 表
+        """
+        if index_code == '000300.SH':
+            return IndexMembership.from_frame(
+                read_pickle(r'D:/python projects/quandomo/data_center/data/xctushare/hs300_members.pkl'))
+        if not isinstance(self.get_data, GetSqliteData):
+            raise ValueError('{0} 的成分股需从 sqlite 数据库读取，当前数据源 {1} 不支持，'
+                             '请先调用 set_index_membership 指定成分股'.format(index_code, type(self.get_data).__name__))
+        table = 'SWINDEXMEMBERS' if index_code.endswith('.SI') else 'AINDEXMEMBERS'
+        return IndexMembership.from_sqlite(self.get_data.conn, index_code, table)
+
     def update_universe(self, dt: str):
+        """动态股票池按当日的指数成分股更新，成分股有变动时才重建股票池并发出 POOL 事件"""
         # print('-- * 合约池更新 *')
-        update_universe = False
-        if isinstance(self.is_universe_dynamic, str):
-            update_universe = True
-
-            if len(self.index_members.index) == 0:
-                self.index_members = \
-                    read_pickle(r'D:/python projects/quandomo/data_center/data/xctushare/hs300_members.pkl')
-
-        # 动态股票池，每天更新一次股票池
-        if update_universe:
-            dt_int = int(dt)
-            try:
-                cur_universe1 = self.index_members[(self.index_members['in_date'] <= dt_int) & (self.index_members['out_date'] > dt_int)]['stock_code'].values
-                cur_universe2 = self.index_members[(self.index_members['in_date'] <= dt_int) & (self.index_members['out_date'] == 0)]['stock_code'].values
-                cur_universe = set(hstack((cur_universe1, cur_universe2)))
-            except BaseException:
-                pass
-            else:
-                self.universe = list(cur_universe)
+        if not isinstance(self.is_universe_dynamic, str):
+            return
+
+        if self.index_membership is None:
+            self.index_membership = self.load_index_membership(self.is_universe_dynamic)
+
+        cur_members = self.index_membership.members(int(dt))
+        if cur_members is self.universe_members and self.universe is not None:
+            return
+        added = sorted(cur_members - self.universe_members)
+        removed = sorted(self.universe_members - cur_members)
+        self.universe_members = cur_members
+        self.universe = list(cur_members)
+        if added or removed:
+            event_pool = MakeEvent(Event.POOL, str(dt), {'added': added, 'removed': removed})
+            self.event_engine.put(event_pool)
+
+    def handle_pool(self, event_pool):
+        """股票池变动时的监听/回调函数，event_pool.data 为 {'added': 纳入的代码, 'removed': 剔除的代码}"""
+        self.context.logger.info('-- {0} 股票池纳入 {1} 只，剔除 {2} 只', event_pool.dt,
+                                 len(event_pool.data['added']), len(event_pool.data['removed']))
 
     def update_black_list(self, dt: str):
         # print('-- * 黑名单更新 *')
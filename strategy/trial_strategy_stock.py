@@ -1,18 +1,22 @@
 # -*- coding: utf-8 -*-
 
-import talib
-from numpy import array
-from pandas import Timedelta, to_datetime, isnull
+from numpy import array, errstate, flatnonzero
 from time import strftime
 
 from core.const import RunMode, RightsAdjustment, Product, Slippage, Direction
 from core.utility import date_str_to_int, Timer, Logger, ColorLogger
+from core.indicator import panel_sma
+from core.trading_calendar import TradingCalendar
 from strategy.strategy_base_backtest import StrategyBaseBacktestStock
 
 
 class TrialStrategyStock(StrategyBaseBacktestStock):
     def __init__(self, universe_limit):
         super(TrialStrategyStock, self).__init__(universe_limit)
+        self.close_panel = None     # 收盘价面板，日期 × 代码，列顺序与 context.daily_data.symbols 相同
+        self.valid_panel = None
+        self.ma5 = None
+        self.ma20 = None
 
     def init_strategy(self, log_full_path: list, color_log=True, start_str='20180101', end_str='20200222'):  # 确定参数值
         self.gateway = 'ctp'
@@ -45,91 +49,93 @@ class TrialStrategyStock(StrategyBaseBacktestStock):
             self.context.logger = Logger(log_full_path[0])
         else:
             self.context.logger = ColorLogger(log_full_path[0] + log_full_path[1])      # color log
+        # self.set_event_journal(log_full_path[0] + 'events.bin')     # 委托、成交、持仓、资金变动写入二进制事件日志
+        # self.set_lazy_market_data(block_size=250, max_blocks=256)     # 只有收盘价、成交量常驻内存
 
     def calc_position_size(self, account_available, symbol_price):
         psize = account_available / len(self.universe) * 0.9 / symbol_price
         psize = int(psize / 100) * 100
         return psize
 
+    def init_indicators(self):
+        """
+        一次算出整个回测区间全部代码的 5 日、20 日均线面板（日期 × 代码），每根 bar 按日期序号取一行
+        与原先逐个代码取最近 60 个自然日的收盘价再算 talib.MA 相同：只用有效 bar，窗口最早只能用到 60 天前的数据
+        """
+        daily_data = self.context.daily_data
+        dates, self.close_panel, self.valid_panel = daily_data.panel('close')
+        first_index = TradingCalendar(dates).lookback_index(60)
+        self.ma5 = panel_sma(self.close_panel, self.valid_panel, 5, first_index)
+        self.ma20 = panel_sma(self.close_panel, self.valid_panel, 20, first_index)
+
     def handle_bar(self, event_bar):
-        self.context.logger.info("handle_bar() @ {0}".format(event_bar.dt))
+        self.context.logger.info("handle_bar() @ {0}", event_bar.dt)
         self.activate_trade_signal = False
 
         available_position_dict = self.context.bar_position_data_dict
         account_data = self.context.current_account_data
 
-        current_date_int = date_str_to_int(event_bar.dt)
-        cur_start_date = to_datetime(event_bar.dt) - Timedelta(days=60)
-        cur_start_date_int = date_str_to_int(str(cur_start_date)[:10])
+        if self.ma5 is None:
+            self.init_indicators()
+        current_date_int = self.context.calendar.to_int(event_bar.dt)
+        t = self.context.daily_data.date_index.get(current_date_int)
+        if t is None:
+            return
+        symbol_index = self.context.daily_data.symbol_index
+        close_price = self.close_panel[t]
+
+        # 旧持仓中 5 日均线跌破 20 日均线的（当日停牌或均线无效时比较结果为 False）
+        pos_symbols = [s for s in available_position_dict.keys() if s in symbol_index]
+        pos_index = array([symbol_index[s] for s in pos_symbols], dtype=int)
+        with errstate(invalid='ignore'):
+            sell_signal = self.valid_panel[t, pos_index] & (self.ma5[t, pos_index] < self.ma20[t, pos_index])
 
         # 循环处理旧持仓
-        for pos_symbol in available_position_dict.keys():
-            close_price = self.get_data.get_market_data(self.context.daily_data,
-                                                        all_symbol_code=[pos_symbol],
-                                                        field=["close"],
-                                                        start=cur_start_date_int,
-                                                        end=current_date_int)
-            if len(close_price) > 0:
-                # 指标计算
-                ma5 = talib.MA(array(close_price), timeperiod=5)
-                ma20 = talib.MA(array(close_price), timeperiod=20)
-
-                if current_date_int in close_price.keys() and (not isnull(ma5[-1])) and (not isnull(ma20[-1])):
-                    if ma5[-1] < ma20[-1]:
-                        if available_position_dict[pos_symbol].volume > 0 and available_position_dict[pos_symbol].direction == Direction.LONG:
-                            self.activate_trade_signal = True
-                            pos_abs = abs(available_position_dict[pos_symbol].volume)
-                            comments = "限价卖出"
-                            self.sell(event_bar.dt, self.account[0]['name'], pos_symbol,
-                                      close_price.iloc[-1], pos_abs, False, comments)
-
-                            self.context.logger.info(
-                                "-- 资金账号 {3} 发出委托卖出 {0} {1} 股，委托价为 {2}".format(pos_symbol, pos_abs,
-                                                                               close_price.iloc[-1],
-                                                                               self.account[0]['name']))
-
-        # 循环遍历股票池，看是否有新信号
-        for symbol in self.universe:
-            # 取当前股票的数据
-            close_price = self.get_data.get_market_data(self.context.daily_data,
-                                                        all_symbol_code=[symbol],
-                                                        field=["close"],
-                                                        start=cur_start_date_int,
-                                                        end=current_date_int)
-            # close_array = array(close_price)
-            if len(close_price) > 0:
-                # 指标计算
-                ma5 = talib.MA(array(close_price), timeperiod=5)
-                ma20 = talib.MA(array(close_price), timeperiod=20)
-
-                # 数据有效时才判断
-                if current_date_int in close_price.keys() and (not isnull(ma5[-1])) and (not isnull(ma20[-1])):
-                    # 如果5日均线突破20日均线，并且没有持仓，则买入这只股票100股，委托价为当前bar的收盘价
-                    if ma5[-1] > ma20[-1]:
-                        # live模式下，此处需要更新一次持仓状态，这样判别持仓才准确
-                        if symbol not in available_position_dict.keys():
-                            self.activate_trade_signal = True
-                            comments = "限价买入"
-                            # psize = self.calc_position_size(account_data.available, close_price.iloc[-1])
-                            psize = 300
-                            if psize > 0:
-                                self.buy(event_bar.dt, self.account[0]['name'], symbol, close_price.iloc[-1],
-                                         psize, False, comments)
-
-                                self.context.logger.info(
-                                    "-- 资金账号 {0} 发出委托买入 {1} {2} 股，委托价为 {3}".format(self.account[0]['name'],
-                                                                                   symbol, psize, close_price.iloc[-1]))
+        for ii in flatnonzero(sell_signal):
+            pos_symbol = pos_symbols[ii]
+            if available_position_dict[pos_symbol].volume > 0 and available_position_dict[pos_symbol].direction == Direction.LONG:
+                self.activate_trade_signal = True
+                pos_abs = abs(available_position_dict[pos_symbol].volume)
+                comments = "限价卖出"
+                price = close_price[pos_index[ii]]
+                self.sell(event_bar.dt, self.account[0]['name'], pos_symbol, price, pos_abs, False, comments)
+
+                self.context.logger.info("-- 资金账号 {3} 发出委托卖出 {0} {1} 股，委托价为 {2}",
+                                         pos_symbol, pos_abs, price, self.account[0]['name'])
+
+        # 股票池中 5 日均线突破 20 日均线的
+        symbols = [s for s in self.universe if s in symbol_index]
+        universe_index = array([symbol_index[s] for s in symbols], dtype=int)
+        with errstate(invalid='ignore'):
+            buy_signal = self.valid_panel[t, universe_index] & \
+                         (self.ma5[t, universe_index] > self.ma20[t, universe_index])
+
+        # 循环遍历有新信号的股票
+        for ii in flatnonzero(buy_signal):
+            symbol = symbols[ii]
+            # 如果5日均线突破20日均线，并且没有持仓，则买入这只股票100股，委托价为当前bar的收盘价
+            # live模式下，此处需要更新一次持仓状态，这样判别持仓才准确
+            if symbol not in available_position_dict.keys():
+                self.activate_trade_signal = True
+                comments = "限价买入"
+                # psize = self.calc_position_size(account_data.available, close_price[universe_index[ii]])
+                psize = 300
+                price = close_price[universe_index[ii]]
+                if psize > 0:
+                    self.buy(event_bar.dt, self.account[0]['name'], symbol, price, psize, False, comments)
+
+                    self.context.logger.info("-- 资金账号 {0} 发出委托买入 {1} {2} 股，委托价为 {3}",
+                                             self.account[0]['name'], symbol, psize, price)
 
     def handle_order(self, event_order):
         """针对委托单状态变动的响应"""
-        self.context.logger.info('-- {0} 的委托单 {1} 当前状态是 {2}'.format(event_order.data.symbol,
-                                                                    event_order.data.order_id,
-                                                                    event_order.data.status))
+        self.context.logger.info('-- {0} 的委托单 {1} 当前状态是 {2}', event_order.data.symbol,
+                                 event_order.data.order_id, event_order.data.status)
 
     def handle_trade(self, event_trade):
         """成交后立即添加止损止盈"""
-        self.context.logger.info('-- {0} 的委托单 {1} 已成交，如有必要请立即添加止损止盈'.format(event_trade.data.symbol,
-                                                                            event_trade.data.order_id))
+        self.context.logger.info('-- {0} 的委托单 {1} 已成交，如有必要请立即添加止损止盈', event_trade.data.symbol,
+                                 event_trade.data.order_id)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+日线行情读取耗时对比：GetSqliteData（不使用缓存） vs GetArrowData（按年分区的 parquet 文件）
+parquet 文件不存在时先由 sqlite 导出
+"""
+from os import path
+from time import perf_counter
+
+import numpy as np
+
+from core.const import Interval, SqliteDbName
+from data_center.data_to_arrow import sqlite_to_arrow
+from data_center.get_data import GetSqliteData, GetArrowData, sqlite_config, arrow_config
+
+start, end = 20160104, 20170901
+n_symbol = 300
+benchmark = '000300.SH'
+fields = ['open', 'high', 'low', 'close', 'volume']
+repeat = 3
+
+
+def timeit(func):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = perf_counter()
+        result = func()
+        best = min(best, perf_counter() - t0)
+    return best, result
+
+
+if __name__ == '__main__':
+    if not path.exists(arrow_config['arrow_path'] + 'ASHAREEODPRICES'):
+        t0 = perf_counter()
+        sqlite_to_arrow(sqlite_config['db_path'] + SqliteDbName.DB.value, arrow_config['arrow_path'])
+        print('导出 parquet 文件耗时 {0:.2f} 秒'.format(perf_counter() - t0))
+
+    sqlite_data = GetSqliteData(use_cache=False)
+    arrow_data = GetArrowData()
+    sql = 'select distinct s_info_windcode from ASHAREEODPRICES limit {0}'.format(n_symbol)
+    symbols = [row[0] for row in sqlite_data.conn.execute(sql)] + [benchmark]
+
+    t_sqlite, store_sqlite = timeit(lambda: sqlite_data.get_all_market_data(symbols, fields, start, end,
+                                                                            Interval.DAILY))
+    t_arrow, store_arrow = timeit(lambda: arrow_data.get_all_market_data(symbols, fields, start, end,
+                                                                         Interval.DAILY))
+
+    same = store_sqlite.symbols == store_arrow.symbols and \
+        np.array_equal(store_sqlite.dates, store_arrow.dates) and \
+        np.array_equal(store_sqlite.values, store_arrow.values, equal_nan=True)
+    print('\n{0} 个代码，{1} - {2}，{3} 条记录'.format(len(symbols), start, end, int(store_sqlite.valid.sum())))
+    print('  sqlite  {0:8.4f}s'.format(t_sqlite))
+    print('  arrow   {0:8.4f}s  x{1:.1f}'.format(t_arrow, t_sqlite / max(t_arrow, 1e-9)))
+    print('  结果一致: {0}'.format(same))
+    print('  end timestamp: sqlite {0}, arrow {1}'.format(sqlite_data.get_end_timestamp(benchmark),
+                                                          arrow_data.get_end_timestamp(benchmark)))
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+日志写入开销对比：原先每条日志都新建、关闭 RotatingFileHandler vs 常驻句柄 + 队列后台线程 + 批量写入
+只比较写文件（console=False），另比较级别未开启时的调用开销
+"""
+import logging
+from logging.handlers import RotatingFileHandler
+from os import path
+from tempfile import mkdtemp
+from time import perf_counter
+
+from core.utility import ColorLogger
+
+n = 20000
+
+
+class LegacyColorLogger(object):
+    """原先的写法：每条日志新建文件句柄，写完后移除并关闭"""
+
+    def __init__(self, log_name):
+        self.logName = log_name
+        self.logger = logging.getLogger('LegacyColorLogger')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.formatter = logging.Formatter('[%(asctime)s] [%(levelname)s]- %(message)s')
+
+    def info(self, message):
+        fh = RotatingFileHandler(filename=self.logName, mode='a', maxBytes=1024 * 1024 * 5, backupCount=5,
+                                 encoding='utf-8')
+        fh.setLevel(logging.DEBUG)
+        fh.setFormatter(self.formatter)
+        self.logger.addHandler(fh)
+        self.logger.info(message)
+        self.logger.removeHandler(fh)
+        fh.close()
+
+
+if __name__ == '__main__':
+    log_dir = mkdtemp()
+    args = ('000001.SZ', 'order_000001', '20190102', 10.5)
+
+    legacy = LegacyColorLogger(path.join(log_dir, 'legacy.log'))
+    t0 = perf_counter()
+    for _ in range(n):
+        legacy.info('-- {0} 的委托单 {1} 于 {2} 成交，成交价为 {3}'.format(*args))
+    t_legacy = perf_counter() - t0
+
+    logger = ColorLogger(path.join(log_dir, 'queue.log'), console=False)
+    t0 = perf_counter()
+    for _ in range(n):
+        logger.info('-- {0} 的委托单 {1} 于 {2} 成交，成交价为 {3}', *args)
+    t_enqueue = perf_counter() - t0
+    logger.close()
+    t_queue = perf_counter() - t0
+
+    logger = ColorLogger(path.join(log_dir, 'disabled.log'), level='WARNING', console=False)
+    t0 = perf_counter()
+    for _ in range(n):
+        logger.info('-- {0} 的委托单 {1} 于 {2} 成交，成交价为 {3}', *args)
+    t_disabled = perf_counter() - t0
+    logger.close()
+
+    print('{0} 条日志'.format(n))
+    print('每条新建句柄:        {0:.3f} s, {1:.0f} 条/秒'.format(t_legacy, n / t_legacy))
+    print('队列 (调用线程耗时): {0:.3f} s, {1:.0f} 条/秒'.format(t_enqueue, n / t_enqueue))
+    print('队列 (含写完文件):   {0:.3f} s, {1:.0f} 条/秒'.format(t_queue, n / t_queue))
+    print('级别未开启:          {0:.3f} s, {1:.0f} 条/秒'.format(t_disabled, n / t_disabled))
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+事件分发吞吐量对比：EventManager（queue.Queue，队列为空时抛出 Empty） vs BacktestEventManager（deque，返回 None）
+模拟回测主循环：每根 bar 放入一个 BAR 事件，处理 BAR 事件时再放入若干委托、成交事件，队列处理完再推送下一根 bar
+"""
+from queue import Empty
+from time import perf_counter
+
+from core.const import Event
+from core.event import MakeEvent
+from engine.event_manager import EventManager, BacktestEventManager
+
+n_bar = 200000
+n_order_per_bar = 3     # 每根 bar 产生的委托事件数，每个委托再产生一个成交事件
+repeat = 3
+
+
+def make_engine(cls):
+    engine = cls()
+    counter = {'n': 0}
+
+    def on_bar(event):
+        counter['n'] += 1
+        for _ in range(n_order_per_bar):
+            engine.put(MakeEvent(Event.ORDER, event.dt))
+
+    def on_order(event):
+        counter['n'] += 1
+        engine.put(MakeEvent(Event.TRADE, event.dt))
+
+    def on_trade(event):
+        counter['n'] += 1
+
+    def on_portfolio(event):
+        counter['n'] += 1
+
+    engine.register(Event.BAR, on_bar)
+    engine.register(Event.ORDER, on_order)
+    engine.register(Event.TRADE, on_trade)
+    engine.register(Event.PORTFOLIO, on_portfolio)
+    return engine, counter
+
+
+def run_queue(engine):
+    bar_iter = iter(range(n_bar))
+    while True:
+        try:
+            cur_event = engine.get()
+        except Empty:
+            try:
+                engine.put(MakeEvent(Event.BAR, str(next(bar_iter))))
+            except StopIteration:
+                break
+        else:
+            engine.event_process(cur_event)
+
+
+def run_deque(engine):
+    bar_iter = iter(range(n_bar))
+    while True:
+        cur_event = engine.get()
+        if cur_event is not None:
+            engine.event_process(cur_event)
+            continue
+        bar = next(bar_iter, None)
+        if bar is None:
+            break
+        engine.put(MakeEvent(Event.BAR, str(bar)))
+
+
+def timeit(cls, run):
+    best = float('inf')
+    n_event = 0
+    for _ in range(repeat):
+        engine, counter = make_engine(cls)
+        t0 = perf_counter()
+        run(engine)
+        best = min(best, perf_counter() - t0)
+        n_event = counter['n']
+    return best, n_event
+
+
+if __name__ == '__main__':
+    t_queue, n_queue = timeit(EventManager, run_queue)
+    t_deque, n_deque = timeit(BacktestEventManager, run_deque)
+    print('\n{0} 根 bar，共处理 {1} 个事件'.format(n_bar, n_queue))
+    print('  EventManager          {0:8.3f}s  {1:12,.0f} 事件/秒'.format(t_queue, n_queue / t_queue))
+    print('  BacktestEventManager  {0:8.3f}s  {1:12,.0f} 事件/秒  x{2:.1f}'.format(t_deque, n_deque / t_deque,
+                                                                               t_queue / t_deque))
+    print('  事件数一致: {0}'.format(n_queue == n_deque))
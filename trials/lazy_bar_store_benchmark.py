@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+两级行情数据的内存与取数耗时：GetSqliteData.get_all_market_data（全部字段常驻） vs get_lazy_market_data
+模拟回测中的用法：每根 bar 取全部代码的收盘价，少数代码（有委托的）取开、高、低价
+"""
+from time import perf_counter
+
+import numpy as np
+
+from core.const import Interval
+from data_center.get_data import GetSqliteData
+
+start, end = 20160104, 20170901
+n_symbol = 300
+n_traded = 10           # 每根 bar 取开、高、低价的代码数
+benchmark = '000300.SH'
+fields = ['open', 'high', 'low', 'close', 'volume']
+
+
+def replay(store, symbols):
+    t0 = perf_counter()
+    for di, date in enumerate(store.dates.tolist()):
+        store.cross_section(['close'], symbols, date)
+        traded = symbols[di % len(symbols):di % len(symbols) + n_traded]
+        store.cross_section(['open', 'high', 'low'], traded, date)
+    return perf_counter() - t0
+
+
+if __name__ == '__main__':
+    get_data = GetSqliteData(use_cache=False)
+    sql = 'select distinct s_info_windcode from ASHAREEODPRICES limit {0}'.format(n_symbol)
+    symbols = [row[0] for row in get_data.conn.execute(sql)] + [benchmark]
+
+    t0 = perf_counter()
+    dense = get_data.get_all_market_data(symbols, fields, start, end, Interval.DAILY).mask_invalid('volume')
+    t_dense_load = perf_counter() - t0
+    t0 = perf_counter()
+    lazy = get_data.get_lazy_market_data(symbols, fields, start, end, block_size=60, max_blocks=64)
+    lazy.mask_invalid('volume')
+    t_lazy_load = perf_counter() - t0
+
+    t_dense = replay(dense, symbols)
+    t_lazy = replay(lazy, symbols)
+
+    same = all(np.array_equal(dense.panel(fd)[1], lazy.panel(fd)[1], equal_nan=True) for fd in fields)
+    print('\n{0} 个代码，{1} - {2}，{3} 个交易日'.format(len(symbols), start, end, len(dense.dates)))
+    print('  常驻数组      全部字段 {0:8.2f} MB   两级 {1:8.2f} MB'.format(dense.values.nbytes / 2 ** 20,
+                                                                   lazy.values.nbytes / 2 ** 20))
+    print('  读取          全部字段 {0:8.4f}s   两级 {1:8.4f}s'.format(t_dense_load, t_lazy_load))
+    print('  逐 bar 取数   全部字段 {0:8.4f}s   两级 {1:8.4f}s'.format(t_dense, t_lazy))
+    print('  块缓存命中 {0}，读取 {1}'.format(lazy.hits, lazy.misses))
+    print('  结果一致: {0}'.format(same))
+    lazy.close()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+分钟行情分区存储的回放吞吐量：随机生成 n_symbol 个代码 n_day 个交易日的分钟 bar 写入临时目录，
+测量 MinuteBarStore.replay 按时间归并全部代码的速度（bar/秒），以及再按 timetag 分组的速度
+"""
+import tempfile
+from time import perf_counter
+
+import numpy as np
+
+from data_center.minute_bar_store import MinuteBarStore, empty_bars, group_by_timetag
+
+n_symbol = 300
+n_day = 40
+chunk_size = 65536
+
+
+def trading_minutes():
+    """A 股一个交易日的 240 个分钟 timetag 后四位（HHMM）"""
+    am = [h * 100 + m for h in (9, 10, 11) for m in range(60) if 930 <= h * 100 + m < 1130]
+    pm = [h * 100 + m for h in (13, 14) for m in range(60)]
+    return np.array(am + pm, dtype=np.int64)
+
+
+def make_store(root_path):
+    store = MinuteBarStore(root_path, chunk_size)
+    rng = np.random.default_rng(0)
+    days = np.array([20190000 + m * 100 + d for m in (1, 2, 3) for d in range(1, 29)], dtype=np.int64)[:n_day]
+    timetag = (days[:, None] * 10000 + trading_minutes()[None, :]).ravel()
+    symbols = ['{0:06d}.SZ'.format(i) for i in range(n_symbol)]
+    for symbol in symbols:
+        # 随机去掉 5% 的分钟，模拟停牌、无成交
+        tt = timetag[rng.random(len(timetag)) > 0.05]
+        bars = empty_bars(len(tt))
+        bars['timetag'] = tt
+        close = 10 + np.cumsum(rng.normal(0, 0.01, len(tt)))
+        bars['open'] = close
+        bars['high'] = close + 0.01
+        bars['low'] = close - 0.01
+        bars['close'] = close
+        bars['volume'] = rng.integers(100, 10000, len(tt))
+        store.write(symbol, bars)
+    return store, symbols
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as root_path:
+        t0 = perf_counter()
+        store, symbols = make_store(root_path)
+        print('写入 {0} 个代码 {1} 个交易日的分钟数据，耗时 {2:.2f} 秒'.format(n_symbol, n_day, perf_counter() - t0))
+
+        t0 = perf_counter()
+        n_bar = 0
+        last = 0
+        ordered = True
+        for chunk in store.replay(symbols):
+            n_bar += len(chunk)
+            ordered &= bool(chunk['timetag'][0] >= last)
+            last = chunk['timetag'][-1]
+        t_replay = perf_counter() - t0
+
+        t0 = perf_counter()
+        n_minute = sum(1 for _ in group_by_timetag(store.replay(symbols)))
+        t_group = perf_counter() - t0
+
+        print('\n{0} 条分钟 bar，{1} 个分钟'.format(n_bar, n_minute))
+        print('  归并回放          {0:8.3f}s  {1:12,.0f} bar/秒'.format(t_replay, n_bar / t_replay))
+        print('  归并并按分钟分组  {0:8.3f}s  {1:12,.0f} bar/秒'.format(t_group, n_bar / t_group))
+        print('  时间有序: {0}'.format(ordered))
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+委托、成交、持仓、资金记录对象的开销对比：原先带 __dict__ 的 dataclass / 普通类 + deepcopy vs __slots__ 类 + copy()
+分别比较创建、复制、属性读写的耗时，以及每个对象占用的内存
+"""
+from copy import deepcopy
+from dataclasses import dataclass
+from time import perf_counter
+import tracemalloc
+
+from core.const import Direction, Offset, Status, Exchange, Product
+from core.object import OrderData, TradeData, PositionData, AccountData
+
+n = 100000
+repeat = 3
+
+
+# 原先的定义（带 __dict__），用于对比
+class LegacyOrderData(object):
+    def __init__(self, symbol=None, exchange=None, order_id=None, order_type=None, direction=None, offset=None,
+                 price=None, filled_price=None, order_volume=None, filled_volume=None, status=None, account=None,
+                 gateway=None, order_datetime=None, comments=None, symbol_type=None):
+        self.symbol = symbol
+        self.exchange = exchange
+        self.order_id = order_id
+        self.order_type = order_type
+        self.direction = direction
+        self.offset = offset
+        self.price = price
+        self.filled_price = filled_price
+        self.order_volume = order_volume
+        self.filled_volume = filled_volume
+        self.status = status
+        self.order_datetime = order_datetime
+        self.cancel_datetime = None
+        self.filled_datetime = None
+        self.comments = comments
+        self.gateway = gateway
+        self.account = account
+        self.symbol_type = symbol_type
+        self.front_id = ''
+        self.session_id = ''
+
+
+@dataclass
+class LegacyTradeData:
+    gateway: str = ''
+    symbol: str = ''
+    exchange: str = Exchange.SSE
+    order_id: str = ''
+    trade_id: str = ''
+    direction: str = None
+    offset: str = None
+    order_price: float = 0.0
+    price: float = 0.0
+    volume: float = 0.0
+    datetime: str = None
+    multiplier: int = 0
+    price_tick: float = 0.0
+    margin: float = 0.0
+    slippage: float = 0.0
+    commission: float = 0.0
+    comments: str = ''
+    account: str = ''
+    frozen: int = 0
+    symbol_type: str = ''
+
+
+@dataclass
+class LegacyPositionData:
+    gateway: str = ''
+    symbol: str = ''
+    exchange: str = Exchange.SSE
+    account: str = ''
+    trade_id: str = ''
+    order_id: str = ''
+    datetime: str = None
+    direction: str = None
+    offset: str = None
+    init_volume: float = 0.0
+    volume: float = 0.0
+    frozen: float = 0.0
+    init_price: float = 0.0
+    price: float = 0.0
+    position_pnl: float = 0.0
+    position_value: float = 0.0
+    position_value_pre: float = 0.0
+    yd_volume: float = 0.0
+    multiplier: int = 0
+    price_tick: float = 0.0
+    margin: float = 0.0
+    symbol_type: str = ''
+
+
+@dataclass
+class LegacyAccountData:
+    gateway: str = ''
+    account_id: str = ''
+    pre_balance: float = 0.0
+    total_balance: float = 0.0
+    holding: float = 0.0
+    frozen: float = 0.0
+    available: float = 0.0
+
+
+order_kwargs = dict(symbol='000001.SZ', exchange=Exchange.SZSE, order_id='order_000001', direction=Direction.LONG,
+                    offset=Offset.OPEN, price=10.5, order_volume=100, status=Status.NOT_TRADED, account='acc0',
+                    gateway='ctp', order_datetime='20190102', comments='', symbol_type=Product.STOCK_SZ)
+trade_kwargs = dict(symbol='000001.SZ', order_id='order_000001', trade_id='filled_000001', direction=Direction.LONG,
+                    offset=Offset.OPEN, price=10.5, volume=100, datetime='20190102', account='acc0')
+position_kwargs = dict(symbol='000001.SZ', account='acc0', direction=Direction.LONG, volume=100, price=10.5)
+account_kwargs = dict(account_id='acc0', total_balance=200000.0, available=200000.0)
+
+
+def best_time(func):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = perf_counter()
+        func()
+        best = min(best, perf_counter() - t0)
+    return best
+
+
+def bytes_per_object(cls, kwargs):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objs = [cls(**kwargs) for _ in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objs
+    return (after - before) / n
+
+
+def run_case(name, cls, kwargs, attr, copy_func):
+    obj = cls(**kwargs)
+    t_new = best_time(lambda: [cls(**kwargs) for _ in range(n)])
+    t_copy = best_time(lambda: [copy_func(obj) for _ in range(n)])
+
+    def access():
+        for _ in range(n):
+            setattr(obj, attr, getattr(obj, attr) + 0.01)
+
+    t_access = best_time(access)
+    return name, t_new, t_copy, t_access, bytes_per_object(cls, kwargs)
+
+
+if __name__ == '__main__':
+    cases = [
+        ('OrderData', (LegacyOrderData, OrderData), order_kwargs, 'price'),
+        ('TradeData', (LegacyTradeData, TradeData), trade_kwargs, 'price'),
+        ('PositionData', (LegacyPositionData, PositionData), position_kwargs, 'price'),
+        ('AccountData', (LegacyAccountData, AccountData), account_kwargs, 'available'),
+    ]
+    print('{0} 个对象，取 {1} 次中最快的一次'.format(n, repeat))
+    print('{0:<14}{1:<8}{2:>10}{3:>10}{4:>10}{5:>12}'.format('record', 'version', 'new(s)', 'copy(s)', 'attr(s)',
+                                                             'bytes/obj'))
+    for name, (legacy_cls, slots_cls), kwargs, attr in cases:
+        before = run_case(name, legacy_cls, kwargs, attr, deepcopy)
+        after = run_case(name, slots_cls, kwargs, attr, lambda o: o.copy())
+        for version, result in [('before', before), ('after', after)]:
+            print('{0:<14}{1:<8}{2:>10.4f}{3:>10.4f}{4:>10.4f}{5:>12.0f}'.format(name, version, *result[1:]))
+        print('{0:<14}{1:<8}{2:>9.1f}x{3:>9.1f}x{4:>9.1f}x{5:>11.1f}x'.format(
+            '', 'ratio', before[1] / after[1], before[2] / after[2], before[3] / after[3], before[4] / after[4]))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+TimeSeriesContainer 更新开销对比：原先每根 bar 六个数组整体左移一位 vs 环形缓冲区只写两列
+300 个代码、窗口 500，逐 bar 更新 1000 根；另比较 update_bars 一次写入整段历史
+"""
+from time import perf_counter
+
+import numpy as np
+
+from core.object import BarData
+from core.utility import TimeSeriesContainer
+
+n_symbol = 300
+size = 500
+n_bar = 1000
+
+
+class LegacyTimeSeriesContainer(object):
+    """原先的写法：每根 bar 六个数组整体左移一位"""
+
+    def __init__(self, size: int = 10):
+        self.count = 0
+        self.size = size
+        self.inited = False
+        self.open_array = np.zeros(size)
+        self.high_array = np.zeros(size)
+        self.low_array = np.zeros(size)
+        self.close_array = np.zeros(size)
+        self.volume_array = np.zeros(size)
+        self.open_interest_array = np.zeros(size)
+
+    def update_bar(self, bar: BarData) -> None:
+        self.count += 1
+        if not self.inited and self.count >= self.size:
+            self.inited = True
+
+        self.open_array[:-1] = self.open_array[1:]
+        self.high_array[:-1] = self.high_array[1:]
+        self.low_array[:-1] = self.low_array[1:]
+        self.close_array[:-1] = self.close_array[1:]
+        self.volume_array[:-1] = self.volume_array[1:]
+        self.open_interest_array[:-1] = self.open_interest_array[1:]
+
+        self.open_array[-1] = bar.open
+        self.high_array[-1] = bar.high
+        self.low_array[-1] = bar.low
+        self.close_array[-1] = bar.close
+        self.volume_array[-1] = bar.volume
+        self.open_interest_array[-1] = bar.open_interest
+
+
+def run(container_class):
+    containers = [container_class(size) for _ in range(n_symbol)]
+    t0 = perf_counter()
+    for bar in bars:
+        for container in containers:
+            container.update_bar(bar)
+    return perf_counter() - t0
+
+
+if __name__ == '__main__':
+    prices = 10 + np.cumsum(np.random.normal(0, 0.1, n_bar))
+    bars = [BarData(gateway='', open=p, high=p + 0.1, low=p - 0.1, close=p, volume=1000.0, open_interest=0.0)
+            for p in prices]
+
+    t_legacy = run(LegacyTimeSeriesContainer)
+    t_ring = run(TimeSeriesContainer)
+
+    containers = [TimeSeriesContainer(size) for _ in range(n_symbol)]
+    t0 = perf_counter()
+    for container in containers:
+        container.update_bars(bars)
+    t_batch = perf_counter() - t0
+
+    total = n_symbol * n_bar
+    print('{0} 个代码 × {1} 根 bar，窗口 {2}'.format(n_symbol, n_bar, size))
+    print('整体左移:     {0:.3f} s, {1:.2f} us/bar'.format(t_legacy, t_legacy / total * 1e6))
+    print('环形缓冲区:   {0:.3f} s, {1:.2f} us/bar'.format(t_ring, t_ring / total * 1e6))
+    print('update_bars:  {0:.3f} s, {1:.2f} us/bar'.format(t_batch, t_batch / total * 1e6))
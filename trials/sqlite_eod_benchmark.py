@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+日线行情表的查询耗时对比：原始建表方式 vs typed 建表（INTEGER 日期、REAL 价格、覆盖索引、WAL、ANALYZE）
+在数据库的副本上运行，不改动原数据库
+"""
+import sqlite3
+from os import path
+from shutil import copyfile
+from tempfile import mkdtemp
+from time import perf_counter
+
+from data_center.data_to_sqlite import convert_to_typed_table, set_pragmas
+
+db_file = 'D:/python projects/quandomo/data_center/data/quandomo_data.db'
+start, end = 20160104, 20170901
+n_symbol = 300
+repeat = 3
+fields = 's_dq_open,s_dq_high,s_dq_low,s_dq_close,s_dq_volume,s_info_windcode,trade_dt'
+
+
+def timeit(func):
+    best = float('inf')
+    rows = 0
+    for _ in range(repeat):
+        t0 = perf_counter()
+        rows = func()
+        best = min(best, perf_counter() - t0)
+    return best, rows
+
+
+def run_queries(cx, table_name, symbols):
+    def per_symbol():
+        rows = 0
+        for symbol in symbols:
+            sql = 'select {0} from {1} where s_info_windcode="{2}" and trade_dt>={3} and trade_dt<={4}'.format(
+                fields, table_name, symbol, start, end)
+            rows += len(cx.execute(sql).fetchall())
+        return rows
+
+    def in_list():
+        sql = 'select {0} from {1} where s_info_windcode in ({2}) and trade_dt>=? and trade_dt<=?'.format(
+            fields, table_name, ','.join(['?'] * len(symbols)))
+        return len(cx.execute(sql, symbols + [start, end]).fetchall())
+
+    def cross_section():
+        sql = 'select {0} from {1} where trade_dt=?'.format(fields, table_name)
+        return len(cx.execute(sql, [end]).fetchall())
+
+    results = {}
+    for name, func in [('per_symbol', per_symbol), ('in_list', in_list), ('cross_section', cross_section)]:
+        results[name] = timeit(func)
+    plan = cx.execute('explain query plan select {0} from {1} where s_info_windcode=? and trade_dt>=? '
+                      'and trade_dt<=?'.format(fields, table_name), [symbols[0], start, end]).fetchall()
+    return results, plan
+
+
+if __name__ == '__main__':
+    work_file = path.join(mkdtemp(), 'eod_benchmark.db')
+    copyfile(db_file, work_file)
+    cx = sqlite3.connect(work_file)
+
+    tables = {}
+    for table_name in ['ASHAREEODPRICES', 'AINDEXEODPRICES']:
+        sql = 'select distinct s_info_windcode from {0} limit {1}'.format(table_name, n_symbol)
+        tables[table_name] = [row[0] for row in cx.execute(sql)]
+
+    before = {t: run_queries(cx, t, s) for t, s in tables.items()}
+
+    set_pragmas(cx)
+    for table_name in tables:
+        t0 = perf_counter()
+        convert_to_typed_table(cx, table_name)
+        print('{0} 转换为 typed 表并建索引，耗时 {1:.2f} 秒'.format(table_name, perf_counter() - t0))
+
+    after = {t: run_queries(cx, t, s) for t, s in tables.items()}
+
+    for table_name in tables:
+        print('\n{0}（{1} 个代码，{2} - {3}）'.format(table_name, len(tables[table_name]), start, end))
+        for query in before[table_name][0]:
+            t_before, rows = before[table_name][0][query]
+            t_after, _ = after[table_name][0][query]
+            print('  {0:<14} {1:>8} 行  before {2:8.4f}s  after {3:8.4f}s  x{4:.1f}'.format(
+                query, rows, t_before, t_after, t_before / max(t_after, 1e-9)))
+        print('  query plan before: {0}'.format([row[-1] for row in before[table_name][1]]))
+        print('  query plan after:  {0}'.format([row[-1] for row in after[table_name][1]]))
+    cx.close()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+TimeSeriesContainer 每根 bar 取最新指标值的开销：TA-Lib 对整个窗口重算 vs 增量指标
+窗口越长，TA-Lib 重算越慢，增量指标的开销不随窗口长度变化；同时打印两者最新值的差
+"""
+from time import perf_counter
+
+import numpy as np
+
+from core.object import BarData
+from core.utility import TimeSeriesContainer
+
+n_bar = 2000
+window_sizes = [100, 500, 2000]
+
+
+def full_window(tsc):
+    """原先的取值方式：array=True 得到整个窗口的结果再取最后一个"""
+    mid = tsc.sma(20, array=True)[-1]
+    std = tsc.std(20, array=True)[-1]
+    return (tsc.sma(20, array=True)[-1], tsc.ema(20, array=True)[-1], tsc.std(20, array=True)[-1],
+            tsc.atr(14, array=True)[-1], tsc.rsi(14, array=True)[-1], tsc.macd(12, 26, 9, array=True)[0][-1],
+            mid + 2 * std)
+
+
+def streaming(tsc):
+    return (tsc.sma(20), tsc.ema(20), tsc.std(20), tsc.atr(14), tsc.rsi(14), tsc.macd(12, 26, 9)[0],
+            tsc.boll(20, 2)[0])
+
+
+def run(size, get_values):
+    tsc = TimeSeriesContainer(size)
+    tsc.update_bars(bars[:size])
+    t0 = perf_counter()
+    for bar in bars[size:]:
+        tsc.update_bar(bar)
+        values = get_values(tsc)
+    return (perf_counter() - t0) / (len(bars) - size), values
+
+
+if __name__ == '__main__':
+    prices = 10 + np.cumsum(np.random.normal(0, 0.1, n_bar + max(window_sizes)))
+    bars = [BarData(gateway='', open=p, high=p + 0.1, low=p - 0.1, close=p, volume=1000.0, open_interest=0.0)
+            for p in prices]
+
+    names = ['sma', 'ema', 'std', 'atr', 'rsi', 'macd', 'boll_up']
+    for size in window_sizes:
+        t_talib, talib_values = run(size, full_window)
+        t_stream, stream_values = run(size, streaming)
+        print('窗口 {0}: TA-Lib {1:.1f} us/bar, 增量 {2:.1f} us/bar'.format(size, t_talib * 1e6, t_stream * 1e6))
+        print('    最新值之差: ' + ', '.join('{0}={1:.2e}'.format(name, abs(a - b))
+                                       for name, a, b in zip(names, talib_values, stream_values)))